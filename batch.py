@@ -0,0 +1,182 @@
+"""
+Пакетная обработка выгрузок из командной строки, без веб-сервера.
+
+Принимает один файл, несколько файлов или папки (берутся *.xlsx внутри),
+обрабатывает их параллельно тем же конвейером, что и веб-форма
+(mp_v6.process_file), и пишет отчёты в папку результатов. Файлы прогона
+делят кэш поиска товаров и ограничитель запросов к API (mp_v6.configure_batch),
+поэтому общий артикул ищется один раз, а параллельные файлы вместе не
+превышают лимит МойСклад.
+
+pandas, openpyxl и Flask импортируются только при запуске обработки,
+поэтому --help и разбор аргументов работают мгновенно.
+
+Запуск:
+    python batch.py orders_64938.xlsx orders_64939.xlsx -o reports
+    python batch.py exports/ -o reports --jobs 4
+    python batch.py exports/ --wave         # все файлы одной волной (process_wave)
+    python batch.py exports/ --format csv --format parquet   # без оформленного xlsx
+"""
+
+import argparse
+import contextlib
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def collect_inputs(paths, pattern="*.xlsx"):
+    """
+    Разворачивает аргументы командной строки в список файлов.
+
+    Args:
+        paths (list): Файлы и папки
+        pattern (str): Шаблон имён файлов внутри папок
+
+    Returns:
+        list: Пути к файлам без повторов; временные файлы Excel (~$...) пропускаются
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, pattern))))
+        else:
+            files.append(path)
+    files = [f for f in files if not os.path.basename(f).startswith("~$")]
+    return list(dict.fromkeys(os.path.abspath(f) for f in files))
+
+
+def output_path_for(input_path, output_dir):
+    """Путь к отчёту для входного файла: <папка>/<имя>_result.xlsx."""
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"{stem}_result.xlsx")
+
+
+def run_batch(inputs, output_dir, jobs=2, wave=False, store_ids=None, log=sys.stdout, formats=None):
+    """
+    Обрабатывает файлы и возвращает итоги по каждому.
+
+    Args:
+        inputs (list): Пути к входным файлам
+        output_dir (str): Папка для отчётов
+        jobs (int): Сколько файлов обрабатывается одновременно
+        wave (bool): Обработать все файлы одной волной (process_wave)
+        store_ids (list): Склады для поиска остатков (по умолчанию mp_v6.STORE_IDS)
+        log: Поток для строк о завершении файлов
+        formats (list): Форматы отчётов (по умолчанию mp_v6.OUTPUT_FORMATS)
+
+    Returns:
+        list: Итоги [{'input', 'output', 'status', 'ok', 'seconds', 'phases'}, ...]
+    """
+    import mp_v6
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    def finish(session_id, input_path, output_path, started):
+        status = mp_v6.progress.get(session_id, '')
+        result = {
+            'input': input_path,
+            'output': output_path,
+            'status': status.replace(f"[{session_id}] ", ""),
+            'ok': 'завершена успешно' in status.lower(),
+            'seconds': time.perf_counter() - started,
+            'phases': mp_v6.phase_timings.get(session_id, {}),
+        }
+        mark = "OK " if result['ok'] else "ERR"
+        print(f"{mark} {os.path.basename(input_path)} -> {output_path} ({result['seconds']:.1f} с)",
+              file=log, flush=True)
+        return result
+
+    if wave:
+        session_id = "batch_wave"
+        output_path = os.path.join(output_dir, "wave_result.xlsx")
+        started = time.perf_counter()
+        mp_v6.process_wave([(path, os.path.basename(path)) for path in inputs], output_path,
+                           session_id, store_ids=store_ids, clean_results=False, formats=formats)
+        return [finish(session_id, ", ".join(os.path.basename(p) for p in inputs), output_path, started)]
+
+    def run_one(n, input_path):
+        session_id = f"batch_{n}"
+        output_path = output_path_for(input_path, output_dir)
+        started = time.perf_counter()
+        mp_v6.process_file(input_path, output_path, session_id, store_ids=store_ids, clean_results=False,
+                           formats=formats)
+        return finish(session_id, input_path, output_path, started)
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        return list(executor.map(run_one, range(1, len(inputs) + 1), inputs))
+
+
+def print_summary(results, elapsed, api_calls, limiter_wait, out=sys.stdout):
+    """Печатает сводку по времени: файлы, этапы, запросы к API."""
+    ok = sum(1 for r in results if r['ok'])
+    print("", file=out)
+    print(f"Файлов: {len(results)}, успешно: {ok}, с ошибкой: {len(results) - ok}", file=out)
+    print(f"Общее время: {elapsed:.1f} с, запросов к API: {int(api_calls)}, "
+          f"ожидание лимита API: {limiter_wait:.1f} с", file=out)
+
+    phases = {}
+    for r in results:
+        for phase, seconds in r['phases'].items():
+            phases[phase] = phases.get(phase, 0.0) + seconds
+    if phases:
+        print("Время этапов (сумма по файлам):", file=out)
+        for phase, seconds in phases.items():
+            print(f"  {phase:<12} {seconds:8.2f} с", file=out)
+
+    for r in results:
+        if not r['ok']:
+            print(f"Ошибка {os.path.basename(r['input'])}: {r['status']}", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tocka Marketplace: пакетная обработка выгрузок")
+    parser.add_argument("paths", nargs="+", help="Файлы .xlsx или папки с ними")
+    parser.add_argument("-o", "--output-dir", default="batch_results", help="Папка для отчётов")
+    parser.add_argument("-j", "--jobs", type=int, default=2, help="Файлов одновременно")
+    parser.add_argument("--pattern", default="*.xlsx", help="Шаблон файлов внутри папок")
+    parser.add_argument("--wave", action="store_true", help="Обработать все файлы одной волной")
+    parser.add_argument("--store", action="append", dest="store_ids",
+                        help="UUID склада (можно несколько; по умолчанию MOYSKLAD_STORE_IDS)")
+    parser.add_argument("--format", action="append", dest="formats",
+                        choices=("xlsx", "csv", "json", "parquet"),
+                        help="Формат отчёта (можно несколько; по умолчанию TOCKA_OUTPUT_FORMATS или xlsx)")
+    parser.add_argument("--api-rate", type=int, default=45, help="Запросов к API за окно (0 - без ограничения)")
+    parser.add_argument("--api-window", type=float, default=3.0, help="Окно ограничения запросов, с")
+    parser.add_argument("--api-parallel", type=int, default=5, help="Одновременных запросов к API")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Показывать построчный лог обработки")
+    args = parser.parse_args(argv)
+
+    inputs = collect_inputs(args.paths, args.pattern)
+    if not inputs:
+        print("Нет файлов для обработки", file=sys.stderr)
+        return 2
+
+    out = sys.stdout
+    print(f"Файлов: {len(inputs)}, параллельно: {1 if args.wave else args.jobs}, отчёты: {args.output_dir}",
+          file=out, flush=True)
+
+    started = time.perf_counter()
+    import metrics
+    import mp_v6
+    limiter = mp_v6.configure_batch(args.api_rate, args.api_window, args.api_parallel)
+
+    # Построчный лог конвейера рассчитан на веб-сервер; в пакетном режиме выводится только итог
+    log_target = out if args.verbose else open(os.devnull, "w")
+    with contextlib.redirect_stdout(log_target):
+        try:
+            results = run_batch(inputs, args.output_dir, args.jobs, args.wave, args.store_ids, log=out,
+                                formats=args.formats)
+        finally:
+            mp_v6.shutdown_report_pool()
+
+    print_summary(results, time.perf_counter() - started,
+                  metrics.counter_total("tocka_moysklad_requests_total"),
+                  limiter.waited if limiter else 0.0, out=out)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""
+Сквозной бенчмарк обработки файлов на локальном стенде МойСклад.
+
+Генерирует синтетические выгрузки заказов нужного размера, поднимает стенд
+(fake_moysklad.py) и прогоняет настоящий конвейер process_file (и по желанию
+create_customer_order_from_file). Каждый прогон выполняется в отдельном
+процессе, чтобы пиковая память не накапливалась между размерами.
+
+Отчёт по каждому размеру: строк в секунду, запросов к API на строку,
+ответов 429, пиковая память (RSS) и время по этапам обработки.
+
+С --ingest замеряется только чтение выгрузки: каждый доступный способ
+чтения excel_reader (и CSV с теми же данными) сравнивается с pd.read_excel
+по времени и по совпадению таблицы и типов колонок; в конце выводится
+самый быстрый способ для TOCKA_EXCEL_READER.
+
+Запуск:
+    python benchmark.py --sizes 100,1000 --latency 0.02
+    python benchmark.py --sizes 100,1000,10000,50000 --rate-limit 45 --orders
+    python benchmark.py --ingest --sizes 1000,10000,50000
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from queue import Empty
+
+# Сколько ждать результата прогона, пока процесс прогона жив, прежде чем проверить его снова, с
+RESULT_POLL = 1.0
+
+def make_orders_file(path, rows, products, missing_ratio=0.02, seed=1, with_dates=False):
+    """
+    Создаёт синтетическую выгрузку заказов маркетплейса.
+
+    Args:
+        path (str): Путь к создаваемому .xlsx
+        rows (int): Количество строк
+        products (int): Размер каталога стенда (артикулы берутся из него)
+        missing_ratio (float): Доля артикулов, которых нет в каталоге
+        seed (int): Начальное значение генератора случайных чисел
+        with_dates (bool): Добавить колонку 'Дата заказа' (ячейки только с датой)
+    """
+    import pandas as pd
+    from fake_moysklad import bench_article
+
+    rnd = random.Random(seed)
+    articles = [
+        f"X{rnd.randint(0, 10**6)}" if rnd.random() < missing_ratio else bench_article(rnd.randrange(products))
+        for _ in range(rows)
+    ]
+    columns = {
+        "№ заказа": [f"{rnd.randint(10**9, 10**10)}-{rnd.randint(1000, 9999)}-{i % 3 + 1}" for i in range(rows)],
+        "№ Стикера": [str(rnd.randint(10**9, 10**10)) for _ in range(rows)],
+        "Артикул": articles,
+        "Количество": [rnd.randint(1, 3) for _ in range(rows)],
+    }
+    if with_dates:
+        first = date(2024, 1, 1)
+        columns["Дата заказа"] = [first + timedelta(days=rnd.randrange(365)) for _ in range(rows)]
+    pd.DataFrame(columns).to_excel(path, index=False)
+
+
+def _run_case(base_url, input_path, workdir, with_orders, queue):
+    """Прогоняет конвейер в отдельном процессе и возвращает метрики через queue."""
+    os.environ["MOYSKLAD_BASE_URL"] = base_url
+    os.chdir(workdir)
+    sys.stdout = open(os.devnull, "w")  # построчный лог конвейера искажает замеры
+    import mp_v6
+
+    output_path = os.path.join(workdir, "results", "result_bench.xlsx")
+
+    try:
+        started = time.perf_counter()
+        mp_v6.process_file(input_path, output_path, "bench")
+        result = {
+            "process_seconds": time.perf_counter() - started,
+            "phases": mp_v6.phase_timings.get("bench", {}),
+            "status": mp_v6.progress.get("bench", ""),
+        }
+
+        if with_orders:
+            started = time.perf_counter()
+            order = mp_v6.create_customer_order_from_file(output_path, "bench_order")
+            result["order_seconds"] = time.perf_counter() - started
+            result["order_ok"] = bool(order.get("success"))
+            result["order_phases"] = mp_v6.phase_timings.get("bench_order", {})
+    finally:
+        # Иначе дочерний процесс не завершится, ожидая воркеров пула отчётов
+        mp_v6.shutdown_report_pool()
+
+    result["peak_rss_mb"] = _peak_rss_mb()
+    queue.put(result)
+
+
+def _peak_rss_mb():
+    """Пиковая память процесса в МБ или None, если модуля resource нет (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в Linux - в килобайтах, в macOS - в байтах
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _wait_result(proc, queue):
+    """
+    Ждёт результат прогона из queue, пока процесс прогона жив.
+
+    Raises:
+        RuntimeError: Если процесс завершился, не передав результат (ошибка импорта,
+                      исключение в конвейере, падение процесса)
+    """
+    while True:
+        try:
+            return queue.get(timeout=RESULT_POLL)
+        except Empty:
+            if proc.is_alive():
+                continue
+        # Результат мог прийти между таймаутом и проверкой процесса
+        try:
+            return queue.get(timeout=RESULT_POLL)
+        except Empty:
+            raise RuntimeError(f"процесс прогона завершился без результата (код выхода {proc.exitcode})")
+
+
+def run_benchmark(sizes, fake_options, with_orders=False):
+    """
+    Прогоняет конвейер для каждого размера файла.
+
+    Args:
+        sizes (list): Размеры файлов в строках
+        fake_options (dict): Параметры стенда FakeMoySklad
+        with_orders (bool): Дополнительно замерять создание заказа
+
+    Returns:
+        list: Результаты по каждому размеру
+    """
+    from fake_moysklad import FakeMoySklad, start_server
+
+    fake = FakeMoySklad(**fake_options)
+    server, base_url = start_server(fake)
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="tocka_bench_") as workdir:
+            for size in sizes:
+                input_path = os.path.join(workdir, f"orders_{size}.xlsx")
+                make_orders_file(input_path, size, len(fake.products))
+                fake.reset_stats()
+
+                queue = ctx.Queue()
+                proc = ctx.Process(target=_run_case, args=(base_url, input_path, workdir, with_orders, queue))
+                proc.start()
+                try:
+                    result = _wait_result(proc, queue)
+                except RuntimeError as e:
+                    print(f"\n=== {size} строк ===\n  ОШИБКА: {e}", flush=True)
+                    results.append({"rows": size, "error": str(e)})
+                    continue
+                finally:
+                    proc.join()
+
+                stats = fake.stats()
+                result.update({
+                    "rows": size,
+                    "rows_per_second": size / result["process_seconds"] if result["process_seconds"] else 0.0,
+                    "api_calls": stats["total"],
+                    "api_calls_per_row": stats["total"] / size,
+                    "throttled": stats["throttled"],
+                })
+                results.append(result)
+                print_result(result)
+    finally:
+        server.shutdown()
+    return results
+
+
+def _best_time(func, repeat):
+    """Лучшее время из repeat запусков и результат последнего."""
+    best, value = None, None
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+
+def _same_frame(expected, actual):
+    return (list(expected.columns) == list(actual.columns)
+            and list(expected.dtypes) == list(actual.dtypes)
+            and expected.equals(actual))
+
+
+def run_ingest_benchmark(sizes, repeat=3):
+    """
+    Замеряет чтение выгрузок каждым доступным способом excel_reader.
+
+    Эталон - pd.read_excel; для каждого способа проверяется, что таблица
+    и типы колонок совпадают с эталоном (для dtype=None и dtype=str).
+
+    Args:
+        sizes (list): Размеры файлов в строках
+        repeat (int): Повторов на замер (берётся лучшее время)
+
+    Returns:
+        dict: {'results': [{'rows', 'reader', 'seconds', 'rows_per_second', 'same_types'}, ...],
+               'fastest': самый быстрый способ чтения Excel с совпадающими типами}
+    """
+    import pandas as pd
+    from excel_reader import available_readers, read_table
+
+    results = []
+    totals = {}
+    with tempfile.TemporaryDirectory(prefix="tocka_ingest_") as workdir:
+        for size in sizes:
+            xlsx_path = os.path.join(workdir, f"orders_{size}.xlsx")
+            csv_path = os.path.join(workdir, f"orders_{size}.csv")
+            make_orders_file(xlsx_path, size, 5000, with_dates=True)
+            expected = {dtype: pd.read_excel(xlsx_path, dtype=dtype) for dtype in (None, str)}
+            # В CSV дата - текст, и pandas её не распознаёт: CSV пишется и сравнивается без колонки дат
+            expected_csv = {dtype: frame.drop(columns=["Дата заказа"]) for dtype, frame in expected.items()}
+            expected_csv[None].to_csv(csv_path, index=False)
+
+            print(f"\n=== {size} строк ===", flush=True)
+            cases = [(reader, xlsx_path) for reader in available_readers()] + [("csv", csv_path)]
+            for reader, path in cases:
+                seconds, frame = _best_time(lambda: read_table(path, reader=reader), repeat)
+                reference = expected_csv if reader == "csv" else expected
+                same = _same_frame(reference[None], frame) and _same_frame(
+                    reference[str], read_table(path, dtype=str, reader=reader))
+                results.append({
+                    "rows": size,
+                    "reader": reader,
+                    "seconds": seconds,
+                    "rows_per_second": size / seconds if seconds else 0.0,
+                    "same_types": same,
+                })
+                if reader != "csv" and same:
+                    totals[reader] = totals.get(reader, 0.0) + seconds
+                print(f"  {reader:<9} {seconds:8.3f} с ({size / seconds:10.0f} строк/с)"
+                      f"{'' if same else '  ТИПЫ НЕ СОВПАДАЮТ'}", flush=True)
+
+    fastest = min(totals, key=totals.get) if totals else None
+    if fastest:
+        print(f"\nСамый быстрый способ чтения Excel: {fastest} (TOCKA_EXCEL_READER={fastest})", flush=True)
+    return {"results": results, "fastest": fastest}
+
+
+def print_result(result):
+    """Печатает результат одного прогона."""
+    print(f"\n=== {result['rows']} строк ===", flush=True)
+    print(f"  обработка:       {result['process_seconds']:.2f} с ({result['rows_per_second']:.1f} строк/с)")
+    print(f"  запросов к API:  {result['api_calls']} ({result['api_calls_per_row']:.2f} на строку, 429: {result['throttled']})")
+    if result['peak_rss_mb'] is not None:
+        print(f"  пиковая память:  {result['peak_rss_mb']:.1f} МБ")
+    if "order_seconds" in result:
+        print(f"  создание заказа: {result['order_seconds']:.2f} с ({'успешно' if result['order_ok'] else 'ошибка'})")
+    print("  этапы обработки:")
+    for phase, seconds in result["phases"].items():
+        print(f"    {phase:<10} {seconds:8.3f} с")
+    if result.get("order_phases"):
+        print("  этапы создания заказа:")
+        for phase, seconds in result["order_phases"].items():
+            print(f"    {phase:<10} {seconds:8.3f} с")
+    print(f"  статус: {result['status']}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк обработки файлов на локальном стенде МойСклад")
+    parser.add_argument("--sizes", default="100,1000,10000,50000", help="Размеры файлов через запятую")
+    parser.add_argument("--products", type=int, default=5000, help="Товаров в каталоге стенда")
+    parser.add_argument("--latency", type=float, default=0.02, help="Задержка ответа стенда, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, сек")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Запросов за окно (0 - без ограничения)")
+    parser.add_argument("--rate-window", type=float, default=3.0, help="Окно ограничения, сек")
+    parser.add_argument("--orders", action="store_true", help="Замерять также создание заказа")
+    parser.add_argument("--json", help="Сохранить результаты в JSON файл")
+    parser.add_argument("--ingest", action="store_true", help="Замерять только чтение выгрузки (excel_reader)")
+    parser.add_argument("--repeat", type=int, default=3, help="Повторов на замер чтения (--ingest)")
+    args = parser.parse_args()
+
+    if args.ingest:
+        bench_results = run_ingest_benchmark([int(s) for s in args.sizes.split(",") if s.strip()], args.repeat)
+    else:
+        bench_results = run_benchmark(
+            [int(s) for s in args.sizes.split(",") if s.strip()],
+            {
+                "products": args.products,
+                "latency": args.latency,
+                "jitter": args.jitter,
+                "error_429_rate": args.rate_429,
+                "rate_limit": args.rate_limit,
+                "rate_window": args.rate_window,
+            },
+            with_orders=args.orders,
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(bench_results, f, ensure_ascii=False, indent=2)
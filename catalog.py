@@ -0,0 +1,257 @@
+"""
+Локальное зеркало каталога товаров МойСклад (артикул -> id, название, тип).
+
+Без зеркала каждый новый артикул стоит запрос к /entity/assortment. Зеркало
+хранит весь ассортимент - товары, модификации, комплекты - с типом сущности
+(meta.type), чтобы позиции документов получали верную ссылку. У модификаций
+нет своего артикула: их коды хранятся отдельно (таблица codes) и ищутся,
+только если артикул не найден - в том же порядке, что и через API (код
+модификации может совпадать с артикулом товара). Зеркало хранится в SQLite
+(TOCKA_CATALOG_DB, по умолчанию catalog.sqlite3):
+- первая синхронизация выгружает весь каталог постранично (по 1000 позиций);
+- следующие запрашивают только товары с updated>=момент прошлой синхронизации;
+- раз в FULL_SYNC_EVERY секунд выполняется полная выгрузка, чтобы убрать
+  удалённые товары (фильтр по updated их не возвращает).
+
+Синхронизация идёт в фоновом потоке (CatalogSync), поиск в это время
+продолжает работать: что не найдено в зеркале, ищется через API и
+добавляется в зеркало (CatalogMirror.upsert).
+
+Модуль не делает HTTP запросов сам: страницы каталога получает функция
+fetch_page(params), которую передаёт вызывающий код (mp_v6).
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+# Размер страницы выгрузки каталога (максимум API МойСклад)
+PAGE_SIZE = 1000
+
+# Период полной выгрузки каталога, секунды
+FULL_SYNC_EVERY = int(os.environ.get("TOCKA_CATALOG_FULL_SYNC", str(24 * 3600)))
+
+# Тип позиции, если он неизвестен (записи, выгруженные из /entity/product)
+DEFAULT_TYPE = 'product'
+
+
+def entity_type(row):
+    """Тип позиции ассортимента из meta.type (product, variant, bundle, service)."""
+    return (row.get('meta') or {}).get('type') or DEFAULT_TYPE
+
+
+def entity_code(row):
+    """Код модификации для поиска (у модификации нет артикула) или None."""
+    return row.get('code') if entity_type(row) == 'variant' and not row.get('article') else None
+
+
+class CatalogMirror:
+    """
+    Зеркало каталога товаров в SQLite.
+
+    Args:
+        db_path (str): Путь к файлу базы SQLite
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                " article TEXT PRIMARY KEY,"
+                " id TEXT NOT NULL,"
+                " name TEXT,"
+                " updated TEXT,"
+                " seen REAL NOT NULL,"
+                " type TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS products_id ON products (id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS codes ("
+                " code TEXT PRIMARY KEY,"
+                " id TEXT NOT NULL,"
+                " name TEXT,"
+                " updated TEXT,"
+                " seen REAL NOT NULL,"
+                " type TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS codes_id ON codes (id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            # Базы, созданные до хранения типа, получают колонку type (NULL - товар);
+            # модификаций и комплектов в них нет, поэтому следующая синхронизация - полная
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(products)")}
+            if 'type' not in columns:
+                conn.execute("ALTER TABLE products ADD COLUMN type TEXT")
+                conn.execute("DELETE FROM sync_state WHERE key = 'last_full_at'")
+            # Модификации, записанные по коду в таблицу артикулов, переносятся в codes
+            conn.execute("INSERT OR REPLACE INTO codes (code, id, name, updated, seen, type)"
+                         " SELECT article, id, name, updated, seen, type FROM products WHERE type = 'variant'")
+            conn.execute("DELETE FROM products WHERE type = 'variant'")
+
+    def _connection(self):
+        # У каждого потока своё соединение: sqlite3 не разрешает делить их между потоками
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, article):
+        """
+        Ищет позицию ассортимента по артикулу, а если не найдена - модификацию по коду.
+
+        Returns:
+            tuple or None: (uuid, name, тип) или None, если позиции нет в зеркале
+        """
+        conn = self._connection()
+        row = conn.execute("SELECT id, name, type FROM products WHERE article = ?", (str(article),)).fetchone()
+        if row is None:
+            row = conn.execute("SELECT id, name, type FROM codes WHERE code = ?", (str(article),)).fetchone()
+        return (row[0], row[1] or '', row[2] or DEFAULT_TYPE) if row else None
+
+    def upsert(self, rows, seen=None):
+        """
+        Добавляет или обновляет позиции ассортимента.
+
+        Если у позиции сменился артикул (код), запись со старым удаляется.
+
+        Args:
+            rows (list): Позиции API (id, article или code, name, updated, meta);
+                         позиции с артикулом пишутся в products, модификации
+                         без артикула - в codes по коду, остальные пропускаются
+            seen (float): Отметка выгрузки (для удаления пропавших при полной синхронизации)
+
+        Returns:
+            int: Сколько позиций записано
+        """
+        seen = time.time() if seen is None else seen
+        rows = [row for row in rows if row.get('id')]
+        items = [(row['article'], row['id'], row.get('name', ''), row.get('updated'), seen, entity_type(row))
+                 for row in rows if row.get('article')]
+        codes = [(entity_code(row), row['id'], row.get('name', ''), row.get('updated'), seen, entity_type(row))
+                 for row in rows if entity_code(row)]
+        with self._connection() as conn:
+            conn.executemany("DELETE FROM products WHERE id = ? AND article <> ?",
+                             [(item[1], item[0]) for item in items])
+            conn.executemany(
+                "INSERT OR REPLACE INTO products (article, id, name, updated, seen, type) VALUES (?, ?, ?, ?, ?, ?)",
+                items
+            )
+            conn.executemany("DELETE FROM codes WHERE id = ? AND code <> ?",
+                             [(item[1], item[0]) for item in codes])
+            conn.executemany(
+                "INSERT OR REPLACE INTO codes (code, id, name, updated, seen, type) VALUES (?, ?, ?, ?, ?, ?)",
+                codes
+            )
+        return len(items) + len(codes)
+
+    def get_state(self, key, default=None):
+        row = self._connection().execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def count(self):
+        conn = self._connection()
+        return (conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+                + conn.execute("SELECT COUNT(*) FROM codes").fetchone()[0])
+
+    def sync(self, fetch_page, now, full=None):
+        """
+        Синхронизирует зеркало с каталогом МойСклад.
+
+        Args:
+            fetch_page (callable): fetch_page(params) -> ответ /entity/assortment (dict с rows)
+            now (str): Текущее время МойСклад ("YYYY-MM-DD HH:MM:SS"); станет
+                       отметкой для следующей инкрементальной синхронизации
+            full (bool): Полная выгрузка; None - если зеркало пустое или
+                         с прошлой полной выгрузки прошло FULL_SYNC_EVERY секунд
+
+        Returns:
+            dict: {'full': полная ли выгрузка, 'products': получено товаров,
+                   'removed': удалено пропавших, 'seconds': длительность}
+        """
+        started = time.time()
+        last_sync = self.get_state('last_sync')
+        if full is None:
+            last_full = float(self.get_state('last_full_at', 0))
+            full = last_sync is None or started - last_full >= FULL_SYNC_EVERY
+
+        params = {"limit": PAGE_SIZE, "offset": 0}
+        if not full:
+            params["filter"] = f"updated>={last_sync}"
+
+        # Каждая страница записывается сразу: прерванная выгрузка продолжится
+        # в следующий раз, а отметка last_sync меняется только в конце
+        received = 0
+        while True:
+            data = fetch_page(dict(params))
+            rows = data.get('rows', [])
+            self.upsert(rows, seen=started)
+            received += len(rows)
+            if len(rows) < params["limit"]:
+                break
+            params["offset"] += params["limit"]
+
+        removed = 0
+        if full:
+            with self._connection() as conn:
+                removed = conn.execute("DELETE FROM products WHERE seen < ?", (started,)).rowcount
+                removed += conn.execute("DELETE FROM codes WHERE seen < ?", (started,)).rowcount
+            self.set_state('last_full_at', started)
+        self.set_state('last_sync', now)
+        self.set_state('last_sync_at', started)
+        return {'full': full, 'products': received, 'removed': removed,
+                'seconds': round(time.time() - started, 2)}
+
+
+class CatalogSync(threading.Thread):
+    """
+    Фоновая синхронизация зеркала каталога по расписанию.
+
+    Если зеркало синхронизировалось недавно (в том числе другим процессом,
+    работающим с той же базой), очередная синхронизация пропускается.
+
+    Args:
+        mirror (CatalogMirror): Зеркало каталога
+        fetch_page (callable): Получение страницы /entity/assortment
+        now (callable): Текущее время МойСклад строкой
+        interval (float): Период синхронизации, секунды
+    """
+
+    def __init__(self, mirror, fetch_page, now, interval):
+        super().__init__(name="catalog-sync", daemon=True)
+        self.mirror = mirror
+        self.fetch_page = fetch_page
+        self.now = now
+        self.interval = interval
+        self.synced = threading.Event()  # Устанавливается после первой успешной синхронизации
+        self._stop = threading.Event()
+
+    def run_once(self):
+        """Синхронизирует зеркало, если с прошлой синхронизации прошло interval секунд."""
+        last = float(self.mirror.get_state('last_sync_at', 0))
+        if time.time() - last < self.interval:
+            self.synced.set()
+            return None
+        result = self.mirror.sync(self.fetch_page, self.now())
+        print(f"Каталог синхронизирован: {result}", flush=True)
+        self.synced.set()
+        return result
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Ошибка синхронизации каталога: {e}", flush=True)
+            self._stop.wait(self.interval)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,183 @@
+"""
+Чтение выгрузок: сменные способы чтения Excel и CSV с одинаковой типизацией.
+
+pd.read_excel с движком openpyxl - самый медленный этап на больших
+выгрузках: для каждой ячейки создаётся объект openpyxl. Здесь строки
+листа получаются одним из способов (READERS), а в DataFrame превращаются
+одинаково - тем же TextParser, что использует pd.read_excel, с тем же
+приведением значений ячеек. Поэтому типы колонок (int64, float64, object,
+NaN для пустых) не зависят от способа чтения:
+- calamine - библиотека python-calamine (Rust), самый быстрый способ;
+- openpyxl - потоковое чтение read_only с values_only, без объектов ячеек;
+- csv - файлы .csv/.txt: разделитель определяется по первым строкам,
+  кодировка UTF-8 или cp1251; ячейки CSV - текст, и числа распознаются
+  так же, как числа из текстовых ячеек Excel;
+- pandas - обычный pd.read_excel (эталон для benchmark.py --ingest и
+  запасной вариант для .xls).
+
+Способ выбирается TOCKA_EXCEL_READER (auto - calamine, если установлен,
+иначе openpyxl). Какой способ быстрее на своих файлах, показывает
+python benchmark.py --ingest.
+"""
+
+import csv
+import importlib.util
+import io
+import os
+from datetime import date, datetime
+
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+READERS = ('calamine', 'openpyxl', 'csv', 'pandas')
+
+# Расширения, которые читаются как CSV
+CSV_EXTENSIONS = ('.csv', '.txt', '.tsv')
+
+# Значения ячеек с ошибкой формулы (openpyxl отдаёт их строками при values_only)
+EXCEL_ERRORS = frozenset(('#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'))
+
+DEFAULT_READER = os.environ.get("TOCKA_EXCEL_READER", "auto").strip().lower()
+
+
+def available_readers():
+    """Способы чтения Excel, доступные в этом окружении (в порядке предпочтения)."""
+    readers = []
+    if importlib.util.find_spec('python_calamine') is not None:
+        readers.append('calamine')
+    readers += ['openpyxl', 'pandas']
+    return readers
+
+
+def _convert(value):
+    """Значение ячейки как в pandas (_convert_cell движка openpyxl)."""
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str) and value in EXCEL_ERRORS:
+        return float('nan')
+    # calamine отдаёт ячейки с одной датой как date, openpyxl - как datetime
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def rows_to_frame(rows, dtype=None):
+    """
+    Превращает строки листа в DataFrame так же, как pd.read_excel.
+
+    Args:
+        rows (iterable): Строки листа (первая - заголовок), значения ячеек Python
+        dtype: Тип колонок, как в pd.read_excel (например str)
+
+    Returns:
+        pandas.DataFrame: Таблица
+    """
+    data = []
+    last_row_with_data = -1
+    for row in rows:
+        converted = [_convert(value) for value in row]
+        while converted and converted[-1] == "":
+            converted.pop()
+        if converted:
+            last_row_with_data = len(data)
+        data.append(converted)
+    data = data[:last_row_with_data + 1]
+    if not data:
+        return pd.DataFrame()
+    width = max(len(row) for row in data)
+    data = [row + [""] * (width - len(row)) for row in data]
+    return TextParser(data, header=0, dtype=dtype, skip_blank_lines=False).read()
+
+
+def _read_calamine(path, dtype):
+    from python_calamine import CalamineWorkbook
+
+    workbook = CalamineWorkbook.from_path(path)
+    sheet = workbook.get_sheet_by_index(0)
+    return rows_to_frame(sheet.to_python(skip_empty_area=False), dtype)
+
+
+def _read_openpyxl(path, dtype):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        # Размеры листа в файле бывают неверными (так же делает pandas)
+        ws.reset_dimensions()
+        return rows_to_frame(ws.iter_rows(values_only=True), dtype)
+    finally:
+        wb.close()
+
+
+def _read_csv(path, dtype):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        text = raw.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        text = raw.decode('cp1251')
+    try:
+        delimiter = csv.Sniffer().sniff(text[:4096], delimiters=',;\t').delimiter
+    except csv.Error:
+        delimiter = ','
+    return pd.read_csv(io.StringIO(text), sep=delimiter, dtype=dtype)
+
+
+def _read_pandas(path, dtype):
+    return pd.read_excel(path, dtype=dtype)
+
+
+_READ = {
+    'calamine': _read_calamine,
+    'openpyxl': _read_openpyxl,
+    'csv': _read_csv,
+    'pandas': _read_pandas,
+}
+
+
+def choose_reader(path, reader=None):
+    """
+    Определяет способ чтения файла.
+
+    Args:
+        path (str): Путь к файлу
+        reader (str): Способ из READERS или 'auto' (по умолчанию DEFAULT_READER)
+
+    Returns:
+        str: Способ чтения
+
+    Raises:
+        ValueError: Если способ неизвестен или недоступен
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in CSV_EXTENSIONS:
+        return 'csv'
+    if ext == '.xls':
+        # Старый формат читают только pandas и calamine
+        return 'calamine' if 'calamine' in available_readers() else 'pandas'
+    reader = (reader or DEFAULT_READER or 'auto').lower()
+    if reader == 'auto':
+        return available_readers()[0]
+    if reader not in READERS or reader == 'csv':
+        raise ValueError(f"Неизвестный способ чтения Excel: {reader} (доступны {', '.join(available_readers())})")
+    if reader not in available_readers():
+        raise ValueError(f"Способ чтения {reader} недоступен: не установлен python-calamine")
+    return reader
+
+
+def read_table(path, dtype=None, reader=None):
+    """
+    Читает первый лист Excel (или CSV) в DataFrame.
+
+    Args:
+        path (str): Путь к .xlsx, .xls или .csv
+        dtype: Тип колонок, как в pd.read_excel (например str)
+        reader (str): Способ чтения (см. choose_reader)
+
+    Returns:
+        pandas.DataFrame: Таблица с теми же типами колонок, что дал бы pd.read_excel
+    """
+    return _READ[choose_reader(path, reader)](path, dtype)
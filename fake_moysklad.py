@@ -0,0 +1,573 @@
+"""
+Локальный стенд, имитирующий API МойСклад.
+
+Позволяет запускать обработку файлов и создание заказов без обращения
+к боевому API: каталог товаров, ячейки и остатки генерируются синтетически.
+Поддерживаются задержка ответа, случайные ответы 429 и ограничение частоты
+запросов, как у настоящего API (45 запросов за 3 секунды).
+
+Реализованные ресурсы:
+- GET  /entity/product                   - поиск товаров (filter=article=..., limit/offset)
+- GET  /entity/assortment                - ассортимент: товары, модификации, комплекты
+                                           (filter=article=... / code=... / updated>=..., limit/offset)
+- GET  /entity/store/<id>/slots          - ячейки склада
+- GET  /report/stock/byslot/current      - остатки по ячейкам (filter=assortmentId/storeId)
+- GET  /report/stock/bystore/current     - остатки по складам (changedSince)
+- GET  /entity/<тип>/<id>/positions     - позиции документа (demand, move, supply, inventory)
+- POST /entity/customerorder             - создание заказа покупателя
+
+Служебные ресурсы стенда:
+- GET  /_stats                           - счётчики запросов
+- POST /_stock                           - изменение остатка (article, slotId, stock)
+- POST /_product                         - добавление/изменение товара (article, name)
+- POST /_document                        - документ, меняющий остатки, с отправкой вебхука
+                                           (type, positions: [{article, slotId, delta}])
+- DELETE /_document/<id>                 - удаление документа (остатки возвращаются) и вебхук
+
+Синтетические вебхуки: документы (POST /_document или --webhook-every) меняют
+остатки и отправляют вебхук МойСклад на --webhook-url.
+- POST /_reset                           - сброс счётчиков
+
+Запуск:
+    python fake_moysklad.py --port 8099 --products 5000 --latency 0.05
+    MOYSKLAD_BASE_URL=http://127.0.0.1:8099 python mp_v6.py
+"""
+
+import argparse
+import logging
+import random
+import threading
+import time
+import uuid
+
+import requests
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+
+from flask import Flask, request, jsonify
+
+DEFAULT_STORE_ID = "241ed919-a631-11ee-0a80-07a9000bb947"
+
+# Даты в API МойСклад - московское время
+MOSCOW_TZ = timezone(timedelta(hours=3))
+
+
+def bench_article(index):
+    """
+    Возвращает синтетический артикул товара стенда по его номеру.
+
+    Args:
+        index (int): Номер товара
+
+    Returns:
+        str: Артикул вида "N0042-1"
+    """
+    return f"N{index:04d}-{index % 7 + 1}"
+
+
+class FakeMoySklad:
+    """
+    Состояние стенда: каталог, ячейки, остатки и счётчики запросов.
+
+    Args:
+        products (int): Количество товаров в каталоге
+        slots (int): Количество ячеек на складе
+        store_id (str): UUID склада
+        extra_stores (int): Количество дополнительных складов (со своими ячейками и остатками)
+        latency (float): Задержка ответа в секундах
+        jitter (float): Случайная добавка к задержке (0..jitter секунд)
+        error_429_rate (float): Доля запросов, на которые отвечаем 429
+        rate_limit (int): Допустимое число запросов за rate_window (0 - без ограничения)
+        rate_window (float): Окно ограничения частоты в секундах
+        seed (int): Начальное значение генератора случайных чисел
+        variants (int): Количество модификаций (у первых товаров; код - артикул товара с "/V")
+        bundles (int): Количество комплектов (артикулы "K0000", "K0001", ...)
+    """
+
+    def __init__(self, products=5000, slots=400, store_id=DEFAULT_STORE_ID,
+                 latency=0.0, jitter=0.0, error_429_rate=0.0,
+                 rate_limit=0, rate_window=3.0, seed=42, extra_stores=0, variants=0, bundles=0):
+        self.store_id = store_id
+        self.store_ids = [store_id]
+        self.latency = latency
+        self.jitter = jitter
+        self.error_429_rate = error_429_rate
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.throttled = 0
+        self.recent = deque()
+        self.orders = []
+        self.documents = {}
+        self.webhook_url = None
+        self.base_url = ""
+
+        now = datetime.now(MOSCOW_TZ).strftime("%Y-%m-%d %H:%M:%S.000")
+        self.slots = {
+            str(uuid.UUID(int=self.random.getrandbits(128))): f"{chr(ord('A') + i // 100 % 26)}-{i % 100 + 1:02d}"
+            for i in range(slots)
+        }
+        slot_ids = list(self.slots)
+        self.slot_store = {slot_id: store_id for slot_id in slot_ids}
+
+        self.products = []
+        self.by_article = {}
+        self.stock = {}
+        for i in range(products):
+            product_id = str(uuid.UUID(int=self.random.getrandbits(128)))
+            product = {
+                "id": product_id,
+                "name": f"Тестовый товар {i}",
+                "article": bench_article(i),
+                "updated": now
+            }
+            self.products.append(product)
+            self.by_article[product["article"]] = product
+            self.stock[product_id] = {
+                slot_id: self.random.randint(1, 20)
+                for slot_id in self.random.sample(slot_ids, k=min(len(slot_ids), self.random.randint(0, 3)))
+            }
+        self.stock_changed = {}
+
+        # Дополнительные склады генерируются после основного, чтобы данные основного не менялись
+        for n in range(extra_stores):
+            extra_id = str(uuid.UUID(int=self.random.getrandbits(128)))
+            self.store_ids.append(extra_id)
+            extra_slots = [str(uuid.UUID(int=self.random.getrandbits(128))) for _ in range(slots)]
+            for i, slot_id in enumerate(extra_slots):
+                self.slots[slot_id] = f"{chr(ord('A') + i // 100 % 26)}-{i % 100 + 1:02d}"
+                self.slot_store[slot_id] = extra_id
+            for product in self.products:
+                for slot_id in self.random.sample(extra_slots, k=min(len(extra_slots), self.random.randint(0, 3))):
+                    self.stock[product["id"]][slot_id] = self.random.randint(1, 20)
+
+        # Модификации и комплекты (их нет в /entity/product, только в /entity/assortment);
+        # генерируются последними, чтобы данные товаров не менялись
+        self.variants = []
+        self.bundles = []
+        self.by_code = {}
+        for product in self.products[:variants]:
+            variant = {
+                "id": str(uuid.UUID(int=self.random.getrandbits(128))),
+                "name": f"{product['name']} (модификация)",
+                "code": f"{product['article']}/V",
+                "updated": now
+            }
+            self.variants.append(variant)
+            self.by_code[variant["code"]] = variant
+            self.stock[variant["id"]] = {
+                slot_id: self.random.randint(1, 20)
+                for slot_id in self.random.sample(slot_ids, k=min(len(slot_ids), self.random.randint(1, 3)))
+            }
+        for i in range(bundles):
+            self.bundles.append({
+                "id": str(uuid.UUID(int=self.random.getrandbits(128))),
+                "name": f"Комплект {i}",
+                "article": f"K{i:04d}",
+                "updated": now
+            })
+
+    def set_stock(self, product_id, slot_id, qty):
+        """
+        Меняет остаток товара в ячейке и отмечает момент изменения.
+
+        Args:
+            product_id (str): UUID товара
+            slot_id (str): UUID ячейки
+            qty (int): Новый остаток (0 - убрать товар из ячейки)
+        """
+        with self.lock:
+            slots = self.stock.setdefault(product_id, {})
+            if qty:
+                slots[slot_id] = qty
+            else:
+                slots.pop(slot_id, None)
+            self.stock_changed[product_id] = datetime.now(MOSCOW_TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+    def upsert_product(self, article, name):
+        """
+        Добавляет товар или меняет название существующего (отметка updated - текущее время).
+
+        Args:
+            article (str): Артикул
+            name (str): Название
+
+        Returns:
+            dict: Товар
+        """
+        with self.lock:
+            product = self.by_article.get(article)
+            if product is None:
+                product = {"id": str(uuid.UUID(int=self.random.getrandbits(128))), "article": article}
+                self.products.append(product)
+                self.by_article[article] = product
+                self.stock.setdefault(product["id"], {})
+            product["name"] = name
+            product["updated"] = datetime.now(MOSCOW_TZ).strftime("%Y-%m-%d %H:%M:%S.000")
+            return product
+
+    def post_document(self, doc_type, positions, action="CREATE"):
+        """
+        Создаёт документ, меняющий остатки, применяет его и отправляет вебхук.
+
+        Args:
+            doc_type (str): Тип документа (demand, move, supply, inventory)
+            positions (list): Позиции [(product_id, slot_id, изменение остатка), ...]
+            action (str): Действие для вебхука
+
+        Returns:
+            dict: Документ {'id', 'type', 'positions'}
+        """
+        doc = {"id": str(uuid.uuid4()), "type": doc_type, "positions": list(positions)}
+        for product_id, slot_id, delta in doc["positions"]:
+            self.set_stock(product_id, slot_id, max(self.stock.get(product_id, {}).get(slot_id, 0) + delta, 0))
+        with self.lock:
+            self.documents[doc["id"]] = doc
+        self.send_webhook(doc, action)
+        return doc
+
+    def delete_document(self, doc_id):
+        """Удаляет документ, возвращает его изменения остатков и отправляет вебхук DELETE."""
+        with self.lock:
+            doc = self.documents.pop(doc_id, None)
+        if doc is None:
+            return None
+        for product_id, slot_id, delta in doc["positions"]:
+            self.set_stock(product_id, slot_id, max(self.stock.get(product_id, {}).get(slot_id, 0) - delta, 0))
+        self.send_webhook(doc, "DELETE")
+        return doc
+
+    def random_document(self):
+        """Случайная отгрузка или приёмка 1-3 товаров (для потока синтетических вебхуков)."""
+        doc_type = self.random.choice(["demand", "supply"])
+        positions = []
+        for product in self.random.sample(self.products, k=min(len(self.products), self.random.randint(1, 3))):
+            slots = list(self.stock.get(product["id"], {})) or list(self.slots)
+            delta = self.random.randint(1, 5)
+            positions.append((product["id"], self.random.choice(slots), -delta if doc_type == "demand" else delta))
+        return self.post_document(doc_type, positions)
+
+    def send_webhook(self, doc, action):
+        """Отправляет вебхук МойСклад о документе на webhook_url (в фоне)."""
+        if not self.webhook_url:
+            return
+        body = {"events": [{
+            "meta": {"type": doc["type"], "href": f"{self.base_url}/entity/{doc['type']}/{doc['id']}"},
+            "action": action,
+            "accountId": "00000000-0000-0000-0000-000000000000",
+        }]}
+
+        def post():
+            try:
+                requests.post(self.webhook_url, json=body, timeout=5)
+            except requests.RequestException as e:
+                print(f"Не удалось отправить вебхук на {self.webhook_url}: {e}", flush=True)
+
+        threading.Thread(target=post, daemon=True).start()
+
+    def reset_stats(self):
+        """Сбрасывает счётчики запросов."""
+        with self.lock:
+            self.requests.clear()
+            self.throttled = 0
+
+    def stats(self):
+        """
+        Возвращает счётчики запросов.
+
+        Returns:
+            dict: total, throttled и число запросов по каждому ресурсу
+        """
+        with self.lock:
+            return {
+                "total": sum(self.requests.values()),
+                "throttled": self.throttled,
+                "by_endpoint": dict(self.requests)
+            }
+
+    def admit(self, endpoint):
+        """
+        Учитывает запрос и решает, нужно ли ответить 429.
+
+        Args:
+            endpoint (str): Имя ресурса для счётчика
+
+        Returns:
+            bool: True если запрос нужно отклонить с кодом 429
+        """
+        with self.lock:
+            self.requests[endpoint] += 1
+            now = time.monotonic()
+            throttle = False
+            if self.rate_limit:
+                while self.recent and now - self.recent[0] > self.rate_window:
+                    self.recent.popleft()
+                if len(self.recent) >= self.rate_limit:
+                    throttle = True
+                else:
+                    self.recent.append(now)
+            if not throttle and self.error_429_rate and self.random.random() < self.error_429_rate:
+                throttle = True
+            if throttle:
+                self.throttled += 1
+            return throttle
+
+
+def parse_filters():
+    """
+    Разбирает параметры filter запроса в формате МойСклад.
+
+    Returns:
+        list: Список кортежей (поле, оператор, значение)
+    """
+    result = []
+    for raw in request.args.getlist("filter"):
+        for part in raw.split(";"):
+            for op in (">=", "<=", "=", ">", "<"):
+                if op in part:
+                    key, value = part.split(op, 1)
+                    result.append((key, op, value))
+                    break
+    return result
+
+
+def create_app(state):
+    """
+    Создаёт Flask приложение стенда для заданного состояния.
+
+    Args:
+        state (FakeMoySklad): Состояние стенда
+
+    Returns:
+        Flask: Приложение стенда
+    """
+    app = Flask(__name__)
+
+    def throttled_or_delay(endpoint):
+        if state.admit(endpoint):
+            resp = jsonify({"errors": [{"error": "Превышен лимит количества запросов", "code": 1049}]})
+            resp.status_code = 429
+            resp.headers["X-Lognex-Retry-After"] = str(int(state.rate_window * 1000))
+            return resp
+        if state.latency or state.jitter:
+            time.sleep(state.latency + state.random.random() * state.jitter)
+        return None
+
+    @app.route("/entity/product")
+    def product_list():
+        error = throttled_or_delay("entity/product")
+        if error:
+            return error
+        rows = state.products
+        for key, op, value in parse_filters():
+            if key == "article" and op == "=":
+                product = state.by_article.get(value)
+                rows = [product] if product else []
+            elif key == "updated" and op == ">=":
+                rows = [p for p in rows if p["updated"] >= value]
+        limit = int(request.args.get("limit", 1000))
+        offset = int(request.args.get("offset", 0))
+        return jsonify({
+            "meta": {"size": len(rows), "limit": limit, "offset": offset},
+            "rows": rows[offset:offset + limit]
+        })
+
+    @app.route("/entity/assortment")
+    def assortment_list():
+        error = throttled_or_delay("entity/assortment")
+        if error:
+            return error
+        rows = ([("product", p) for p in state.products] + [("variant", v) for v in state.variants]
+                + [("bundle", b) for b in state.bundles])
+        for key, op, value in parse_filters():
+            if key in ("article", "code") and op == "=":
+                rows = [(kind, e) for kind, e in rows if e.get(key) == value]
+            elif key == "updated" and op == ">=":
+                rows = [(kind, e) for kind, e in rows if e["updated"] >= value]
+        limit = int(request.args.get("limit", 1000))
+        offset = int(request.args.get("offset", 0))
+        return jsonify({
+            "meta": {"size": len(rows), "limit": limit, "offset": offset},
+            "rows": [dict(entity, meta={"href": f"{state.base_url}/entity/{kind}/{entity['id']}", "type": kind})
+                     for kind, entity in rows[offset:offset + limit]]
+        })
+
+    @app.route("/entity/store/<store_id>")
+    def store(store_id):
+        error = throttled_or_delay("entity/store")
+        if error:
+            return error
+        if store_id not in state.store_ids:
+            return jsonify({"errors": [{"error": "Объект не найден"}]}), 404
+        return jsonify({"id": store_id, "name": f"Склад {state.store_ids.index(store_id) + 1}"})
+
+    @app.route("/entity/store/<store_id>/slots")
+    def store_slots(store_id):
+        error = throttled_or_delay("entity/store/slots")
+        if error:
+            return error
+        rows = [{"id": slot_id, "name": name} for slot_id, name in state.slots.items()
+                if state.slot_store[slot_id] == store_id]
+        return jsonify({"meta": {"size": len(rows)}, "rows": rows})
+
+    @app.route("/report/stock/byslot/current")
+    def stock_by_slot():
+        error = throttled_or_delay("report/stock/byslot/current")
+        if error:
+            return error
+        filters = parse_filters()
+        store_ids = {value for key, op, value in filters if key == "storeId"} or set(state.store_ids)
+        product_ids = [value for key, op, value in filters if key == "assortmentId"] or list(state.stock)
+        rows = [
+            {"assortmentId": product_id, "storeId": state.slot_store[slot_id], "slotId": slot_id, "stock": qty}
+            for product_id in product_ids
+            for slot_id, qty in state.stock.get(product_id, {}).items()
+            if state.slot_store[slot_id] in store_ids
+        ]
+        return jsonify(rows)
+
+    @app.route("/report/stock/bystore/current")
+    def stock_by_store():
+        error = throttled_or_delay("report/stock/bystore/current")
+        if error:
+            return error
+        since = request.args.get("changedSince", "")
+        store_ids = {value for key, op, value in parse_filters() if key == "storeId"} or set(state.store_ids)
+        rows = []
+        for product_id, changed in state.stock_changed.items():
+            if changed < since:
+                continue
+            for store_id in state.store_ids:
+                if store_id in store_ids:
+                    stock = sum(qty for slot_id, qty in state.stock.get(product_id, {}).items()
+                                if state.slot_store[slot_id] == store_id)
+                    rows.append({"assortmentId": product_id, "storeId": store_id, "stock": stock})
+        return jsonify(rows)
+
+    @app.route("/entity/customerorder", methods=["POST"])
+    def customer_order():
+        error = throttled_or_delay("entity/customerorder")
+        if error:
+            return error
+        body = request.get_json(force=True)
+        order = {"id": str(uuid.uuid4()), "name": body.get("name"), "positions": len(body.get("positions", []))}
+        with state.lock:
+            state.orders.append(order)
+        return jsonify(order)
+
+    @app.route("/_stats")
+    def stats():
+        return jsonify(state.stats())
+
+    @app.route("/_stock", methods=["POST"])
+    def set_stock():
+        body = request.get_json(force=True)
+        product = state.by_article.get(body.get("article")) or state.by_code.get(body.get("article"))
+        if not product:
+            return jsonify({"error": "unknown article"}), 404
+        state.set_stock(product["id"], body["slotId"], int(body.get("stock", 0)))
+        return jsonify({"status": "ok"})
+
+    @app.route("/_product", methods=["POST"])
+    def upsert_product():
+        body = request.get_json(force=True)
+        return jsonify(state.upsert_product(body["article"], body.get("name", body["article"])))
+
+    @app.route("/entity/<doc_type>/<doc_id>/positions")
+    def document_positions(doc_type, doc_id):
+        error = throttled_or_delay(f"entity/{doc_type}/positions")
+        if error:
+            return error
+        doc = state.documents.get(doc_id)
+        if doc is None or doc["type"] != doc_type:
+            return jsonify({"errors": [{"error": "Объект не найден"}]}), 404
+        rows = [{"quantity": abs(delta),
+                 "assortment": {"meta": {"href": f"{state.base_url}/entity/product/{product_id}", "type": "product"}}}
+                for product_id, _, delta in doc["positions"]]
+        return jsonify({"meta": {"size": len(rows)}, "rows": rows})
+
+    @app.route("/_document", methods=["POST"])
+    def post_document():
+        body = request.get_json(force=True)
+        positions = []
+        for item in body.get("positions", []):
+            product = state.by_article.get(item.get("article"))
+            if not product:
+                return jsonify({"error": f"unknown article {item.get('article')}"}), 404
+            positions.append((product["id"], item["slotId"], int(item.get("delta", 0))))
+        doc = state.post_document(body.get("type", "demand"), positions)
+        return jsonify({"id": doc["id"], "type": doc["type"]})
+
+    @app.route("/_document/<doc_id>", methods=["DELETE"])
+    def delete_document(doc_id):
+        doc = state.delete_document(doc_id)
+        if doc is None:
+            return jsonify({"error": "unknown document"}), 404
+        return jsonify({"status": "ok"})
+
+    @app.route("/_reset", methods=["POST"])
+    def reset():
+        state.reset_stats()
+        return jsonify({"status": "ok"})
+
+    return app
+
+
+def start_server(state, host="127.0.0.1", port=0):
+    """
+    Запускает стенд в фоновом потоке.
+
+    Args:
+        state (FakeMoySklad): Состояние стенда
+        host (str): Адрес для прослушивания
+        port (int): Порт (0 - выбрать свободный)
+
+    Returns:
+        tuple: (server, base_url) - сервер werkzeug (для shutdown()) и адрес API
+    """
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)  # без лога каждого запроса
+    server = make_server(host, port, create_app(state), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state.base_url = f"http://{host}:{server.server_port}"
+    return server, state.base_url
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный стенд API МойСклад")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--products", type=int, default=5000, help="Товаров в каталоге")
+    parser.add_argument("--slots", type=int, default=400, help="Ячеек на складе")
+    parser.add_argument("--extra-stores", type=int, default=0, help="Дополнительных складов")
+    parser.add_argument("--variants", type=int, default=0, help="Модификаций товаров")
+    parser.add_argument("--bundles", type=int, default=0, help="Комплектов")
+    parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, сек")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="Доля ответов 429")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Запросов за окно (0 - без ограничения)")
+    parser.add_argument("--rate-window", type=float, default=3.0, help="Окно ограничения, сек")
+    parser.add_argument("--webhook-url", help="Куда отправлять вебхуки (например http://127.0.0.1:5001/webhook/moysklad)")
+    parser.add_argument("--webhook-every", type=float, default=0.0,
+                        help="Создавать случайный документ с вебхуком каждые N сек (0 - только через /_document)")
+    args = parser.parse_args()
+
+    fake = FakeMoySklad(products=args.products, slots=args.slots, latency=args.latency,
+                        jitter=args.jitter, error_429_rate=args.rate_429,
+                        rate_limit=args.rate_limit, rate_window=args.rate_window,
+                        extra_stores=args.extra_stores, variants=args.variants, bundles=args.bundles)
+    print(f"Стенд МойСклад: http://{args.host}:{args.port} (товаров: {args.products}, ячеек: {args.slots})", flush=True)
+    if args.extra_stores:
+        print(f"Склады: {','.join(fake.store_ids)}", flush=True)
+    fake.base_url = f"http://{args.host}:{args.port}"
+    fake.webhook_url = args.webhook_url
+    if args.webhook_url and args.webhook_every > 0:
+        def webhook_stream():
+            while True:
+                time.sleep(args.webhook_every)
+                fake.random_document()
+        threading.Thread(target=webhook_stream, daemon=True).start()
+    create_app(fake).run(host=args.host, port=args.port, threaded=True)
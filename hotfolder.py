@@ -0,0 +1,294 @@
+"""
+Горячая папка: автоматическая обработка новых выгрузок маркетплейса.
+
+Интеграция с маркетплейсом кладёт файлы orders_*.xlsx в общую папку.
+Сервис следит за папкой и, как только файл дописан, ставит его в очередь
+на mp_v6.process_file; отчёт <имя>_result.xlsx пишется рядом с файлом.
+
+Новые файлы обнаруживаются через inotify (Linux, через ctypes, без внешних
+зависимостей): события IN_CLOSE_WRITE и IN_MOVED_TO. Если inotify недоступен
+(другая ОС, сетевая папка, исчерпан лимит наблюдений) или задан --poll,
+папка периодически сканируется.
+
+Недописанный файл не обрабатывается: файл берётся в работу, только когда
+его размер и время изменения не меняются settle секунд, а .xlsx к тому же
+открывается как zip-архив (у недописанного архива нет оглавления в конце).
+Файл с отчётом новее самого файла считается уже обработанным.
+
+Запуск:
+    python hotfolder.py /srv/exports
+    python hotfolder.py /srv/exports --pattern 'orders_*.xlsx' --settle 2 --workers 2
+    python hotfolder.py /srv/exports --poll --interval 5
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import fnmatch
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+import zipfile
+
+from batch import output_path_for
+
+# Маски событий inotify (linux/inotify.h)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; за ним имя длиной len
+
+# Суффикс отчётов, которые сервис сам пишет в папку, и форматы отчётов (table_export.FORMATS)
+RESULT_SUFFIX = "_result.xlsx"
+REPORT_FORMATS = ("xlsx", "csv", "json", "parquet")
+
+
+class Inotify:
+    """
+    Наблюдение за папкой через inotify.
+
+    Args:
+        folder (str): Папка для наблюдения
+
+    Raises:
+        OSError: Если inotify недоступен
+    """
+
+    def __init__(self, folder):
+        libc_name = ctypes.util.find_library("c")
+        if not sys.platform.startswith("linux") or not libc_name:
+            raise OSError("inotify доступен только в Linux")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch {folder}")
+
+    def read(self, timeout):
+        """
+        Ждёт события не дольше timeout секунд.
+
+        Returns:
+            tuple: (имена файлов, overflow) - overflow=True, если очередь событий
+                   переполнилась и папку нужно просканировать целиком
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        names, overflow, offset = [], False, 0
+        while offset + _EVENT.size <= len(data):
+            _, mask, _, length = _EVENT.unpack_from(data, offset)
+            offset += _EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif name:
+                names.append(os.fsdecode(name))
+        return names, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+def is_complete(path):
+    """Проверяет, что файл дописан: .xlsx должен открываться как zip-архив."""
+    if path.lower().endswith(".xlsx"):
+        return zipfile.is_zipfile(path)
+    return True
+
+
+class HotFolder:
+    """
+    Отслеживает папку и передаёт дописанные файлы обработчику.
+
+    Args:
+        folder (str): Папка с выгрузками
+        pattern (str): Шаблон имён файлов (fnmatch)
+        settle (float): Сколько секунд файл должен не меняться до обработки
+        interval (float): Период сканирования папки без inotify, с
+        use_inotify (bool): Пытаться использовать inotify
+    """
+
+    def __init__(self, folder, pattern="orders_*.xlsx", settle=2.0, interval=5.0, use_inotify=True):
+        self.folder = os.path.abspath(folder)
+        self.pattern = pattern
+        self.settle = settle
+        self.interval = interval
+        self.use_inotify = use_inotify
+        self.ready = queue.Queue()
+        self._pending = {}  # путь -> (размер, mtime_ns, когда последний раз менялся)
+        self._done = {}     # путь -> (размер, mtime_ns) поставленного в очередь файла
+        self._stop = threading.Event()
+
+    def wanted(self, name):
+        """Подходит ли файл под шаблон (отчёты и временные файлы Excel пропускаются)."""
+        return (fnmatch.fnmatch(name, self.pattern) and not name.endswith(RESULT_SUFFIX)
+                and not name.startswith("~$"))
+
+    def _touch(self, path):
+        """Добавляет файл в ожидание или сбрасывает его таймер, если он изменился."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._pending.pop(path, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self._done.get(path) == signature:
+            return
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != signature:
+            self._pending[path] = signature + (time.monotonic(),)
+
+    def scan(self):
+        """Сканирует папку: новые и изменившиеся файлы попадают в ожидание."""
+        try:
+            names = os.listdir(self.folder)
+        except OSError as e:
+            print(f"Не удалось прочитать папку {self.folder}: {e}", flush=True)
+            return
+        for name in names:
+            if self.wanted(name):
+                self._touch(os.path.join(self.folder, name))
+
+    def _check_pending(self):
+        """Передаёт в очередь файлы, которые не менялись settle секунд и дописаны."""
+        now = time.monotonic()
+        for path in list(self._pending):
+            self._touch(path)
+            entry = self._pending.get(path)
+            if entry is None or now - entry[2] < self.settle:
+                continue
+            if not is_complete(path):
+                # Размер не меняется, но архив не дописан (копирование на паузе) - ждём дальше
+                self._pending[path] = entry[:2] + (now,)
+                continue
+            del self._pending[path]
+            self._done[path] = entry[:2]
+            if already_processed(path):
+                continue
+            print(f"Файл готов к обработке: {path}", flush=True)
+            self.ready.put(path)
+
+    def run(self):
+        """Следит за папкой, пока не вызван stop()."""
+        watcher = None
+        if self.use_inotify:
+            try:
+                watcher = Inotify(self.folder)
+                print(f"Наблюдение за {self.folder} через inotify", flush=True)
+            except OSError as e:
+                print(f"inotify недоступен ({e}), сканируем папку каждые {self.interval} с", flush=True)
+        else:
+            print(f"Сканируем папку {self.folder} каждые {self.interval} с", flush=True)
+
+        # Файлы, появившиеся до запуска, тоже обрабатываются
+        self.scan()
+        last_scan = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                # Пока есть недописанные файлы, проверяем их чаще
+                tick = min(0.5, self.settle / 2) if self._pending else self.interval
+                if watcher is not None:
+                    names, overflow = watcher.read(tick)
+                    if overflow:
+                        self.scan()
+                    for name in names:
+                        if self.wanted(name):
+                            self._touch(os.path.join(self.folder, name))
+                else:
+                    self._stop.wait(tick)
+                    if time.monotonic() - last_scan >= self.interval:
+                        self.scan()
+                        last_scan = time.monotonic()
+                self._check_pending()
+        finally:
+            if watcher is not None:
+                watcher.close()
+
+    def stop(self):
+        self._stop.set()
+
+
+def already_processed(path):
+    """Есть ли рядом с файлом отчёт (в любом формате) новее него."""
+    result = output_path_for(path, os.path.dirname(path))
+    stem = os.path.splitext(result)[0]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return False
+    for fmt in REPORT_FORMATS:
+        try:
+            if os.path.getmtime(f"{stem}.{fmt}") >= mtime:
+                return True
+        except OSError:
+            continue
+    return False
+
+
+def process_worker(files, stop):
+    """Берёт файлы из очереди и обрабатывает их process_file; отчёт пишется рядом с файлом."""
+    import mp_v6
+
+    while not stop.is_set():
+        try:
+            path = files.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        session_id = f"hot_{time.time()}"
+        output_path = output_path_for(path, os.path.dirname(path))
+        started = time.perf_counter()
+        mp_v6.process_file(path, output_path, session_id, clean_results=False)
+        status = mp_v6.progress.get(session_id, '')
+        mark = "OK " if 'завершена успешно' in status.lower() else "ERR"
+        print(f"{mark} {os.path.basename(path)} -> {output_path} ({time.perf_counter() - started:.1f} с) {status}",
+              flush=True)
+        files.task_done()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tocka Marketplace: автоматическая обработка горячей папки")
+    parser.add_argument("folder", help="Папка, куда маркетплейс кладёт выгрузки")
+    parser.add_argument("--pattern", default="orders_*.xlsx", help="Шаблон имён файлов")
+    parser.add_argument("--settle", type=float, default=2.0, help="Файл не меняется столько секунд - дописан")
+    parser.add_argument("--interval", type=float, default=5.0, help="Период сканирования без inotify, с")
+    parser.add_argument("--poll", action="store_true", help="Не использовать inotify, только сканирование")
+    parser.add_argument("--workers", type=int, default=1, help="Файлов одновременно")
+    args = parser.parse_args(argv)
+
+    hot = HotFolder(args.folder, args.pattern, args.settle, args.interval, use_inotify=not args.poll)
+    stop = threading.Event()
+    workers = [threading.Thread(target=process_worker, args=(hot.ready, stop), daemon=True)
+               for _ in range(max(args.workers, 1))]
+    for t in workers:
+        t.start()
+    try:
+        hot.run()
+    except KeyboardInterrupt:
+        print("Остановка...", flush=True)
+    finally:
+        hot.stop()
+        stop.set()
+        if 'mp_v6' in sys.modules:
+            sys.modules['mp_v6'].shutdown_report_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Хранилище состояния задач (прогресс, флаги отмены, результаты).
+
+В режиме разработки (python mp_v6.py) состояние хранится в обычных словарях
+внутри процесса. При запуске через serve.py с несколькими процессами-воркерами
+состояние должно быть общим, иначе /status или /cancel, попавший в другой
+воркер, не увидит задачу. Для этого переменная окружения TOCKA_STATE_DB
+задаёт файл SQLite, и make_state() возвращает SharedDict поверх него.
+
+SharedDict ведёт себя как словарь: значения сериализуются в JSON, поэтому
+хранить можно строки, числа, bool, списки и словари. Изменение вложенного
+объекта на месте не сохраняется - значение нужно присвоить заново.
+Чтение и запись, которые не должны перемешаться с другими процессами
+(например, добавление файла в открытую волну), выполняет modify().
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+
+
+class SharedDict(MutableMapping):
+    """
+    Словарь, хранящий значения в общей для всех процессов базе SQLite.
+
+    Args:
+        db_path (str): Путь к файлу базы SQLite
+        namespace (str): Имя раздела (progress, cancel_flags, ...)
+    """
+
+    def __init__(self, db_path, namespace):
+        self.db_path = db_path
+        self.namespace = namespace
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_state ("
+                " namespace TEXT NOT NULL,"
+                " key TEXT NOT NULL,"
+                " value TEXT NOT NULL,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+
+    def _connection(self):
+        # У каждого потока своё соединение: sqlite3 не разрешает делить их между потоками
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __getitem__(self, key):
+        row = self._connection().execute(
+            "SELECT value FROM job_state WHERE namespace = ? AND key = ?",
+            (self.namespace, str(key))
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO job_state (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                (self.namespace, str(key), json.dumps(value, ensure_ascii=False), time.time())
+            )
+
+    def __delitem__(self, key):
+        with self._connection() as conn:
+            cur = conn.execute(
+                "DELETE FROM job_state WHERE namespace = ? AND key = ?",
+                (self.namespace, str(key))
+            )
+        if cur.rowcount == 0:
+            raise KeyError(key)
+
+    def modify(self, key, update):
+        """
+        Атомарно заменяет значение ключа: update(текущее значение или None) -
+        новое значение (None - удалить ключ). Остальные процессы ждут
+        окончания транзакции.
+
+        Returns:
+            tuple: (прежнее значение или None, новое значение)
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT value FROM job_state WHERE namespace = ? AND key = ?",
+                (self.namespace, str(key))
+            ).fetchone()
+            old = json.loads(row[0]) if row is not None else None
+            new = update(old)
+            if new is None:
+                conn.execute("DELETE FROM job_state WHERE namespace = ? AND key = ?",
+                             (self.namespace, str(key)))
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO job_state (namespace, key, value, updated) VALUES (?, ?, ?, ?)",
+                    (self.namespace, str(key), json.dumps(new, ensure_ascii=False), time.time())
+                )
+        return old, new
+
+    def __iter__(self):
+        rows = self._connection().execute(
+            "SELECT key FROM job_state WHERE namespace = ?", (self.namespace,)
+        ).fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM job_state WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def __contains__(self, key):
+        return self._connection().execute(
+            "SELECT 1 FROM job_state WHERE namespace = ? AND key = ?",
+            (self.namespace, str(key))
+        ).fetchone() is not None
+
+
+class LocalState(dict):
+    """Словарь процесса с тем же modify(), что у SharedDict (без TOCKA_STATE_DB)."""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+
+    def modify(self, key, update):
+        """Атомарно в пределах процесса заменяет значение ключа (см. SharedDict.modify)."""
+        with self._lock:
+            old = self.get(key)
+            new = update(old)
+            if new is None:
+                self.pop(key, None)
+            else:
+                self[key] = new
+        return old, new
+
+
+def make_state(namespace):
+    """
+    Создаёт хранилище состояния задач.
+
+    Args:
+        namespace (str): Имя раздела (progress, cancel_flags, ...)
+
+    Returns:
+        MutableMapping: SharedDict, если задана переменная TOCKA_STATE_DB,
+                        иначе словарь процесса LocalState
+    """
+    db_path = os.environ.get("TOCKA_STATE_DB")
+    if db_path:
+        return SharedDict(db_path, namespace)
+    return LocalState()
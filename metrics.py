@@ -0,0 +1,340 @@
+"""
+Метрики приложения в формате Prometheus.
+
+Небольшой потокобезопасный реестр счётчиков и гистограмм без внешних
+зависимостей. Используется конвейером обработки файлов и созданием заказов:
+- время этапов обработки (PhaseTimer)
+- время и статусы запросов к API МойСклад (observe_api_call)
+- попадания в кэши (record_cache)
+
+Текст для эндпоинта /metrics формирует render().
+
+Реестр у каждого процесса свой. Если задан каталог TOCKA_METRICS_DIR (его
+задаёт serve.py), каждый процесс раз в FLUSH_INTERVAL секунд сохраняет свой
+реестр в файл <pid>.json этого каталога, а render() складывает файлы всех
+процессов - как multiprocess-режим клиента Prometheus. Файлы завершившихся
+процессов остаются, чтобы счётчики не уменьшались; serve.py очищает каталог
+при запуске.
+"""
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+# Границы корзин гистограмм (секунды)
+API_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+LOOKUP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+
+_lock = threading.Lock()
+_counters = {}    # (имя, метки) -> значение
+_histograms = {}  # (имя, метки) -> [счётчики корзин..., сумма, количество]
+_bucket_bounds = {}
+_help = {}
+
+# Каталог с реестрами процессов и период их сохранения (секунды)
+METRICS_DIR = os.environ.get("TOCKA_METRICS_DIR", "")
+FLUSH_INTERVAL = 1.0
+_dirty = False
+_flusher_pid = None
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key) + (list(extra) if extra else [])
+    if not items:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def inc(name, labels=None, value=1, help_text=""):
+    """
+    Увеличивает счётчик.
+
+    Args:
+        name (str): Имя метрики
+        labels (dict): Метки
+        value (float): На сколько увеличить
+        help_text (str): Описание метрики для /metrics
+    """
+    global _dirty
+    key = (name, _labels_key(labels or {}))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        if help_text:
+            _help.setdefault(name, ("counter", help_text))
+        _dirty = True
+    _ensure_flusher()
+
+
+def observe(name, value, labels=None, buckets=API_BUCKETS, help_text=""):
+    """
+    Добавляет наблюдение в гистограмму.
+
+    Args:
+        name (str): Имя метрики
+        value (float): Наблюдаемое значение
+        labels (dict): Метки
+        buckets (tuple): Верхние границы корзин
+        help_text (str): Описание метрики для /metrics
+    """
+    global _dirty
+    key = (name, _labels_key(labels or {}))
+    with _lock:
+        data = _histograms.get(key)
+        if data is None:
+            data = _histograms[key] = [0] * (len(buckets) + 2)
+            _bucket_bounds[name] = buckets
+            if help_text:
+                _help.setdefault(name, ("histogram", help_text))
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                data[i] += 1
+        data[-2] += value
+        data[-1] += 1
+        _dirty = True
+    _ensure_flusher()
+
+
+def _snapshot():
+    """Копия реестра процесса: (счётчики, гистограммы, границы корзин, описания)."""
+    with _lock:
+        return (dict(_counters), {key: list(data) for key, data in _histograms.items()},
+                dict(_bucket_bounds), dict(_help))
+
+
+def flush():
+    """Сохраняет реестр процесса в METRICS_DIR/<pid>.json (если каталог задан)."""
+    global _dirty
+    if not METRICS_DIR:
+        return
+    with _lock:
+        _dirty = False
+    counters, histograms, bounds, help_items = _snapshot()
+    data = {
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        "histograms": [[name, labels, values] for (name, labels), values in histograms.items()],
+        "bounds": bounds,
+        "help": help_items,
+    }
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        print(f"Не удалось сохранить метрики процесса {os.getpid()}: {e}", flush=True)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        if _dirty:
+            flush()
+
+
+def _ensure_flusher():
+    """Запускает фоновое сохранение реестра (один поток на процесс, в том числе после fork)."""
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+    atexit.register(flush)
+
+
+def _merged_snapshot():
+    """Реестры всех процессов из METRICS_DIR, сложенные вместе (текущий процесс - свежий)."""
+    flush()
+    counters, histograms, bounds, help_items = {}, {}, {}, {}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, labels, value in data["counters"]:
+            key = (name, tuple(tuple(item) for item in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in data["histograms"]:
+            key = (name, tuple(tuple(item) for item in labels))
+            total = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                total[i] += value
+        bounds.update({name: tuple(b) for name, b in data["bounds"].items()})
+        for name, item in data["help"].items():
+            help_items.setdefault(name, tuple(item))
+    return counters, histograms, bounds, help_items
+
+
+def observe_api_call(endpoint, seconds, status):
+    """
+    Учитывает один запрос к API МойСклад.
+
+    Args:
+        endpoint (str): Ресурс API без идентификаторов (например entity/product)
+        seconds (float): Длительность запроса
+        status (int or str): HTTP статус или "error" при сетевой ошибке
+    """
+    observe("tocka_moysklad_request_seconds", seconds, {"endpoint": endpoint},
+            help_text="Длительность запросов к API МойСклад")
+    inc("tocka_moysklad_requests_total", {"endpoint": endpoint, "status": status},
+        help_text="Запросы к API МойСклад по статусу ответа")
+    if status == 429:
+        inc("tocka_moysklad_throttled_total", {"endpoint": endpoint},
+            help_text="Ответы 429 (превышен лимит запросов) от API МойСклад")
+
+
+def record_cache(cache, hit):
+    """
+    Учитывает обращение к кэшу.
+
+    Args:
+        cache (str): Имя кэша
+        hit (bool): True если значение найдено в кэше
+    """
+    inc("tocka_cache_requests_total", {"cache": cache, "result": "hit" if hit else "miss"},
+        help_text="Обращения к кэшам по результату")
+
+
+class PhaseTimer:
+    """
+    Замеряет время последовательных этапов обработки.
+
+    Каждый вызов start() закрывает предыдущий этап; stop() закрывает последний.
+    Длительности накапливаются в self.timings (этап -> секунды), после каждого
+    этапа копируются в store[key] и попадают в гистограмму tocka_phase_seconds.
+
+    Args:
+        pipeline (str): Имя конвейера (process_file, order, ...)
+        store (MutableMapping): Хранилище времени этапов по сессиям (может быть None)
+        key (str): Ключ сессии в store
+
+    Пример:
+        timer = PhaseTimer('process_file', phase_timings, session_id)
+        timer.start('read')
+        ...
+        timer.start('slots')
+        ...
+        timer.stop()
+    """
+
+    def __init__(self, pipeline, store=None, key=None):
+        self.pipeline = pipeline
+        self.store = store
+        self.key = key
+        self.timings = {}
+        self.phase = None
+        self.started = None
+        if store is not None:
+            store[key] = {}
+
+    def start(self, phase):
+        """Закрывает текущий этап и начинает новый."""
+        self.stop()
+        self.phase = phase
+        self.started = time.perf_counter()
+
+    def stop(self):
+        """Закрывает текущий этап, если он есть."""
+        if self.phase is None:
+            return
+        phase, self.phase = self.phase, None
+        self.record(phase, time.perf_counter() - self.started)
+
+    def record(self, phase, seconds):
+        """
+        Учитывает этап, время которого замерено в другом месте (например, в другом процессе).
+
+        Args:
+            phase (str): Название этапа
+            seconds (float): Длительность в секундах
+        """
+        self.timings[phase] = round(self.timings.get(phase, 0.0) + seconds, 4)
+        if self.store is not None:
+            # Присваиваем копию: общее хранилище задач не видит изменений на месте
+            self.store[self.key] = dict(self.timings)
+        observe("tocka_phase_seconds", seconds, {"pipeline": self.pipeline, "phase": phase},
+                buckets=PHASE_BUCKETS, help_text="Длительность этапов обработки")
+
+
+def counter_total(name):
+    """
+    Возвращает сумму счётчика по всем меткам (в текущем процессе).
+
+    Args:
+        name (str): Имя метрики (например tocka_moysklad_requests_total)
+
+    Returns:
+        float: Сумма значений
+    """
+    with _lock:
+        return sum(value for (metric, _), value in _counters.items() if metric == name)
+
+
+def render():
+    """
+    Формирует текст всех метрик в формате Prometheus.
+
+    Если задан METRICS_DIR, метрики складываются по всем процессам.
+
+    Returns:
+        str: Текст для ответа эндпоинта /metrics
+    """
+    lines = []
+    if METRICS_DIR:
+        counters, histograms, bucket_bounds, help_items = _merged_snapshot()
+    else:
+        counters, histograms, bucket_bounds, help_items = _snapshot()
+
+    def header(name, kind):
+        text = help_items.get(name, (kind, ""))[1]
+        if text:
+            lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for name in sorted({key[0] for key in counters}):
+        header(name, "counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({key[0] for key in histograms}):
+        header(name, "histogram")
+        bounds = bucket_bounds[name]
+        for (metric, labels), data in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(bounds, data):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {data[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {data[-2]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {data[-1]}")
+
+    # Доля попаданий в кэши считается из счётчиков обращений
+    cache_totals = {}
+    for (metric, labels), value in counters.items():
+        if metric == "tocka_cache_requests_total":
+            label_map = dict(labels)
+            hits, total = cache_totals.get(label_map["cache"], (0, 0))
+            if label_map["result"] == "hit":
+                hits += value
+            cache_totals[label_map["cache"]] = (hits, total + value)
+    if cache_totals:
+        lines.append("# HELP tocka_cache_hit_ratio Доля попаданий в кэш")
+        lines.append("# TYPE tocka_cache_hit_ratio gauge")
+        for cache, (hits, total) in sorted(cache_totals.items()):
+            lines.append(f'tocka_cache_hit_ratio{{cache="{cache}"}} {hits / total if total else 0:.4f}')
+
+    return "\n".join(lines) + "\n"
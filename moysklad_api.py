@@ -13,12 +13,15 @@ HEADERS = {
 }
 
 def get_product_uuid(article: str) -> tuple[str | None, str | None]:
-    """По артикулу возвращает (UUID, наименование) товара, или (None, None)."""
-    url = f"{BASE_URL}/entity/product"
-    params = {"filter": f"article={article}", "limit": 1}
-    resp = requests.get(url, headers=HEADERS, params=params)
-    resp.raise_for_status()
-    rows = resp.json().get("rows", [])
+    """По артикулу (или коду модификации) возвращает (UUID, наименование) позиции ассортимента, или (None, None)."""
+    url = f"{BASE_URL}/entity/assortment"
+    rows = []
+    for field in ("article", "code"):
+        resp = requests.get(url, headers=HEADERS, params={"filter": f"{field}={article}", "limit": 1})
+        resp.raise_for_status()
+        rows = resp.json().get("rows", [])
+        if rows:
+            break
     if not rows:
         return None, None
     item = rows[0]
@@ -21,28 +21,64 @@ Tocka Marketplace - Веб-приложение для автоматизаци
 """
 
 import os
+import json
 import time
 import threading
 import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from flask import Flask, request, render_template_string, send_file, flash, redirect, url_for, jsonify
+import multiprocessing
+import atexit
+import hmac
+import math
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from flask import (Flask, Response, request, render_template_string, send_file, flash, redirect, url_for, jsonify,
+                   stream_with_context)
 import pandas as pd
 import requests
 from openpyxl import load_workbook
-from openpyxl.styles import Border, Side, Font, Alignment
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import metrics
+from job_state import make_state
+from report_writer import write_report
+from print_plan import (build_print_plan, plan_print_items, forecast_filament, filament_sheet,
+                        filament_json, PRINT_PLAN_SHEET, FILAMENT_SHEET)
+from picking import build_slot_order, allocate_slots, format_allocation, build_pick_sheet, PICK_SHEET
+from print_search import search_prints, SEARCH_FIELDS
+from printer_farm import load_printers, jobs_from_plan, schedule_jobs, schedule_sheet, SCHEDULE_SHEET
+from rate_limit import RateLimiter
+from catalog import CatalogMirror, CatalogSync, entity_type
+from stock_mirror import StockMirror, StockReconcile, StockWebhookWorker, STOCK_DOCUMENT_TYPES
+from sticker_index import StickerIndex
+from excel_reader import read_table, choose_reader
+from normalize import (normalize_articles, normalize_one, lookalike_variant, mark_skipped, skipped_sheet,
+                       SKIPPED_SHEET)
+from table_export import (FORMATS as EXPORT_FORMATS, MIMETYPES as EXPORT_MIMETYPES, ExportError, export_path,
+                          parse_formats, read_report_sheets, write_export)
 
 # Инициализация Flask приложения
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
 
 # API токен для доступа к МойСклад (должен быть заменен на реальный токен)
-API_TOKEN = "f9be4985f5e3488716c040ca52b8e04c7c0f9e0b".strip()
+API_TOKEN = os.environ.get("MOYSKLAD_TOKEN", "f9be4985f5e3488716c040ca52b8e04c7c0f9e0b").strip()
 API_TOKEN = API_TOKEN.encode('ascii', errors='ignore').decode()
 
+# Адрес API МойСклад (можно переопределить, например для локального стенда)
+BASE_URL = os.environ.get("MOYSKLAD_BASE_URL", "https://api.moysklad.ru/api/remap/1.2").rstrip("/")
+
 # ID склада в МойСклад для работы с остатками
 STORE_ID = "241ed919-a631-11ee-0a80-07a9000bb947"
 
+# Склады, по которым обрабатываются файлы: MOYSKLAD_STORE_IDS="uuid1,uuid2".
+# Первый склад - основной: строка собирается с него, если там хватает товара
+STORE_IDS = list(dict.fromkeys(
+    s.strip() for s in os.environ.get("MOYSKLAD_STORE_IDS", STORE_ID).split(",") if s.strip()
+))
+
+# Часовой пояс, в котором МойСклад принимает даты в фильтрах (Москва)
+MOYSKLAD_TZ = timezone(timedelta(hours=3))
+
 # Константы для создания заказа покупателя в МойСклад
 ORGANIZATION_UUID = "4bf22d14-4d5e-11ee-0a80-0761000a555b"  # UUID организации
 COUNTERPARTY_UUID = "5ba713c4-a31d-11ee-0a80-063f0084f98f"  # UUID контрагента (покупателя)
@@ -56,6 +92,9 @@ HEADERS = {
     "Content-Type": "application/json"
 }
 
+# Идентификаторы в путях API заменяются на {id}, чтобы метрики группировались по ресурсам
+API_ID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
 # Папки для хранения файлов
 UPLOAD_FOLDER = 'uploads'    # Папка для загруженных файлов
 RESULT_FOLDER = 'results'    # Папка для результатов обработки
@@ -64,10 +103,86 @@ RESULT_FOLDER = 'results'    # Папка для результатов обра
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(RESULT_FOLDER, exist_ok=True)
 
-# Глобальные переменные для отслеживания состояния процессов
-progress = {}        # Словарь для отслеживания прогресса обработки файлов
-cancel_flags = {}    # Флаги для отмены процессов
-order_progress = {}  # Прогресс создания заказов
+# Колонки основного листа отчёта
+REPORT_COLUMNS = ['№ Стикера', 'Количество', 'Артикул', 'Ячейки склада', 'Взять из ячеек', 'Название']
+
+# Время жизни кэша ячеек склада в секундах
+SLOT_CACHE_TTL = int(os.environ.get("TOCKA_SLOT_CACHE_TTL", "600"))
+_slot_cache = {}  # store_id -> {'loaded', 'name': название склада, 'names': {slot_id: название}, 'order': {slot_id: позиция}}
+_slot_cache_lock = threading.Lock()
+
+# Форматы отчёта по умолчанию (TOCKA_OUTPUT_FORMATS, через запятую): xlsx - оформленный
+# отчёт для людей, csv/json/parquet - данные без оформления (см. table_export.py)
+OUTPUT_FORMATS = parse_formats(os.environ.get("TOCKA_OUTPUT_FORMATS", "xlsx"))
+
+# Количество процессов для формирования Excel отчётов (0 - формировать в текущем процессе)
+REPORT_PROCESSES = int(os.environ.get("TOCKA_REPORT_PROCESSES", "2"))
+_report_pool = None
+_report_pool_lock = threading.Lock()
+
+# Окно сбора волны в секундах: загрузки в пределах окна обрабатываются вместе
+# (0 - каждая загрузка обрабатывается сразу; несколько файлов в одной загрузке
+# всё равно обрабатываются волной). Открытые волны хранятся в общем состоянии
+# задач (open_waves), поэтому загрузки, попавшие в разные воркеры, собираются вместе.
+WAVE_WINDOW = float(os.environ.get("TOCKA_WAVE_WINDOW", "0"))
+
+# Ограничение запросов к API: TOCKA_API_RATE запросов за TOCKA_API_WINDOW секунд и
+# TOCKA_API_PARALLEL одновременных (0 - без ограничения)
+API_RATE = int(os.environ.get("TOCKA_API_RATE", "0"))
+API_WINDOW = float(os.environ.get("TOCKA_API_WINDOW", "3"))
+API_PARALLEL = int(os.environ.get("TOCKA_API_PARALLEL", "0"))
+api_limiter = RateLimiter(API_RATE, API_WINDOW, API_PARALLEL) if API_RATE or API_PARALLEL else None
+
+# Кэш поиска товаров {артикул: (uuid, name)}; None - выключен. Включается для пакетной
+# обработки (batch.py), где файлы одного прогона не ищут один и тот же артикул повторно
+_product_cache = None
+_product_cache_lock = threading.Lock()
+
+# Локальное зеркало каталога товаров: период синхронизации TOCKA_CATALOG_SYNC секунд
+# (0 - зеркало выключено, товары ищутся только через API)
+CATALOG_DB = os.environ.get("TOCKA_CATALOG_DB", "catalog.sqlite3")
+CATALOG_SYNC_INTERVAL = float(os.environ.get("TOCKA_CATALOG_SYNC", "300"))
+_catalog = None
+_catalog_lock = threading.Lock()
+
+# Зеркало остатков по ячейкам, обновляемое вебхуками: полная сверка каждые
+# TOCKA_STOCK_RECONCILE секунд (0 - зеркало выключено, остатки запрашиваются через API).
+# Зеркало используется, пока с последней сверки прошло не больше STOCK_MIRROR_MAX_AGE секунд
+STOCK_DB = os.environ.get("TOCKA_STOCK_DB", "stock.sqlite3")
+STOCK_RECONCILE_INTERVAL = float(os.environ.get("TOCKA_STOCK_RECONCILE", "0"))
+STOCK_MIRROR_MAX_AGE = max(2 * STOCK_RECONCILE_INTERVAL, 60)
+WEBHOOK_TOKEN = os.environ.get("TOCKA_WEBHOOK_TOKEN", "")
+_stock_mirror = None
+_stock_webhooks = None
+_stock_mirror_lock = threading.Lock()
+
+# Индексы быстрого поиска ячеек по артикулу (/lookup) в памяти процесса:
+# товары хранятся SLOT_CACHE_TTL секунд, остатки - TOCKA_LOOKUP_TTL секунд
+# (остатки из свежего зеркала остатков читаются напрямую, без этого кэша)
+LOOKUP_STOCK_TTL = float(os.environ.get("TOCKA_LOOKUP_TTL", "30"))
+LOOKUP_MAX_ARTICLES = 500
+_lookup_products = {}  # артикул -> (когда загружен, uuid, название); uuid None - товара нет
+_lookup_stock = {}     # uuid -> (когда загружен, строки отчёта по ячейкам всех складов)
+_lookup_stores = {}    # склады -> (отметки загрузки ячеек, результат load_stores)
+_lookup_lock = threading.Lock()
+
+# Индекс стикеров по TOCKA_STICKER_REPORTS последним отчётам (/sticker/<код>)
+STICKER_INDEX_REPORTS = int(os.environ.get("TOCKA_STICKER_REPORTS", "20"))
+_sticker_index = None
+_sticker_index_lock = threading.Lock()
+
+# Блокировки выгрузки отчёта в другой формат при скачивании: путь -> Lock
+_export_locks = {}
+_export_locks_lock = threading.Lock()
+
+# Глобальные переменные для отслеживания состояния процессов.
+# При запуске через serve.py (несколько процессов) хранятся в общей базе SQLite,
+# чтобы любой воркер мог ответить на /status и /cancel для любой задачи.
+progress = make_state('progress')              # Прогресс обработки файлов
+cancel_flags = make_state('cancel_flags')      # Флаги для отмены процессов
+order_progress = make_state('order_progress')  # Прогресс создания заказов
+phase_timings = make_state('phase_timings')    # Время этапов: {session_id: {этап: секунды}}
+open_waves = make_state('waves')               # 'open': {session_id: {'inputs', 'deadline'}}
 
 # HTML шаблон для заголовка страниц с навигацией и JavaScript функциональностью
 HEADER_HTML = '''
@@ -155,7 +270,8 @@ def clean_old_results(max_files=50):
     Удаляет старые файлы в папке results, если их больше max_files.
     
     Функция поддерживает порядок в папке результатов, удаляя самые старые файлы
-    и оставляя только последние max_files файлов.
+    и оставляя только последние max_files отчётов. Отчёт - все его форматы
+    (xlsx, csv, json, parquet) и метаданные; они удаляются вместе.
     
     Args:
         max_files (int): Максимальное количество файлов для хранения (по умолчанию 50)
@@ -163,39 +279,301 @@ def clean_old_results(max_files=50):
     Returns:
         None
     """
-    files = [os.path.join(RESULT_FOLDER, f) for f in os.listdir(RESULT_FOLDER) if f.endswith('.xlsx')]
-    files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
-    for f in files[max_files:]:
+    # Отчёт определяется файлом метаданных: он общий для всех форматов
+    reports = {}
+    for f in os.listdir(RESULT_FOLDER):
+        ext = os.path.splitext(f)[1]
+        if f.endswith('.meta.json') or ext.lstrip('.') not in EXPORT_FORMATS:
+            continue
+        path = os.path.join(RESULT_FOLDER, f)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        meta_path = report_meta_path(path)
+        reports[meta_path] = max(reports.get(meta_path, 0), mtime)
+    newest = sorted(reports, key=reports.get, reverse=True)
+    for meta_path in newest[max_files:]:
+        base = meta_path[:-len('.meta.json')]
+        for path in [base + '.' + fmt for fmt in EXPORT_FORMATS] + [meta_path]:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except Exception:
+                pass
+
+def moysklad_now():
+    """
+    Возвращает текущее время в формате фильтров МойСклад (московское время).
+
+    Returns:
+        str: Время вида "2024-07-13 12:45:29"
+    """
+    return datetime.now(MOYSKLAD_TZ).strftime("%Y-%m-%d %H:%M:%S")
+
+def report_meta_path(report_path):
+    """
+    Возвращает путь к файлу метаданных отчёта (лежит рядом с .xlsx).
+
+    Args:
+        report_path (str): Путь к файлу отчёта
+
+    Returns:
+        str: Путь вида results/result_<session_id>.meta.json
+    """
+    return os.path.splitext(report_path)[0] + '.meta.json'
+
+def save_report_meta(report_path, meta):
+    """
+    Сохраняет метаданные отчёта: сопоставление артикулов с UUID, названия ячеек
+    и момент, на который были получены остатки.
+
+    Метаданные позволяют обновить остатки в готовом отчёте без повторного
+    поиска товаров и без полного пересчёта файла.
+
+    Args:
+        report_path (str): Путь к файлу отчёта
+        meta (dict): Метаданные для сохранения
+
+    Returns:
+        None
+    """
+    try:
+        with open(report_meta_path(report_path), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"Не удалось сохранить метаданные отчёта {report_path}: {e}", flush=True)
+
+def load_report_meta(report_path):
+    """
+    Загружает метаданные отчёта, сохранённые save_report_meta.
+
+    Args:
+        report_path (str): Путь к файлу отчёта
+
+    Returns:
+        dict or None: Метаданные или None, если их нет
+    """
+    try:
+        with open(report_meta_path(report_path), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Число запросов к API из текущего потока (см. api_pause)
+_thread_api = threading.local()
+
+def thread_api_calls():
+    """Сколько запросов к API выполнил текущий поток."""
+    return getattr(_thread_api, 'calls', 0)
+
+def api_pause(calls_before, delay):
+    """
+    Пауза между запросами к API без ограничителя.
+
+    Нужна, только если поток действительно обращался к API после отметки
+    calls_before (ответ из кэша или зеркала не ждёт) и api_limiter не задан:
+    с ограничителем темп запросов задаёт он.
+
+    Args:
+        calls_before (int): thread_api_calls() до обработки
+        delay (float): Пауза в секундах
+    """
+    if api_limiter is None and thread_api_calls() > calls_before:
+        time.sleep(delay)
+
+def moysklad_request(method, url, **kwargs):
+    """
+    Выполняет запрос к API МойСклад и учитывает его в метриках.
+
+    Замеряет длительность запроса и статус ответа (в том числе 429)
+    для эндпоинта /metrics. Если задан api_limiter, запрос ждёт своей
+    очереди. Ответ возвращается как есть, проверку статуса выполняет
+    вызывающий код.
+
+    Args:
+        method (str): HTTP метод ('GET', 'POST')
+        url (str): Полный адрес ресурса API
+        **kwargs: Параметры requests.request (params, json, timeout)
+
+    Returns:
+        requests.Response: Ответ API
+
+    Raises:
+        requests.exceptions.RequestException: При сетевой ошибке
+    """
+    endpoint = API_ID_RE.sub('{id}', url[len(BASE_URL):].strip('/'))
+    limiter = api_limiter
+    if limiter is not None:
+        limiter.acquire()
+    _thread_api.calls = thread_api_calls() + 1
+    started = time.perf_counter()
+    try:
+        resp = requests.request(method, url, headers=HEADERS, **kwargs)
+    except requests.exceptions.RequestException:
+        metrics.observe_api_call(endpoint, time.perf_counter() - started, 'error')
+        raise
+    finally:
+        if limiter is not None:
+            limiter.release()
+    metrics.observe_api_call(endpoint, time.perf_counter() - started, resp.status_code)
+    return resp
+
+def fetch_products_page(params):
+    """
+    Получает страницу ассортимента (/entity/assortment: товары, модификации,
+    комплекты, услуги) для синхронизации зеркала каталога.
+
+    Args:
+        params (dict): Параметры запроса (limit, offset, filter)
+
+    Returns:
+        dict: Ответ API (meta, rows)
+
+    Raises:
+        requests.exceptions.HTTPError: При ошибке API запроса
+    """
+    resp = moysklad_request('GET', f"{BASE_URL}/entity/assortment", params=params)
+    resp.raise_for_status()
+    return resp.json()
+
+def get_catalog():
+    """
+    Возвращает зеркало каталога товаров и при первом вызове запускает его
+    фоновую синхронизацию.
+
+    Returns:
+        CatalogMirror or None: Зеркало или None, если оно выключено (TOCKA_CATALOG_SYNC=0)
+                               или база недоступна
+    """
+    global _catalog
+    if CATALOG_SYNC_INTERVAL <= 0:
+        return None
+    with _catalog_lock:
+        if _catalog is None:
+            try:
+                mirror = CatalogMirror(CATALOG_DB)
+            except sqlite3.Error as e:
+                print(f"Зеркало каталога недоступно ({CATALOG_DB}): {e}", flush=True)
+                _catalog = False
+                return None
+            CatalogSync(mirror, fetch_products_page, moysklad_now, CATALOG_SYNC_INTERVAL).start()
+            _catalog = mirror
+        return _catalog or None
+
+def find_assortment(article):
+    """
+    Ищет позицию ассортимента по артикулу: сначала в зеркале каталога, затем
+    через /entity/assortment.
+
+    Ассортимент - это товары, модификации, комплекты и услуги, поэтому
+    модификации и комплекты находятся с первого раза, а вместе с позицией
+    известен её тип (meta.type) для ссылок в документах (assortment_meta).
+    У модификации нет своего артикула: если по артикулу ничего не найдено,
+    вторым запросом ищется позиция с таким кодом. Если не найден полностью
+    кириллический артикул из букв-двойников ('СМ-500'), так же ищется его
+    латинский вариант ('CM-500', см. normalize.lookalike_variant).
+
+    Найденная через API позиция добавляется в зеркало, чтобы не дожидаться
+    очередной синхронизации.
+
+    Args:
+        article (str): Артикул (или код модификации)
+
+    Returns:
+        tuple: (uuid, name, тип) или (None, None, None), если позиция не найдена
+
+    Raises:
+        requests.exceptions.HTTPError: При ошибке API запроса
+    """
+    found = _find_assortment(article)
+    if found[0] is None:
+        variant = lookalike_variant(article)
+        if variant:
+            found = _find_assortment(variant)
+    return found
+
+def _find_assortment(article):
+    """Поиск find_assortment для одного написания артикула."""
+    catalog = get_catalog()
+    if catalog is not None:
+        try:
+            found = catalog.lookup(article)
+        except sqlite3.Error as e:
+            print(f"Ошибка чтения зеркала каталога: {e}", flush=True)
+            found = None
+        metrics.record_cache('catalog', found is not None)
+        if found is not None:
+            return found
+
+    url = f"{BASE_URL}/entity/assortment"
+    rows = []
+    for field in ('article', 'code'):
+        resp = moysklad_request('GET', url, params={"filter": f"{field}={article}", "limit": 1})
+        resp.raise_for_status()
+        rows = resp.json().get('rows', [])
+        if rows:
+            break
+    if not rows:
+        return None, None, None
+    if catalog is not None:
         try:
-            os.remove(f)
-        except Exception:
-            pass
+            catalog.upsert(rows[:1])
+        except sqlite3.Error as e:
+            print(f"Ошибка записи в зеркало каталога: {e}", flush=True)
+    return rows[0]['id'], rows[0].get('name', ''), entity_type(rows[0])
+
+def find_product(article):
+    """
+    Ищет позицию ассортимента по артикулу (find_assortment).
+
+    Args:
+        article (str): Артикул товара
+
+    Returns:
+        tuple: (uuid, name) или (None, None), если товар не найден
+
+    Raises:
+        requests.exceptions.HTTPError: При ошибке API запроса
+    """
+    return find_assortment(article)[:2]
+
+def assortment_meta(uuid, kind):
+    """
+    Ссылка на позицию ассортимента для документов МойСклад.
+
+    Args:
+        uuid (str): UUID позиции
+        kind (str): Тип позиции (product, variant, bundle, service)
+
+    Returns:
+        dict: {'href', 'type', 'mediaType'}
+    """
+    return {
+        "href": f"{BASE_URL}/entity/{kind}/{uuid}",
+        "type": kind,
+        "mediaType": "application/json"
+    }
 
-def get_product_uuid_for_order(article):
+def get_assortment_meta_for_order(article):
     """
-    Получает UUID товара по артикулу для создания заказа.
+    Получает ссылку на позицию ассортимента по артикулу для создания заказа.
     
-    Функция выполняет запрос к API МойСклад для поиска товара по артикулу
-    и возвращает его UUID, необходимый для создания заказа.
+    Функция ищет позицию в зеркале каталога, а если её там нет - через API
+    МойСклад (find_assortment), и возвращает meta позиции заказа с верным
+    типом: товар, модификация или комплект.
     
     Args:
         article (str): Артикул товара для поиска
         
     Returns:
-        str or None: UUID товара или None если товар не найден
+        dict or None: meta позиции (assortment_meta) или None если товар не найден
         
     Raises:
         requests.exceptions.HTTPError: При ошибке API запроса
     """
-    url = "https://api.moysklad.ru/api/remap/1.2/entity/product"
-    params = {"filter": f"article={article}", "limit": 1}
-    resp = requests.get(url, headers=HEADERS, params=params)
-    resp.raise_for_status()
-    data = resp.json()
-    rows = data.get('rows', [])
-    if not rows:
-        return None
-    return rows[0]['id']
+    uuid, _, kind = find_assortment(article)
+    return assortment_meta(uuid, kind) if uuid else None
 
 def create_customer_order_from_file(filepath, session_id):
     """
@@ -220,7 +598,10 @@ def create_customer_order_from_file(filepath, session_id):
         - total_items (int): Общее количество товаров в файле
         - not_found_articles (list): Список не найденных артикулов (если есть)
         - error (str): Сообщение об ошибке (если success=False)
+
+    Время этапов записывается в phase_timings[session_id] и в метрики.
     """
+    timer = metrics.PhaseTimer('order', phase_timings, session_id)
     try:
         order_progress[session_id] = "🔄 Начинаем создание заказа..."
         print(f"[ORDER {session_id}] Начинаем создание заказа из файла: {filepath}", flush=True)
@@ -230,9 +611,10 @@ def create_customer_order_from_file(filepath, session_id):
             return {"error": "Создание заказа отменено пользователем"}
         
         # Читаем Excel файл
+        timer.start('read')
         order_progress[session_id] = "📖 Читаем Excel файл..."
         print(f"[ORDER {session_id}] Читаем файл...", flush=True)
-        df = pd.read_excel(filepath)
+        df = read_table(filepath)
         print(f"[ORDER {session_id}] Файл прочитан, строк: {len(df)}", flush=True)
         
         if cancel_flags.get(f"order_{session_id}"):
@@ -240,6 +622,7 @@ def create_customer_order_from_file(filepath, session_id):
             return {"error": "Создание заказа отменено пользователем"}
         
         # Проверяем наличие необходимых колонок
+        timer.start('validate')
         order_progress[session_id] = "🔍 Проверяем колонки файла..."
         print(f"[ORDER {session_id}] Колонки в файле: {list(df.columns)}", flush=True)
         required_columns = ['Артикул', 'Количество']
@@ -275,9 +658,12 @@ def create_customer_order_from_file(filepath, session_id):
             return {"error": error_msg}
         
         # Получаем UUID для всех товаров
+        timer.start('lookups')
         order_progress[session_id] = f"🔍 Ищем товары в МойСклад... (0/{len(valid_rows)})"
         positions = []
         not_found_articles = []
+        # Каждый артикул ищется один раз: повторные строки берут найденное
+        product_metas = {}
         
         for i, item in enumerate(valid_rows):
             if cancel_flags.get(f"order_{session_id}"):
@@ -285,34 +671,34 @@ def create_customer_order_from_file(filepath, session_id):
                 return {"error": "Создание заказа отменено пользователем"}
                 
             order_progress[session_id] = f"🔍 Ищем товары в МойСклад... ({i+1}/{len(valid_rows)}) - {item['article']}"
-            print(f"[ORDER {session_id}] Ищем товар {i+1}/{len(valid_rows)}: {item['article']}", flush=True)
-            
-            try:
-                product_uuid = get_product_uuid_for_order(item['article'])
-                if product_uuid:
-                    positions.append({
-                        "assortment": {
-                            "meta": {
-                                "href": f"https://api.moysklad.ru/api/remap/1.2/entity/product/{product_uuid}",
-                                "type": "product"
-                            }
-                        },
-                        "quantity": item['quantity'],
-                        "price": 0,
-                        "vat": 20,
-                        "vatEnabled": True,
-                        "discount": 0,
-                        "reserve": 0
-                    })
-                    print(f"[ORDER {session_id}] ✅ Найден: {item['article']} -> {product_uuid}", flush=True)
-                else:
+            if item['article'] not in product_metas:
+                print(f"[ORDER {session_id}] Ищем товар {i+1}/{len(valid_rows)}: {item['article']}", flush=True)
+                calls_before = thread_api_calls()
+                try:
+                    product_metas[item['article']] = get_assortment_meta_for_order(item['article'])
+                    if not product_metas[item['article']]:
+                        not_found_articles.append(item['article'])
+                        print(f"[ORDER {session_id}] ❌ НЕ найден: {item['article']}", flush=True)
+                except Exception as e:
+                    product_metas[item['article']] = None
                     not_found_articles.append(item['article'])
-                    print(f"[ORDER {session_id}] ❌ НЕ найден: {item['article']}", flush=True)
-            except Exception as e:
-                not_found_articles.append(item['article'])
-                print(f"[ORDER {session_id}] ❌ Ошибка поиска {item['article']}: {e}", flush=True)
+                    print(f"[ORDER {session_id}] ❌ Ошибка поиска {item['article']}: {e}", flush=True)
+                api_pause(calls_before, 0.1)
             
-            time.sleep(0.1)
+            product_meta = product_metas[item['article']]
+            if product_meta:
+                positions.append({
+                    "assortment": {
+                        "meta": product_meta
+                    },
+                    "quantity": item['quantity'],
+                    "price": 0,
+                    "vat": 20,
+                    "vatEnabled": True,
+                    "discount": 0,
+                    "reserve": 0
+                })
+                print(f"[ORDER {session_id}] ✅ Найден: {item['article']} -> {product_meta['type']} {product_meta['href']}", flush=True)
         
         if cancel_flags.get(f"order_{session_id}"):
             order_progress[session_id] = "❌ Создание заказа отменено пользователем"
@@ -327,8 +713,9 @@ def create_customer_order_from_file(filepath, session_id):
         print(f"[ORDER {session_id}] Найдено товаров: {len(positions)}, не найдено: {len(not_found_articles)}", flush=True)
         
         # Создаем заказ
+        timer.start('create')
         order_progress[session_id] = "📝 Создаем заказ в МойСклад..."
-        url = "https://api.moysklad.ru/api/remap/1.2/entity/customerorder"
+        url = f"{BASE_URL}/entity/customerorder"
         now_iso = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
         
         order_body = {
@@ -336,31 +723,31 @@ def create_customer_order_from_file(filepath, session_id):
             "moment": now_iso,
             "organization": {
                 "meta": {
-                    "href": f"https://api.moysklad.ru/api/remap/1.2/entity/organization/{ORGANIZATION_UUID}",
+                    "href": f"{BASE_URL}/entity/organization/{ORGANIZATION_UUID}",
                     "type": "organization"
                 }
             },
             "agent": {
                 "meta": {
-                    "href": f"https://api.moysklad.ru/api/remap/1.2/entity/counterparty/{COUNTERPARTY_UUID}",
+                    "href": f"{BASE_URL}/entity/counterparty/{COUNTERPARTY_UUID}",
                     "type": "counterparty"
                 }
             },
             "store": {
                 "meta": {
-                    "href": f"https://api.moysklad.ru/api/remap/1.2/entity/store/{STORE_UUID}",
+                    "href": f"{BASE_URL}/entity/store/{STORE_UUID}",
                     "type": "store"
                 }
             },
             "project": {
                 "meta": {
-                    "href": f"https://api.moysklad.ru/api/remap/1.2/entity/project/{PROJECT_UUID}",
+                    "href": f"{BASE_URL}/entity/project/{PROJECT_UUID}",
                     "type": "project"
                 }
             },
             "currency": {
                 "meta": {
-                    "href": "https://api.moysklad.ru/api/remap/1.2/entity/currency/643",
+                    "href": f"{BASE_URL}/entity/currency/643",
                     "type": "currency"
                 }
             },
@@ -375,7 +762,7 @@ def create_customer_order_from_file(filepath, session_id):
             order_progress[session_id] = "❌ Создание заказа отменено пользователем"
             return {"error": "Создание заказа отменено пользователем"}
         
-        resp = requests.post(url, headers=HEADERS, json=order_body, timeout=30)
+        resp = moysklad_request('POST', url, json=order_body, timeout=30)
         print(f"[ORDER {session_id}] Ответ сервера: статус {resp.status_code}", flush=True)
         
         resp.raise_for_status()
@@ -411,6 +798,8 @@ def create_customer_order_from_file(filepath, session_id):
         order_progress[session_id] = f"❌ {error_msg}"
         print(f"[ORDER {session_id}] ОБЩАЯ ОШИБКА: {error_msg}", flush=True)
         return {"error": error_msg}
+    finally:
+        timer.stop()
 
 def get_recent_files(count=10):
     """
@@ -430,6 +819,7 @@ def get_recent_files(count=10):
             - size (int): Размер файла в байтах
             - formatted_time (str): Отформатированное время
             - formatted_size (str): Отформатированный размер (KB/MB)
+            - refreshable (bool): Можно ли обновить остатки в отчёте
     """
     if not os.path.exists(RESULT_FOLDER):
         return []
@@ -447,7 +837,8 @@ def get_recent_files(count=10):
                     'mtime': mtime,
                     'size': size,
                     'formatted_time': time.strftime('%d.%m.%Y %H:%M:%S', time.localtime(mtime)),
-                    'formatted_size': f"{size / 1024:.1f} KB" if size < 1024*1024 else f"{size / (1024*1024):.1f} MB"
+                    'formatted_size': f"{size / 1024:.1f} KB" if size < 1024*1024 else f"{size / (1024*1024):.1f} MB",
+                    'refreshable': os.path.exists(report_meta_path(filepath))
                 })
             except OSError:
                 continue
@@ -508,8 +899,8 @@ def get_product_uuid(article):
     """
     Получает UUID и название товара по артикулу.
     
-    Функция выполняет запрос к API МойСклад для поиска товара по артикулу
-    и возвращает его UUID и название.
+    Функция ищет товар по артикулу (кэш пакетной обработки, зеркало каталога,
+    API МойСклад - см. find_product) и возвращает его UUID и название.
     
     Args:
         article (str): Артикул товара для поиска
@@ -520,23 +911,48 @@ def get_product_uuid(article):
     Raises:
         requests.exceptions.HTTPError: При ошибке API запроса
     """
-    url = "https://api.moysklad.ru/api/remap/1.2/entity/product"
-    params = {"filter": f"article={article}", "limit": 1}
-    resp = requests.get(url, headers=HEADERS, params=params)
-    resp.raise_for_status()
-    data = resp.json()
-    rows = data.get('rows', [])
-    if not rows:
-        return None, None
-    row = rows[0]
-    return row['id'], row.get('name', '')
+    cache = _product_cache
+    if cache is not None:
+        with _product_cache_lock:
+            cached = cache.get(article)
+        metrics.record_cache('product', cached is not None)
+        if cached is not None:
+            return cached
+
+    result = find_product(article)
+    if cache is not None:
+        with _product_cache_lock:
+            cache[article] = result
+    return result
+
+def configure_batch(rate=API_RATE, window=API_WINDOW, parallel=API_PARALLEL):
+    """
+    Настраивает модуль для пакетной обработки нескольких файлов в одном процессе.
+
+    Включает общий кэш поиска товаров и общий ограничитель запросов к API
+    для всех файлов прогона.
+
+    Args:
+        rate (int): Запросов к API за window секунд (0 - без ограничения)
+        window (float): Окно ограничения в секундах
+        parallel (int): Одновременных запросов к API (0 - без ограничения)
+
+    Returns:
+        RateLimiter or None: Установленный ограничитель
+    """
+    global _product_cache, api_limiter
+    _product_cache = {}
+    api_limiter = RateLimiter(rate, window, parallel) if rate or parallel else None
+    return api_limiter
 
 def get_store_slots(store_id):
     """
     Получает список ячеек склада из МойСклад.
     
     Функция запрашивает все ячейки склада и возвращает словарь
-    с соответствием ID ячейки и её названия.
+    с соответствием ID ячейки и её названия. Ячейки кэшируются на
+    SLOT_CACHE_TTL секунд; при каждом обновлении кэша заново строится
+    индекс порядка обхода ячеек (см. get_slot_order).
     
     Args:
         store_id (str): UUID склада в МойСклад
@@ -547,22 +963,200 @@ def get_store_slots(store_id):
     Raises:
         requests.exceptions.HTTPError: При ошибке API запроса
     """
-    url = f"https://api.moysklad.ru/api/remap/1.2/entity/store/{store_id}/slots"
-    resp = requests.get(url, headers=HEADERS, params={"limit":1000})
+    return _load_store_slots(store_id)['names']
+
+def get_slot_order(store_id):
+    """
+    Возвращает индекс порядка обхода ячеек склада (естественная сортировка названий).
+
+    Args:
+        store_id (str): UUID склада в МойСклад
+
+    Returns:
+        dict: {slot_id: позиция в порядке обхода}
+    """
+    return _load_store_slots(store_id)['order']
+
+def _load_store_slots(store_id):
+    with _slot_cache_lock:
+        cached = _slot_cache.get(store_id)
+    fresh = cached is not None and time.time() - cached['loaded'] < SLOT_CACHE_TTL
+    metrics.record_cache('store_slots', fresh)
+    if fresh:
+        return cached
+
+    # Запросы выполняются без блокировки, чтобы склады загружались параллельно
+    url = f"{BASE_URL}/entity/store/{store_id}/slots"
+    resp = moysklad_request('GET', url, params={"limit":1000})
     resp.raise_for_status()
     data = resp.json()
-    return {row['id']: row['name'] for row in data.get('rows', [])}
+    names = {row['id']: row['name'] for row in data.get('rows', [])}
+    try:
+        resp = moysklad_request('GET', f"{BASE_URL}/entity/store/{store_id}")
+        resp.raise_for_status()
+        store_name = resp.json().get('name') or store_id[:8]
+    except Exception as e:
+        print(f"Не удалось получить название склада {store_id}: {e}", flush=True)
+        store_name = store_id[:8]
+    cached = {
+        'loaded': time.time(),
+        'name': store_name,
+        'names': names,
+        'order': build_slot_order(names)
+    }
+    with _slot_cache_lock:
+        _slot_cache[store_id] = cached
+    return cached
+
+def load_stores(store_ids):
+    """
+    Загружает ячейки нескольких складов параллельно и объединяет их.
+
+    Ячейки разных складов имеют разные UUID, поэтому общий индекс остатков
+    по ключу (склад, ячейка) хранится как {slot_id: ...} вместе со
+    словарём slot_store. Если складов несколько, к названию ячейки
+    добавляется название склада ("Склад 2: A-01"). Порядок обхода: склады
+    в порядке store_ids, внутри склада - естественный порядок ячеек.
+
+    Args:
+        store_ids (list): UUID складов (первый - основной)
+
+    Returns:
+        dict: {
+            'store_ids': склады,
+            'store_names': {store_id: название},
+            'slot_names': {slot_id: название ячейки},
+            'slot_order': {slot_id: позиция в порядке обхода},
+            'slot_store': {slot_id: store_id}
+        }
+    """
+    with ThreadPoolExecutor(max_workers=max(len(store_ids), 1)) as executor:
+        caches = list(executor.map(_load_store_slots, store_ids))
+
+    multi_store = len(store_ids) > 1
+    stores = {'store_ids': list(store_ids), 'store_names': {}, 'slot_names': {}, 'slot_order': {}, 'slot_store': {}}
+    for store_id, cached in zip(store_ids, caches):
+        stores['store_names'][store_id] = cached['name']
+        offset = len(stores['slot_order'])
+        for slot_id, name in cached['names'].items():
+            stores['slot_names'][slot_id] = f"{cached['name']}: {name}" if multi_store else name
+            stores['slot_store'][slot_id] = store_id
+            stores['slot_order'][slot_id] = offset + cached['order'][slot_id]
+    return stores
+
+def fetch_all_stock():
+    """
+    Получает отчёт по ячейкам по всем товарам и складам (полная сверка зеркала остатков).
+
+    Returns:
+        list: Строки отчёта (assortmentId, storeId, slotId, stock)
+    """
+    resp = moysklad_request('GET', f"{BASE_URL}/report/stock/byslot/current")
+    resp.raise_for_status()
+    return resp.json()
+
+def fetch_stock_for(product_ids, chunk=100):
+    """
+    Получает отчёт по ячейкам для списка товаров (по chunk товаров в запросе).
+
+    Args:
+        product_ids (list): UUID товаров
+        chunk (int): Товаров в одном запросе
+
+    Returns:
+        list: Строки отчёта (assortmentId, storeId, slotId, stock)
+    """
+    rows = []
+    for i in range(0, len(product_ids), chunk):
+        part = ";".join(f"assortmentId={pid}" for pid in product_ids[i:i + chunk])
+        resp = moysklad_request('GET', f"{BASE_URL}/report/stock/byslot/current", params={"filter": part})
+        resp.raise_for_status()
+        rows.extend(resp.json())
+    return rows
+
+def fetch_document_positions(href):
+    """
+    Получает позиции документа (отгрузки, перемещения, приёмки, инвентаризации).
+
+    Args:
+        href (str): meta.href документа из вебхука
+
+    Returns:
+        list: Позиции документа (assortment.meta.href - товар)
+
+    Raises:
+        ValueError: Если ссылка не ведёт на документ API МойСклад (BASE_URL)
+    """
+    if not href.startswith(f"{BASE_URL}/entity/"):
+        raise ValueError(f"Ссылка не на документ МойСклад: {href}")
+    resp = moysklad_request('GET', f"{href.split('?', 1)[0].rstrip('/')}/positions", params={"limit": 1000})
+    resp.raise_for_status()
+    return resp.json().get('rows', [])
+
+def get_stock_mirror():
+    """
+    Возвращает зеркало остатков и при первом вызове запускает его сверку
+    и обработчик вебхуков.
+
+    Returns:
+        tuple: (StockMirror, StockWebhookWorker) или (None, None), если зеркало
+               выключено (TOCKA_STOCK_RECONCILE=0) или база недоступна
+    """
+    global _stock_mirror, _stock_webhooks
+    if STOCK_RECONCILE_INTERVAL <= 0:
+        return None, None
+    with _stock_mirror_lock:
+        if _stock_mirror is None:
+            try:
+                mirror = StockMirror(STOCK_DB)
+            except sqlite3.Error as e:
+                print(f"Зеркало остатков недоступно ({STOCK_DB}): {e}", flush=True)
+                _stock_mirror = False
+                return None, None
+            reconcile = StockReconcile(mirror, fetch_all_stock, STOCK_RECONCILE_INTERVAL)
+            reconcile.start()
+            _stock_webhooks = StockWebhookWorker(mirror, fetch_document_positions, fetch_stock_for, reconcile,
+                                                 base_url=BASE_URL)
+            if not WEBHOOK_TOKEN:
+                print("TOCKA_WEBHOOK_TOKEN не задан: вебхуки МойСклад не принимаются, "
+                      "зеркало остатков обновляется только сверкой", flush=True)
+            _stock_webhooks.start()
+            _stock_mirror = mirror
+        if not _stock_mirror:
+            return None, None
+        return _stock_mirror, _stock_webhooks
+
+def register_stock_webhooks(url):
+    """
+    Регистрирует в МойСклад вебхуки на документы, меняющие остатки.
+
+    Args:
+        url (str): Публичный адрес /webhook/moysklad (с ?token=..., если задан TOCKA_WEBHOOK_TOKEN)
+
+    Returns:
+        int: Зарегистрировано вебхуков
+    """
+    count = 0
+    for entity_type in STOCK_DOCUMENT_TYPES:
+        for action in ('CREATE', 'UPDATE', 'DELETE'):
+            resp = moysklad_request('POST', f"{BASE_URL}/entity/webhook",
+                                    json={"url": url, "action": action, "entityType": entity_type})
+            resp.raise_for_status()
+            count += 1
+    return count
 
 def get_stock_by_slot(product_uuid, store_id):
     """
     Получает остатки товара по ячейкам склада.
     
     Функция запрашивает текущие остатки товара в конкретном складе,
-    разбитые по ячейкам (слотам).
+    разбитые по ячейкам (слотам). Без store_id возвращаются остатки
+    по ячейкам всех складов одним запросом. Если включено зеркало
+    остатков и оно сверено недавно, остатки читаются из него без запроса.
     
     Args:
         product_uuid (str): UUID товара в МойСклад
-        store_id (str): UUID склада
+        store_id (str): UUID склада или None для всех складов
         
     Returns:
         dict: JSON ответ от API с данными об остатках по ячейкам
@@ -570,17 +1164,49 @@ def get_stock_by_slot(product_uuid, store_id):
     Raises:
         requests.exceptions.HTTPError: При ошибке API запроса
     """
-    url = "https://api.moysklad.ru/api/remap/1.2/report/stock/byslot/current"
+    mirror, _ = get_stock_mirror()
+    if mirror is not None:
+        fresh = mirror.is_fresh(STOCK_MIRROR_MAX_AGE)
+        metrics.record_cache('stock_mirror', fresh)
+        if fresh:
+            return mirror.rows(product_uuid, store_id)
+
+    url = f"{BASE_URL}/report/stock/byslot/current"
+    params = [('filter', f"assortmentId={product_uuid}")]
+    if store_id:
+        params.append(('filter', f"storeId={store_id}"))
+    params.append(('limit','1000'))
+    resp = moysklad_request('GET', url, params=params)
+    resp.raise_for_status()
+    return resp.json()
+
+def get_changed_assortments(store_id, changed_since):
+    """
+    Возвращает UUID товаров, остатки которых на складе менялись с указанного момента.
+
+    Использует отчёт Остатки по складам с параметром changedSince, который
+    возвращает только изменившиеся позиции.
+
+    Args:
+        store_id (str): UUID склада
+        changed_since (str): Момент в формате "YYYY-MM-DD HH:MM:SS" (московское время)
+
+    Returns:
+        set: Множество UUID товаров с изменившимися остатками
+
+    Raises:
+        requests.exceptions.HTTPError: При ошибке API запроса
+    """
+    url = f"{BASE_URL}/report/stock/bystore/current"
     params = [
-        ('filter', f"assortmentId={product_uuid}"),
-        ('filter', f"storeId={store_id}"),
-        ('limit','1000')
+        ('changedSince', changed_since),
+        ('filter', f"storeId={store_id}")
     ]
-    resp = requests.get(url, headers=HEADERS, params=params)
+    resp = moysklad_request('GET', url, params=params)
     resp.raise_for_status()
-    return resp.json()
+    return {row['assortmentId'] for row in resp.json() if row.get('assortmentId')}
 
-def process_article(article, slot_names):
+def process_article(article, slot_names, store_id=STORE_ID):
     """
     Обрабатывает один артикул товара для получения информации о ячейках.
     
@@ -592,86 +1218,207 @@ def process_article(article, slot_names):
     Args:
         article: Артикул товара для обработки
         slot_names (dict): Словарь соответствия ID ячеек и их названий
+        store_id (str): UUID склада; None - все склады одним запросом, в расчёт
+                        берутся только ячейки из slot_names
         
     Returns:
-        tuple: (article, name, slots_text) - артикул, название, информация о ячейках
-               или (None, None, "") при ошибке или отмене
-        
+        tuple: (article, name, slots_text, uuid, slots) - артикул, название, информация
+               о ячейках, UUID товара и остатки по ячейкам [(slot_id, количество), ...],
+               или (None, None, "", None, []) при ошибке или отмене
+
     Примечание:
         Функция используется в многопоточной обработке и проверяет флаги отмены
     """
     session_id = threading.current_thread().name
     article = str(article).strip()
     if not article or cancel_flags.get(session_id):
-        return None, None, ""
+        return None, None, "", None, []
+    calls_before = thread_api_calls()
     try:
         uuid, name = get_product_uuid(article)
         if not uuid:
-            return None, None, ""
-        rows = get_stock_by_slot(uuid, STORE_ID)
-        parts = []
-        for entry in rows:
-            if cancel_flags.get(session_id):
-                break
-            slot_id = entry.get('slotId')
-            qty = entry.get('stock', 0)
-            if slot_id and qty > 0:
-                parts.append(f"{slot_names.get(slot_id, slot_id)} - {int(qty)} шт")
-        time.sleep(0.05)  # Небольшая задержка для избежания перегрузки API
-        return article, name, ", ".join(parts)
+            return None, None, "", None, []
+        rows = get_stock_by_slot(uuid, store_id)
+        if store_id is None:
+            rows = [entry for entry in rows if entry.get('slotId') in slot_names]
+        slots_text = format_slot_stock(rows, slot_names)
+        slots = [(entry['slotId'], entry.get('stock', 0)) for entry in rows
+                 if entry.get('slotId') and entry.get('stock', 0) > 0]
+        api_pause(calls_before, 0.05)  # Небольшая задержка для избежания перегрузки API
+        return article, name, slots_text, uuid, slots
     except Exception as e:
         print(f"Ошибка для артикула {article}: {e}", flush=True)
-        return None, None, ""
+        return None, None, "", None, []
 
-def format_sticker_cell(cell):
+def format_slot_stock(rows, slot_names):
     """
-    Форматирует ячейку с номером стикера в Excel файле.
-    
-    Функция применяет специальное форматирование к ячейкам с номерами стикеров:
-    - Делает шрифт жирным и увеличивает размер
-    - Для номеров длиной 4+ символов добавляет пробел перед последними 4 символами
-    - Обрабатывает специальные случаи (например, "*")
-    
+    Формирует текст для колонки 'Ячейки склада' из отчёта остатков по ячейкам.
+
     Args:
-        cell: Объект ячейки openpyxl для форматирования
-        
+        rows (list): Записи отчёта Остатки по ячейкам (slotId, stock)
+        slot_names (dict): Словарь соответствия ID ячеек и их названий
+
     Returns:
-        None: Изменения применяются к ячейке напрямую
-        
-    Пример:
-        "ABC1234567" -> "ABC123 4567" (жирным шрифтом)
-        "*" -> "*" (жирным шрифтом, увеличенный размер)
+        str: Строка вида "A-01 - 3 шт, B-02 - 1 шт"
     """
-    try:
-        value = str(cell.value) if cell.value else ""
-        if value == "*":
-            cell.font = cell.font.copy(bold=True, size=cell.font.size + 1)
-            return
-        
-        if len(value) < 4:
-            return
-        main_part = value[:-4].rstrip()
-        last_four = value[-4:]
-        cell.value = f"{main_part} {last_four}"
-        cell.font = cell.font.copy(bold=True, size=cell.font.size + 1)
-    except Exception as e:
-        print(f"Ошибка форматирования ячейки: {e}", flush=True)
+    parts = []
+    for entry in rows:
+        slot_id = entry.get('slotId')
+        qty = entry.get('stock', 0)
+        if slot_id and qty > 0:
+            parts.append(f"{slot_names.get(slot_id, slot_id)} - {int(qty)} шт")
+    return ", ".join(parts)
 
-def save_workbook_with_retries(wb, filename, session_id, retries=5, delay=3):
+def _lookup_cached(index, key, ttl):
+    """Запись индекса поиска без метки времени или None, если её нет или она устарела."""
+    with _lookup_lock:
+        entry = index.get(key)
+    if entry is not None and time.time() - entry[0] < ttl:
+        return entry[1:]
+    return None
+
+def lookup_stores(store_ids):
     """
-    Сохраняет workbook с повторными попытками при ошибках.
-    
-    Функция пытается сохранить Excel файл с повторными попытками,
-    обрабатывая возможные ошибки доступа к файлу (например, когда файл
-    открыт в другой программе).
-    
+    Склады для быстрого поиска (load_stores), пересобираемые только при
+    обновлении кэша ячеек: объединение ячеек нескольких складов не
+    повторяется на каждый запрос.
+
     Args:
-        wb: Объект workbook openpyxl для сохранения
-        filename (str): Путь к файлу для сохранения
-        session_id (str): Идентификатор сессии для логирования
-        retries (int): Количество попыток сохранения (по умолчанию 5)
-        delay (int): Задержка между попытками в секундах (по умолчанию 3)
-        
+        store_ids (list): UUID складов (первый - основной)
+
+    Returns:
+        dict: Результат load_stores
+    """
+    key = tuple(store_ids)
+    with _slot_cache_lock:
+        stamps = tuple((_slot_cache.get(store_id) or {}).get('loaded') for store_id in key)
+    with _lookup_lock:
+        cached = _lookup_stores.get(key)
+    if cached is not None and cached[0] == stamps and all(
+            stamp is not None and time.time() - stamp < SLOT_CACHE_TTL for stamp in stamps):
+        return cached[1]
+    stores = load_stores(list(key))
+    with _slot_cache_lock:
+        stamps = tuple(_slot_cache[store_id]['loaded'] for store_id in key)
+    with _lookup_lock:
+        _lookup_stores[key] = (stamps, stores)
+    return stores
+
+def lookup_article(article, stores):
+    """
+    Находит ячейки одного артикула по индексам в памяти процесса.
+
+    Артикул нормализуется так же, как колонка выгрузки (normalize_one).
+    Товар и остатки берутся из индексов _lookup_products и _lookup_stock
+    (остатки - из зеркала остатков, если оно сверено недавно); при промахе
+    выполняется запрос к API (get_product_uuid, get_stock_by_slot), и
+    результат сохраняется в индекс. Отсутствующие товары тоже запоминаются,
+    чтобы повторное сканирование неизвестного кода не нагружало API.
+
+    Args:
+        article (str): Артикул товара
+        stores (dict): Склады (lookup_stores)
+
+    Returns:
+        dict: {
+            'article': артикул,
+            'found': найден ли товар,
+            'name', 'uuid': название и UUID товара,
+            'slots': [{'slot', 'slot_id', 'store', 'stock'}, ...] в порядке обхода,
+            'total': остаток во всех ячейках,
+            'cached': ответ получен без запросов к API
+        }
+
+    Raises:
+        requests.exceptions.HTTPError: При ошибке API запроса
+    """
+    raw, article = str(article).strip(), normalize_one(str(article))
+    cached = True
+    if not article:
+        return {'article': raw, 'found': False, 'name': None, 'uuid': None,
+                'slots': [], 'total': 0, 'cached': cached}
+
+    product = _lookup_cached(_lookup_products, article, SLOT_CACHE_TTL)
+    if product is not None and product[0] is None:
+        # Отсутствие товара помнится столько же, сколько остатки
+        product = _lookup_cached(_lookup_products, article, LOOKUP_STOCK_TTL)
+    metrics.record_cache('lookup_product', product is not None)
+    if product is None:
+        cached = False
+        product = get_product_uuid(article)
+        with _lookup_lock:
+            _lookup_products[article] = (time.time(),) + tuple(product)
+    uuid, name = product
+    if not uuid:
+        return {'article': article, 'found': False, 'name': None, 'uuid': None,
+                'slots': [], 'total': 0, 'cached': cached}
+
+    mirror, _ = get_stock_mirror()
+    if mirror is not None and mirror.is_fresh(STOCK_MIRROR_MAX_AGE):
+        rows = mirror.rows(uuid)
+    else:
+        entry = _lookup_cached(_lookup_stock, uuid, LOOKUP_STOCK_TTL)
+        metrics.record_cache('lookup_stock', entry is not None)
+        if entry is not None:
+            rows = entry[0]
+        else:
+            cached = False
+            rows = get_stock_by_slot(uuid, None)
+            with _lookup_lock:
+                _lookup_stock[uuid] = (time.time(), rows)
+
+    slot_names, slot_order = stores['slot_names'], stores['slot_order']
+    found = sorted((row for row in rows if row.get('slotId') in slot_names and row.get('stock', 0) > 0),
+                   key=lambda row: slot_order[row['slotId']])
+    slots = [{'slot': slot_names[row['slotId']], 'slot_id': row['slotId'],
+              'store': stores['store_names'].get(stores['slot_store'][row['slotId']]),
+              'stock': row['stock']} for row in found]
+    return {'article': article, 'found': True, 'name': name, 'uuid': uuid, 'slots': slots,
+            'total': sum(slot['stock'] for slot in slots), 'cached': cached}
+
+def lookup_many(articles, stores):
+    """
+    Ищет ячейки для списка артикулов (пакетный /lookup).
+
+    Артикулы из индексов отвечаются сразу, промахи запрашиваются
+    параллельно. Ошибка по одному артикулу не прерывает остальные.
+
+    Args:
+        articles (list): Артикулы (повторы и пустые пропускаются)
+        stores (dict): Склады (lookup_stores)
+
+    Returns:
+        list: Результаты lookup_article в порядке артикулов; при ошибке
+              элемент {'article', 'error'}
+    """
+    def safe_lookup(article):
+        try:
+            return lookup_article(article, stores)
+        except Exception as e:
+            print(f"Ошибка поиска артикула {article}: {e}", flush=True)
+            return {'article': article, 'error': str(e)}
+
+    unique = [article for article in dict.fromkeys(str(a).strip() for a in articles) if article]
+    if len(unique) <= 1:
+        return [safe_lookup(article) for article in unique]
+    with ThreadPoolExecutor(max_workers=min(len(unique), 5)) as executor:
+        return list(executor.map(safe_lookup, unique))
+
+def save_workbook_with_retries(wb, filename, session_id, retries=5, delay=3):
+    """
+    Сохраняет workbook с повторными попытками при ошибках.
+    
+    Функция пытается сохранить Excel файл с повторными попытками,
+    обрабатывая возможные ошибки доступа к файлу (например, когда файл
+    открыт в другой программе).
+    
+    Args:
+        wb: Объект workbook openpyxl для сохранения
+        filename (str): Путь к файлу для сохранения
+        session_id (str): Идентификатор сессии для логирования
+        retries (int): Количество попыток сохранения (по умолчанию 5)
+        delay (int): Задержка между попытками в секундах (по умолчанию 3)
+        
     Returns:
         bool: True если файл успешно сохранен, False если все попытки неудачны
         
@@ -704,7 +1451,594 @@ def save_workbook_with_retries(wb, filename, session_id, retries=5, delay=3):
     print(f"[{session_id}] Не удалось сохранить файл {filename} после {retries} попыток.", flush=True)
     return False
 
-def process_file(input_path, output_path, session_id):
+def get_report_pool():
+    """
+    Возвращает пул процессов для формирования отчётов (создаётся при первом вызове).
+
+    Используется запуск процессов через spawn: fork процесса с работающими
+    потоками Flask небезопасен.
+
+    Пул нужно остановить (shutdown_report_pool) перед выходом процесса:
+    в дочернем процессе multiprocessing выход ждёт воркеров пула раньше, чем
+    срабатывает остановка самого пула, и процесс не завершается. Для
+    основного процесса остановка регистрируется в atexit.
+
+    Returns:
+        ProcessPoolExecutor or None: Пул или None, если REPORT_PROCESSES = 0
+    """
+    global _report_pool
+    with _report_pool_lock:
+        if _report_pool is None and REPORT_PROCESSES > 0:
+            _report_pool = ProcessPoolExecutor(
+                max_workers=REPORT_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            # Регистрируется после импорта multiprocessing, поэтому выполняется раньше его обработчика выхода
+            atexit.register(shutdown_report_pool)
+        return _report_pool
+
+def shutdown_report_pool():
+    """Останавливает пул процессов отчётов и ждёт завершения его воркеров."""
+    global _report_pool
+    with _report_pool_lock:
+        pool, _report_pool = _report_pool, None
+    if pool is not None:
+        atexit.unregister(shutdown_report_pool)
+        pool.shutdown(wait=True)
+
+def run_report_job(output_path, sheets, session_id):
+    """
+    Формирует Excel отчёт в пуле процессов и ждёт результата.
+
+    Циклы openpyxl держат GIL, поэтому в отдельном процессе они не тормозят
+    обработку веб-запросов. Пока отчёт формируется, проверяется флаг отмены.
+    Если пул недоступен, отчёт формируется в текущем процессе.
+
+    Args:
+        output_path (str): Путь к файлу отчёта
+        sheets (list): Листы отчёта для write_report
+        session_id (str): Идентификатор сессии для проверки отмены
+
+    Returns:
+        dict or None: Результат write_report или None, если процесс отменён
+    """
+    global _report_pool
+    pool = get_report_pool()
+    if pool is None:
+        return write_report(output_path, sheets)
+    try:
+        future = pool.submit(write_report, output_path, sheets)
+        while True:
+            if cancel_flags.get(session_id):
+                future.cancel()
+                return None
+            try:
+                return future.result(timeout=0.5)
+            except FutureTimeoutError:
+                continue
+    except BrokenProcessPool as e:
+        print(f"[{session_id}] Пул процессов недоступен ({e}), формируем отчёт в текущем процессе", flush=True)
+        with _report_pool_lock:
+            _report_pool = None
+        return write_report(output_path, sheets)
+
+def read_order_file(input_path, session_id):
+    """
+    Читает выгрузку маркетплейса и извлекает строки для обработки.
+
+    Определяет колонки артикула, количества, стикера и заказа и вычисляет
+    номер стикера каждой строки: колонка '№ Стикера', затем номер из
+    колонки заказа, иначе '*'.
+
+    Args:
+        input_path (str): Путь к входному Excel файлу
+        session_id (str): Идентификатор сессии для отслеживания прогресса
+
+    Returns:
+        list or None: Строки [{'sticker', 'article', 'quantity'}, ...] или None,
+                      если не найдены обязательные колонки или процесс отменён.
+                      Артикулы нормализованы (normalize.py); у строк с
+                      отброшенным артикулом есть поля 'skipped' (причина),
+                      'line' (номер строки файла) и 'raw_article'
+    """
+    progress[session_id] = f"[{session_id}] Читаем Excel файл..."
+    reader = choose_reader(input_path)
+    df = read_table(input_path, reader=reader)
+    progress[session_id] = f"[{session_id}] Excel загружен: {len(df)} строк"
+    print(f"[{session_id}] Excel загружен ({reader}): {len(df)} строк, колонки: {list(df.columns)}", flush=True)
+
+    if cancel_flags.get(session_id):
+        progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
+        return None
+
+    # Ищем колонки
+    progress[session_id] = f"[{session_id}] Ищем необходимые колонки..."
+    article_col = find_column_index(df.columns, ['артикул'])
+    sticker_col = find_column_index(df.columns, ['№ стикера','номер стикера','стикер','номер'])
+    order_col = find_column_index(df.columns, ['№ заказа','номер заказа','заказ'])
+    quantity_col = find_quantity_column(df)
+
+    print(f"[{session_id}] Найденные колонки - Артикул: {article_col}, Стикер: {sticker_col}, Заказ: {order_col}, Количество: {quantity_col}", flush=True)
+
+    if article_col is None or quantity_col is None or cancel_flags.get(session_id):
+        progress[session_id] = f"[{session_id}] Ошибка: не найдены обязательные колонки (Артикул, Количество) или процесс отменён"
+        print(f"[{session_id}] ОШИБКА: не найдены обязательные колонки", flush=True)
+        return None
+
+    if sticker_col is None and order_col is None:
+        progress[session_id] = f"[{session_id}] Ошибка: не найдены колонки № Стикера и № Заказа"
+        print(f"[{session_id}] ОШИБКА: не найдены колонки № Стикера и № Заказа", flush=True)
+        return None
+
+    rows = []
+    for i in range(len(df)):
+        sticker_raw = df.iat[i, sticker_col] if sticker_col is not None else None
+        order_raw = df.iat[i, order_col] if order_col is not None else None
+        sticker_value, source = resolve_sticker(sticker_raw, order_raw)
+        if source == 'sticker':
+            print(f"[{session_id}] Строка {i+1}: используем стикер из колонки '№ Стикера': '{sticker_value}'", flush=True)
+        elif source == 'order':
+            print(f"[{session_id}] Строка {i+1}: извлечен стикер '{sticker_value}' из заказа '{order_raw}'", flush=True)
+        else:
+            print(f"[{session_id}] Строка {i+1}: нет данных ни в стикере, ни в заказе - ставим '*'", flush=True)
+
+        quantity = df.iat[i, quantity_col]
+        rows.append({
+            'sticker': sticker_value,
+            'quantity': quantity if pd.notna(quantity) else 0,
+        })
+
+    # Артикулы нормализуются всей колонкой до поиска (normalize.py)
+    raw_articles = df.iloc[:, article_col]
+    articles, reasons = normalize_articles(raw_articles)
+    changed = int(((articles != raw_articles.astype(str).str.strip()) & articles.ne('')).sum())
+    # Строка 1 файла - заголовок
+    skipped = mark_skipped(rows, articles, reasons, raw_articles.tolist(), first_line=2)
+    if changed or skipped:
+        progress[session_id] = f"[{session_id}] Артикулы нормализованы: исправлено {changed}, пропущено строк {skipped}"
+    print(f"[{session_id}] Нормализация артикулов: исправлено {changed}, пропущено строк {skipped}", flush=True)
+    for row in rows:
+        if row.get('skipped'):
+            print(f"[{session_id}] Строка {row['line']}: пропущена ({row['skipped']}): '{row['raw_article']}'", flush=True)
+    return rows
+
+def resolve_sticker(sticker_raw, order_raw):
+    """
+    Определяет номер стикера строки.
+
+    Приоритет: значение стикера, затем номер из заказа
+    (extract_sticker_from_order), иначе '*'.
+
+    Args:
+        sticker_raw: Значение колонки '№ Стикера' (или None)
+        order_raw: Значение колонки '№ Заказа' (или None)
+
+    Returns:
+        tuple: (стикер, источник 'sticker' / 'order' / None)
+    """
+    if sticker_raw is not None and pd.notna(sticker_raw) and str(sticker_raw).strip():
+        return str(sticker_raw).strip(), 'sticker'
+    if order_raw is not None and pd.notna(order_raw) and str(order_raw).strip():
+        return extract_sticker_from_order(order_raw), 'order'
+    return "*", None
+
+# Названия полей строк JSON API (/api/process) и их синонимы
+API_ROW_FIELDS = {
+    'article': ('article', 'артикул'),
+    'quantity': ('qty', 'quantity', 'количество'),
+    'sticker': ('sticker', 'стикер', '№ стикера'),
+    'order': ('order', 'order_number', 'заказ', '№ заказа'),
+}
+
+def parse_api_rows(records):
+    """
+    Превращает строки JSON API в строки обработки (как read_order_file).
+
+    Args:
+        records (list): Объекты {article, qty, sticker или order}; регистр
+                        названий полей не важен, см. API_ROW_FIELDS
+
+    Returns:
+        list: Строки [{'sticker', 'article', 'quantity'}, ...]; артикулы
+              нормализованы, как в read_order_file, количество - число
+              (целое, если дробной части нет; "1,5" -> 1.5)
+
+    Raises:
+        ValueError: Если строка не объект или количество не число
+    """
+    rows = []
+    raw_articles = []
+    for n, record in enumerate(records, start=1):
+        if not isinstance(record, dict):
+            raise ValueError(f"Строка {n}: ожидается объект, получено {type(record).__name__}")
+        lowered = {str(key).strip().lower(): value for key, value in record.items()}
+        values = {field: next((lowered[name] for name in names if lowered.get(name) is not None), None)
+                  for field, names in API_ROW_FIELDS.items()}
+        quantity = values['quantity'] if values['quantity'] not in (None, '') else 0
+        try:
+            number = float(str(quantity).strip().replace(',', '.'))
+        except ValueError:
+            number = float('nan')
+        if not math.isfinite(number):
+            raise ValueError(f"Строка {n}: некорректное количество {quantity!r}")
+        quantity = int(number) if number.is_integer() else number
+        sticker, _ = resolve_sticker(values['sticker'], values['order'])
+        rows.append({'sticker': sticker, 'quantity': quantity})
+        raw_articles.append(values['article'])
+    articles, reasons = normalize_articles(pd.Series(raw_articles, dtype=object))
+    mark_skipped(rows, articles, reasons, raw_articles, first_line=1)
+    return rows
+
+def lookup_articles(articles, slot_names, stock_store, session_id):
+    """
+    Ищет товары и остатки по ячейкам для списка артикулов.
+
+    Каждый артикул запрашивается один раз, сколько бы строк (или файлов
+    волны) его ни содержали.
+
+    Args:
+        articles (iterable): Артикулы строк (пустые пропускаются)
+        slot_names (dict): Словарь соответствия ID ячеек и их названий
+        stock_store (str): UUID склада для process_article (None - все склады)
+        session_id (str): Идентификатор сессии для отслеживания прогресса
+
+    Returns:
+        dict or None: {артикул: результат process_article} или None при отмене
+    """
+    unique = [article for article in dict.fromkeys(articles) if article]
+    lookups = {}
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = {}
+        threading.current_thread().name = session_id
+        for article in unique:
+            futures[executor.submit(process_article, article, slot_names, stock_store)] = article
+        processed = 0
+        for fut in as_completed(futures):
+            if cancel_flags.get(session_id):
+                progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
+                return None
+            lookups[futures[fut]] = fut.result()
+            processed += 1
+            if processed % 5 == 0 or processed == len(unique):
+                progress[session_id] = f"[{session_id}] Обработано {processed}/{len(unique)}"
+                print(f"[{session_id}] Обработано артикулов: {processed}/{len(unique)}", flush=True)
+    return lookups
+
+def build_report(rows, lookups, stores, session_id, timer, file_names=None):
+    """
+    Формирует листы отчёта по строкам выгрузки и найденным остаткам.
+
+    Распределяет количество строк по ячейкам, строит лист сборки, план печати,
+    очередь печати фермы, прогноз расхода пластика и лист пропущенных строк.
+
+    Args:
+        rows (list): Строки read_order_file
+        lookups (dict): Результаты lookup_articles
+        stores (dict): Склады и ячейки (load_stores)
+        session_id (str): Идентификатор сессии для отслеживания прогресса
+        timer (metrics.PhaseTimer): Таймер этапов обработки
+        file_names (list): Имя исходного файла для каждой строки (волна); если
+                           задано, в отчёт и лист сборки добавляется колонка 'Файл'
+
+    Returns:
+        dict or None: {'sheets', 'data', 'pick_items', 'allocations', 'resolved',
+                       'filament', 'report_columns'} или None при отмене
+    """
+    timer.start('assemble')
+    progress[session_id] = f"[{session_id}] Формируем итоговую таблицу..."
+    print(f"[{session_id}] Формируем итоговую таблицу...", flush=True)
+    multi_store = len(stores['store_ids']) > 1
+    slot_names = stores['slot_names']
+    empty = (None, None, "", None, [])
+    data = []
+    resolved = {}
+    pick_items = []
+    results = []
+    for i, row in enumerate(rows):
+        if cancel_flags.get(session_id):
+            progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
+            return None
+        art, name, slots_text, uuid, slots = lookups.get(row['article'], empty)
+        results.append((art, name, slots_text, uuid, slots))
+        if art and uuid:
+            resolved[art] = {'uuid': uuid, 'name': name, 'slots': slots}
+        item = {
+            '№ Стикера': row['sticker'],
+            'Количество': row['quantity'],
+            'Артикул': art or '',
+            'Ячейки склада': slots_text,
+            'Название': name
+        }
+        pick_item = {'sticker': row['sticker'], 'article': art or '', 'quantity': row['quantity'],
+                     'name': name, 'slots': slots}
+        if file_names is not None:
+            item['Файл'] = pick_item['file'] = file_names[i]
+        data.append(item)
+        pick_items.append(pick_item)
+
+    # Распределяем количество строк по ячейкам с учётом всего файла
+    timer.start('allocate')
+    slot_order = stores['slot_order']
+    allocations = allocate_slots(pick_items, slot_order,
+                                 stores['slot_store'] if multi_store else None, stores['store_ids'])
+    for item, (takes, short, store) in zip(data, allocations):
+        item['Взять из ячеек'] = format_allocation(takes, short, slot_names)
+        item['Склад'] = stores['store_names'].get(store, '') if store else ''
+
+    # Лист сборки: строки по ячейкам в порядке обхода склада
+    pick_sheet = build_pick_sheet(pick_items, allocations, slot_names, slot_order, stores['store_names'],
+                                  by_file=file_names is not None)
+
+    # Сравниваем спрос с остатками и подбираем файлы печати для нехватки
+    timer.start('print_plan')
+    progress[session_id] = f"[{session_id}] Считаем нехватку и план печати..."
+    plan_sheets, filament = build_plan_sheets(
+        [row['article'] for row in rows],
+        [row['quantity'] for row in rows],
+        [sum(qty for _, qty in r[4]) for r in results],
+        [r[1] or '' for r in results],
+        session_id
+    )
+
+    report_columns = (REPORT_COLUMNS + (['Склад'] if multi_store else [])
+                      + (['Файл'] if file_names is not None else []))
+    columns = {name: [item[name] for item in data] for name in report_columns}
+    sheets = [('Sheet1', columns), (PICK_SHEET, pick_sheet)] + plan_sheets
+    skipped = skipped_sheet(rows, file_names)
+    if skipped:
+        sheets.append((SKIPPED_SHEET, skipped))
+
+    return {
+        'sheets': sheets,
+        'data': data,
+        'pick_items': pick_items,
+        'allocations': allocations,
+        'resolved': resolved,
+        'filament': filament,
+        'report_columns': report_columns,
+    }
+
+# Листы, которые строит build_plan_sheets
+PLAN_SHEETS = (PRINT_PLAN_SHEET, SCHEDULE_SHEET, FILAMENT_SHEET)
+
+def build_plan_sheets(articles, quantities, stock, names, session_id):
+    """
+    Формирует план печати, очередь печати фермы и прогноз расхода пластика.
+
+    Args:
+        articles (list): Артикулы по строкам выгрузки
+        quantities (list): Заказанное количество по строкам
+        stock (list): Остаток по ячейкам для артикула строки
+        names (list): Названия товаров по строкам
+        session_id (str): Идентификатор сессии для логов
+
+    Returns:
+        tuple: (листы - список (название, колонки) из PLAN_SHEETS, только непустые;
+                прогноз расхода пластика forecast_filament)
+    """
+    plan = build_print_plan(articles, quantities, stock, names)
+    print(f"[{session_id}] Артикулов с нехваткой: {len(plan['Артикул'])}", flush=True)
+    filament = forecast_filament(plan_print_items(plan))
+    if len(filament):
+        print(f"[{session_id}] Расход пластика: {filament['grams'].sum():.0f} г", flush=True)
+
+    # Распределяем столы плана по принтерам фермы, если она описана
+    farm_schedule = None
+    printers = load_printers()
+    if printers and plan['Артикул']:
+        farm_schedule = schedule_jobs(jobs_from_plan(plan), printers)
+        print(f"[{session_id}] Очередь печати: {len(printers)} принтеров, "
+              f"завершение через {farm_schedule['makespan']} мин, "
+              f"без принтера: {len(farm_schedule['unscheduled'])}", flush=True)
+        for warning in farm_schedule['warnings']:
+            print(f"[{session_id}] Ферма: {warning}", flush=True)
+
+    sheets = []
+    if plan['Артикул']:
+        sheets.append((PRINT_PLAN_SHEET, plan))
+    if farm_schedule is not None:
+        sheets.append((SCHEDULE_SHEET, schedule_sheet(farm_schedule)))
+    if len(filament):
+        sheets.append((FILAMENT_SHEET, filament_sheet(filament)))
+    return sheets, filament
+
+def get_sticker_index():
+    """
+    Возвращает индекс стикеров; при первом вызове строит его по последним
+    STICKER_INDEX_REPORTS отчётам из RESULT_FOLDER.
+
+    Returns:
+        StickerIndex: Индекс стикеров
+    """
+    global _sticker_index
+    with _sticker_index_lock:
+        if _sticker_index is None:
+            started = time.perf_counter()
+            index = StickerIndex(RESULT_FOLDER, max_reports=STICKER_INDEX_REPORTS)
+            loaded = index.refresh(force=True)
+            print(f"Индекс стикеров построен: отчётов {loaded}, "
+                  f"стикеров {len(index.by_sticker)} за {time.perf_counter() - started:.2f} с", flush=True)
+            _sticker_index = index
+        return _sticker_index
+
+def warm_sticker_index():
+    """Строит индекс стикеров в фоне при запуске сервера, чтобы первый скан не ждал чтения отчётов."""
+    threading.Thread(target=get_sticker_index, name="sticker-index", daemon=True).start()
+
+def index_report_stickers(output_path, data):
+    """
+    Добавляет строки нового отчёта в индекс стикеров, если он уже построен
+    (иначе отчёт будет прочитан с диска при построении).
+
+    Args:
+        output_path (str): Путь к отчёту
+        data (list): Строки основного листа ({колонка отчёта: значение})
+    """
+    index = _sticker_index
+    if index is not None:
+        index.add_report(output_path, data)
+
+def process_rows_stream(rows, stores, session_id):
+    """
+    Обрабатывает строки без Excel и отдаёт результаты по мере готовности.
+
+    Тот же конвейер, что process_file, но строки приходят из JSON API
+    (parse_api_rows), а результаты не пишутся в файл:
+    1. 'start' - идентификатор сессии (для /cancel) и число строк;
+    2. 'row' - строки артикула, как только найдены товар и его остатки;
+    3. 'allocation' - что взять из ячеек для каждой строки (распределение
+       считается по всем строкам, поэтому идёт после поиска);
+    4. 'done' - ненайденные артикулы, пропущенные строки, план печати и длительность.
+    При ошибке или отмене последней идёт строка 'error'.
+
+    Args:
+        rows (list): Строки [{'sticker', 'article', 'quantity'}, ...]
+        stores (dict): Склады и ячейки (load_stores)
+        session_id (str): Идентификатор сессии
+
+    Yields:
+        dict: Строки результата с полем type
+    """
+    timer = metrics.PhaseTimer('process_rows', phase_timings, session_id)
+    started = time.perf_counter()
+    cancel_flags[session_id] = False
+    yield {'type': 'start', 'session_id': session_id, 'rows': len(rows)}
+
+    stock_store = None if len(stores['store_ids']) > 1 else stores['store_ids'][0]
+    slot_names = stores['slot_names']
+    by_article = {}
+    for i, row in enumerate(rows):
+        by_article.setdefault(row['article'], []).append(i)
+
+    timer.start('lookups')
+    lookups = {}
+    executor = ThreadPoolExecutor(max_workers=3)
+    try:
+        futures = {executor.submit(process_article, article, slot_names, stock_store): article
+                   for article in by_article if article}
+        for fut in as_completed(futures):
+            if cancel_flags.get(session_id):
+                yield {'type': 'error', 'error': 'Процесс отменён пользователем'}
+                return
+            article = futures[fut]
+            art, name, slots_text, uuid, slots = lookups[article] = fut.result()
+            for i in by_article[article]:
+                yield {
+                    'type': 'row',
+                    'index': i,
+                    'sticker': rows[i]['sticker'],
+                    'article': article,
+                    'quantity': rows[i]['quantity'],
+                    'found': uuid is not None,
+                    'name': name,
+                    'slots_text': slots_text,
+                    'slots': [{'slot': slot_names.get(slot_id, slot_id), 'stock': qty} for slot_id, qty in slots],
+                }
+        for i in by_article.get('', []):
+            yield {'type': 'row', 'index': i, 'sticker': rows[i]['sticker'], 'article': '',
+                   'quantity': rows[i]['quantity'], 'found': False, 'name': None, 'slots_text': '', 'slots': []}
+
+        result = build_report(rows, lookups, stores, session_id, timer)
+        if result is None:
+            yield {'type': 'error', 'error': 'Процесс отменён пользователем'}
+            return
+        for i, item in enumerate(result['data']):
+            yield {'type': 'allocation', 'index': i, 'take': item['Взять из ячеек'], 'store': item['Склад'] or None}
+
+        plan = dict(result['sheets']).get(PRINT_PLAN_SHEET)
+        print_plan = [dict(zip(plan, values)) for values in zip(*plan.values())] if plan else []
+        not_found = sorted(article for article, lookup in lookups.items() if lookup[3] is None)
+        progress[session_id] = f"[{session_id}] Обработка завершена успешно!"
+        print(f"[{session_id}] ✅ Строки API обработаны: {len(rows)}, не найдено артикулов: {len(not_found)}", flush=True)
+        skipped = [{'index': i, 'article': row['raw_article'], 'reason': row['skipped']}
+                   for i, row in enumerate(rows) if row.get('skipped')]
+        yield {'type': 'done', 'rows': len(rows), 'articles': len(lookups), 'not_found': not_found,
+               'skipped': skipped, 'print_plan': print_plan, 'seconds': round(time.perf_counter() - started, 3)}
+    except Exception as e:
+        progress[session_id] = f"[{session_id}] Критическая ошибка обработки: {e}"
+        print(f"[{session_id}] КРИТИЧЕСКАЯ ОШИБКА: {e}", flush=True)
+        yield {'type': 'error', 'error': str(e)}
+    finally:
+        # Клиент мог отключиться: несделанные запросы отменяются
+        executor.shutdown(wait=False, cancel_futures=True)
+        timer.stop()
+
+def stores_meta(stores, stock_as_of):
+    """Метаданные складов и ячеек для сохранения вместе с отчётом (save_report_meta)."""
+    return {
+        'store_id': stores['store_ids'][0],
+        'store_ids': stores['store_ids'],
+        'slot_store': stores['slot_store'],
+        'slot_order': stores['slot_order'],
+        'store_names': stores['store_names'],
+        'stock_as_of': stock_as_of,
+        'slot_names': stores['slot_names'],
+    }
+
+def write_report_file(output_path, sheets, session_id, timer):
+    """
+    Формирует Excel отчёт (run_report_job) и записывает время этапов.
+
+    Returns:
+        bool: True, если отчёт сохранён; False при отмене или ошибке сохранения
+    """
+    report = run_report_job(output_path, sheets, session_id)
+    if report is None:
+        progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
+        return False
+    timer.record('format', report['format'])
+    timer.record('save', report['save'])
+    if not report['saved']:
+        progress[session_id] = f"[{session_id}] Ошибка: не удалось сохранить файл"
+        return False
+    print(f"[{session_id}] Отчёт сохранён: форматирование {report['format']:.2f} с, запись {report['save']:.2f} с", flush=True)
+    return True
+
+def write_outputs(output_path, sheets, formats, session_id, timer):
+    """
+    Записывает отчёт во всех запрошенных форматах.
+
+    CSV, JSON и Parquet пишутся сразу из листов отчёта (table_export), без
+    форматирования; оформленный .xlsx (write_report_file) - только если он
+    запрошен, и последним, так как он самый медленный.
+
+    Args:
+        output_path (str): Путь к отчёту .xlsx; остальные форматы - рядом с ним
+        sheets (list): Листы отчёта
+        formats (list): Форматы (parse_formats)
+        session_id (str): Идентификатор сессии для отслеживания прогресса
+        timer (metrics.PhaseTimer): Таймер этапов обработки
+
+    Returns:
+        bool: True, если все форматы записаны
+    """
+    for fmt in formats:
+        if fmt == 'xlsx':
+            continue
+        timer.start('export')
+        try:
+            path, seconds = write_export(output_path, sheets, fmt)
+        except ExportError as e:
+            progress[session_id] = f"[{session_id}] Ошибка: {e}"
+            print(f"[{session_id}] ОШИБКА выгрузки {fmt}: {e}", flush=True)
+            return False
+        print(f"[{session_id}] Отчёт {fmt} сохранён за {seconds * 1000:.0f} мс: {path}", flush=True)
+    if 'xlsx' in formats:
+        timer.start('report')
+        return write_report_file(output_path, sheets, session_id, timer)
+    return True
+
+def load_session_stores(store_ids, session_id):
+    """Загружает ячейки складов для обработки и сообщает о прогрессе (см. load_stores)."""
+    progress[session_id] = f"[{session_id}] Получаем ячейки склада..."
+    print(f"[{session_id}] Запрашиваем ячейки склада...", flush=True)
+    store_ids = list(dict.fromkeys(store_ids or STORE_IDS))
+    stores = load_stores(store_ids)
+    progress[session_id] = f"[{session_id}] Ячеек получено: {len(stores['slot_names'])}"
+    print(f"[{session_id}] Ячеек получено: {len(stores['slot_names'])} (складов: {len(store_ids)})", flush=True)
+    return stores
+
+def process_file(input_path, output_path, session_id, store_ids=None, clean_results=True, formats=None):
     """
     Основная функция обработки Excel файла с товарами.
     
@@ -713,20 +2047,28 @@ def process_file(input_path, output_path, session_id):
     2. Определяет необходимые колонки (артикул, количество, стикер, заказ)
     3. Получает информацию о ячейках склада из МойСклад
     4. Обрабатывает каждый артикул для получения информации о ячейках
-    5. Формирует итоговый отчет с форматированием
-    6. Сохраняет результат в Excel файл
+    5. Считает нехватку товара и план печати по файлам SimplyPrint
+    6. Формирует итоговый отчет с форматированием
+    7. Сохраняет результат в Excel файл
     
     Args:
         input_path (str): Путь к входному Excel файлу
         output_path (str): Путь для сохранения результата
         session_id (str): Идентификатор сессии для отслеживания прогресса
+        store_ids (list): Склады для поиска остатков (по умолчанию STORE_IDS).
+                          При нескольких складах в отчёт добавляется колонка 'Склад'
+        clean_results (bool): Удалять старые отчёты из RESULT_FOLDER (clean_old_results)
+        formats (list): Форматы отчёта (по умолчанию OUTPUT_FORMATS); csv, json и parquet
+                        пишутся рядом с output_path с другим расширением (write_outputs)
         
     Returns:
         None: Результат сохраняется в файл, прогресс обновляется в глобальных переменных
         
     Примечание:
-        Функция выполняется в отдельном потоке и поддерживает отмену процесса
+        Функция выполняется в отдельном потоке и поддерживает отмену процесса.
+        Время этапов записывается в phase_timings[session_id] и в метрики.
     """
+    timer = metrics.PhaseTimer('process_file', phase_timings, session_id)
     try:
         cancel_flags[session_id] = False
 
@@ -734,235 +2076,423 @@ def process_file(input_path, output_path, session_id):
         print(f"[{session_id}] Начинаем обработку файла: {input_path}", flush=True)
         
         # Читаем Excel файл
-        progress[session_id] = f"[{session_id}] Читаем Excel файл..."
-        df = pd.read_excel(input_path)
-        progress[session_id] = f"[{session_id}] Excel загружен: {len(df)} строк"
-        print(f"[{session_id}] Excel загружен: {len(df)} строк, колонки: {list(df.columns)}", flush=True)
-
-        if cancel_flags.get(session_id):
-            progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
-            return
-
-        # Ищем колонки
-        progress[session_id] = f"[{session_id}] Ищем необходимые колонки..."
-        article_col = find_column_index(df.columns, ['артикул'])
-        sticker_col = find_column_index(df.columns, ['№ стикера','номер стикера','стикер','номер'])
-        order_col = find_column_index(df.columns, ['№ заказа','номер заказа','заказ'])
-        quantity_col = find_quantity_column(df)
-        
-        print(f"[{session_id}] Найденные колонки - Артикул: {article_col}, Стикер: {sticker_col}, Заказ: {order_col}, Количество: {quantity_col}", flush=True)
-        
-        if article_col is None or quantity_col is None or cancel_flags.get(session_id):
-            progress[session_id] = f"[{session_id}] Ошибка: не найдены обязательные колонки (Артикул, Количество) или процесс отменён"
-            print(f"[{session_id}] ОШИБКА: не найдены обязательные колонки", flush=True)
-            return
-        
-        if sticker_col is None and order_col is None:
-            progress[session_id] = f"[{session_id}] Ошибка: не найдены колонки № Стикера и № Заказа"
-            print(f"[{session_id}] ОШИБКА: не найдены колонки № Стикера и № Заказа", flush=True)
+        timer.start('read')
+        rows = read_order_file(input_path, session_id)
+        if rows is None:
             return
 
         # Получаем ячейки склада
-        progress[session_id] = f"[{session_id}] Получаем ячейки склада..."
-        print(f"[{session_id}] Запрашиваем ячейки склада...", flush=True)
-        slot_names = get_store_slots(STORE_ID)
-        progress[session_id] = f"[{session_id}] Ячеек получено: {len(slot_names)}"
-        print(f"[{session_id}] Ячеек получено: {len(slot_names)}", flush=True)
+        timer.start('slots')
+        stores = load_session_stores(store_ids, session_id)
+        # Для одного склада остатки запрашиваются с фильтром по нему, для нескольких -
+        # одним запросом по всем складам с отбором ячеек нужных складов
+        stock_store = None if len(stores['store_ids']) > 1 else stores['store_ids'][0]
         
         if cancel_flags.get(session_id):
             progress[session_id] = f"[{session_id}] Процесс отменён до обработки статей"
             return
 
         # Обрабатываем артикулы
+        timer.start('lookups')
         progress[session_id] = f"[{session_id}] Обрабатываем артикулы..."
-        print(f"[{session_id}] Начинаем обработку {len(df)} артикулов...", flush=True)
-        results = [None] * len(df)
+        print(f"[{session_id}] Начинаем обработку {len(rows)} артикулов...", flush=True)
+        stock_as_of = moysklad_now()
+        lookups = lookup_articles((row['article'] for row in rows), stores['slot_names'], stock_store, session_id)
+        if lookups is None:
+            return
+
+        result = build_report(rows, lookups, stores, session_id, timer)
+        if result is None:
+            return
+
+        # Формируем отчёт; оформленный Excel - в отдельном процессе
+        formats = formats or OUTPUT_FORMATS
+        progress[session_id] = f"[{session_id}] Формируем отчёт ({', '.join(formats)})..."
+        print(f"[{session_id}] Формируем отчёт: {len(result['data'])} строк, форматы: {', '.join(formats)}", flush=True)
+        if not write_outputs(output_path, result['sheets'], formats, session_id, timer):
+            return
+
+        # Сохраняем сопоставление артикулов для быстрого обновления остатков
+        save_report_meta(output_path, dict(stores_meta(stores, stock_as_of),
+                                           articles=result['resolved'],
+                                           row_articles=[row['article'] for row in rows],
+                                           filament=filament_json(result['filament'])))
+        if 'xlsx' in formats:
+            index_report_stickers(output_path, result['data'])
+
+        # Очищаем папку результатов
+        if clean_results:
+            timer.start('cleanup')
+            progress[session_id] = f"[{session_id}] Очищаем старые файлы..."
+            print(f"[{session_id}] Очищаем старые файлы...", flush=True)
+            clean_old_results(max_files=50)
         
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            futures = {}
-            threading.current_thread().name = session_id
-            for idx, article in enumerate(df.iloc[:, article_col]):
-                futures[executor.submit(process_article, article, slot_names)] = idx
-            processed = 0
-            for fut in as_completed(futures):
-                idx = futures[fut]
-                if cancel_flags.get(session_id):
-                    progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
-                    return
-                results[idx] = fut.result()
-                processed += 1
-                if processed % 5 == 0 or processed == len(df):
-                    progress[session_id] = f"[{session_id}] Обработано {processed}/{len(df)}"
-                    print(f"[{session_id}] Обработано артикулов: {processed}/{len(df)}", flush=True)
-
-        # Формируем итоговую таблицу
-        progress[session_id] = f"[{session_id}] Формируем итоговую таблицу..."
-        print(f"[{session_id}] Формируем итоговую таблицу...", flush=True)
-        data = []
-        for i, (art, name, slots_text) in enumerate(results):
+        progress[session_id] = f"[{session_id}] Обработка завершена успешно!"
+        print(f"[{session_id}] ✅ Обработка завершена успешно!", flush=True)
+
+    except Exception as e:
+        error_msg = f"Критическая ошибка обработки: {str(e)}"
+        progress[session_id] = f"[{session_id}] {error_msg}"
+        print(f"[{session_id}] КРИТИЧЕСКАЯ ОШИБКА: {error_msg}", flush=True)
+        import traceback
+        traceback.print_exc()
+    finally:
+        timer.stop()
+
+def wave_output_path(output_path, number):
+    """Путь к отчёту отдельного файла волны: result_<session_id>_<номер>.xlsx."""
+    return f"{os.path.splitext(output_path)[0]}_{number}.xlsx"
+
+def process_wave(inputs, output_path, session_id, store_ids=None, clean_results=True, formats=None):
+    """
+    Обрабатывает волну - несколько выгрузок одним проходом.
+
+    Артикулы всех файлов объединяются без повторов, ячейки склада и остатки
+    запрашиваются один раз, поэтому волна из пяти файлов стоит столько же
+    запросов к API, сколько один файл с тем же набором артикулов. Количество
+    распределяется по ячейкам с учётом всех файлов сразу, чтобы два файла не
+    претендовали на один и тот же товар.
+
+    Результат:
+    - сводный отчёт output_path: все строки с колонкой 'Файл', общий лист
+      сборки, план печати, очередь печати и расход пластика по всей волне;
+    - отчёт каждого файла (wave_output_path): его строки и его лист сборки
+      с распределением из общей волны.
+
+    Args:
+        inputs (list): Файлы волны [(путь к файлу, имя для отчёта), ...]
+        output_path (str): Путь для сводного отчёта
+        session_id (str): Идентификатор сессии для отслеживания прогресса
+        store_ids (list): Склады для поиска остатков (по умолчанию STORE_IDS)
+        clean_results (bool): Удалять старые отчёты из RESULT_FOLDER (clean_old_results)
+        formats (list): Форматы отчётов (по умолчанию OUTPUT_FORMATS, см. write_outputs)
+
+    Returns:
+        None: Результаты сохраняются в файлы, прогресс - в глобальных переменных
+    """
+    timer = metrics.PhaseTimer('process_wave', phase_timings, session_id)
+    try:
+        cancel_flags[session_id] = False
+        progress[session_id] = f"[{session_id}] Начинаем обработку волны: {len(inputs)} файлов"
+        print(f"[{session_id}] Начинаем обработку волны: {[path for path, _ in inputs]}", flush=True)
+
+        # Читаем все файлы; файл с ошибкой пропускается, остальные обрабатываются
+        timer.start('read')
+        files = []
+        for input_path, file_name in inputs:
+            rows = read_order_file(input_path, session_id)
             if cancel_flags.get(session_id):
                 progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
                 return
-            
-            # Определяем номер стикера
-            sticker_value = ""
-            
-            # Сначала проверяем колонку стикера (приоритет 1)
-            if sticker_col is not None:
-                sticker_raw = df.iat[i, sticker_col]
-                if pd.notna(sticker_raw) and str(sticker_raw).strip():
-                    sticker_value = str(sticker_raw).strip()
-                    print(f"[{session_id}] Строка {i+1}: используем стикер из колонки '№ Стикера': '{sticker_value}'", flush=True)
-            
-            # Если номер стикера пустой, пытаемся извлечь из заказа (приоритет 2)
-            if not sticker_value and order_col is not None:
-                order_raw = df.iat[i, order_col]
-                if pd.notna(order_raw) and str(order_raw).strip():
-                    extracted_sticker = extract_sticker_from_order(order_raw)
-                    sticker_value = extracted_sticker
-                    print(f"[{session_id}] Строка {i+1}: извлечен стикер '{extracted_sticker}' из заказа '{order_raw}'", flush=True)
-            
-            # Если все еще пустой - ставим звездочку (приоритет 3)
-            if not sticker_value:
-                sticker_value = "*"
-                print(f"[{session_id}] Строка {i+1}: нет данных ни в стикере, ни в заказе - ставим '*'", flush=True)
-            
-            qty = df.iat[i, quantity_col] if pd.notna(df.iat[i, quantity_col]) else 0
-            data.append({
-                '№ Стикера': sticker_value,
-                'Количество': qty,
-                'Артикул': art or '',
-                'Ячейки склада': slots_text,
-                'Название': name
-            })
-
-        # Сохраняем DataFrame
-        progress[session_id] = f"[{session_id}] Сохраняем Excel файл..."
-        print(f"[{session_id}] Создаем DataFrame и сохраняем в Excel...", flush=True)
-        out_df = pd.DataFrame(data)[['№ Стикера','Количество','Артикул','Ячейки склада','Название']]
-        out_df.to_excel(output_path, index=False)
-        progress[session_id] = f"[{session_id}] Файл сохранён, начинаем форматирование..."
-        print(f"[{session_id}] Excel файл сохранен, начинаем форматирование...", flush=True)
+            if rows is None:
+                print(f"[{session_id}] Файл {file_name} пропущен: {progress[session_id]}", flush=True)
+                continue
+            files.append((file_name, rows))
+        if not files:
+            progress[session_id] = f"[{session_id}] Ошибка: ни в одном файле волны не найдены обязательные колонки"
+            return
+
+        timer.start('slots')
+        stores = load_session_stores(store_ids, session_id)
+        stock_store = None if len(stores['store_ids']) > 1 else stores['store_ids'][0]
 
         if cancel_flags.get(session_id):
-            progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
+            progress[session_id] = f"[{session_id}] Процесс отменён до обработки статей"
             return
 
-        # Форматирование
-        progress[session_id] = f"[{session_id}] Загружаем файл для форматирования..."
-        print(f"[{session_id}] Загружаем workbook для форматирования...", flush=True)
-        
-        try:
-            wb = load_workbook(output_path)
-            ws = wb.active
-            progress[session_id] = f"[{session_id}] Workbook загружен, применяем форматирование..."
-            print(f"[{session_id}] Workbook загружен, размеры: {ws.max_row}x{ws.max_column}", flush=True)
-            
-            # Применяем границы
-            thin = Side(border_style='thin', color='000000')
-            border = Border(left=thin, right=thin, top=thin, bottom=thin)
-            max_row, max_col = ws.max_row, ws.max_column
-            
-            print(f"[{session_id}] Применяем границы к {max_row * max_col} ячейкам...", flush=True)
-            progress[session_id] = f"[{session_id}] Применяем границы к {max_row * max_col} ячейкам..."
-            
-            cells_processed = 0
-            for row in ws.iter_rows(min_row=1, max_row=max_row, min_col=1, max_col=max_col):
-                if cancel_flags.get(session_id):
-                    progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
-                    return
-                for cell in row:
-                    cell.border = border
-                    cells_processed += 1
-                    if cells_processed % 100 == 0:
-                        progress[session_id] = f"[{session_id}] Обработано границ: {cells_processed}/{max_row * max_col}"
-
-            # Настройка ширины столбцов и выравнивания
-            progress[session_id] = f"[{session_id}] Настраиваем ширину столбцов..."
-            print(f"[{session_id}] Настраиваем ширину столбцов и выравнивание...", flush=True)
-            
-            # Устанавливаем фиксированную ширину столбцов
-            ws.column_dimensions['A'].width = 13   # № Стикера
-            ws.column_dimensions['B'].width = 7    # Количество
-            ws.column_dimensions['C'].width = 12   # Артикул
-            ws.column_dimensions['D'].width = 26   # Ячейки склада
-            ws.column_dimensions['E'].width = 104  # Название
-            
-            print(f"[{session_id}] Установлены ширины столбцов: A=13, B=7, C=12, D=26, E=104", flush=True)
-            
-            # Применяем выравнивание
-            progress[session_id] = f"[{session_id}] Применяем выравнивание..."
-            print(f"[{session_id}] Применяем выравнивание для {max_row} строк...", flush=True)
-            
-            for row in range(1, max_row + 1):
-                if cancel_flags.get(session_id):
-                    progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
-                    return
-                
-                # № Стикера - по центру
-                ws.cell(row=row, column=1).alignment = Alignment(horizontal='center', vertical='center')
-                
-                # Количество - по центру
-                ws.cell(row=row, column=2).alignment = Alignment(horizontal='center', vertical='center')
-                
-                # Артикул - по центру
-                ws.cell(row=row, column=3).alignment = Alignment(horizontal='center', vertical='center')
-                
-                # Ячейки склада - по центру
-                ws.cell(row=row, column=4).alignment = Alignment(horizontal='center', vertical='center')
-                
-                # Название - влево
-                ws.cell(row=row, column=5).alignment = Alignment(horizontal='left', vertical='center')
-                
-                if row % 50 == 0:
-                    progress[session_id] = f"[{session_id}] Выравнивание применено для {row}/{max_row} строк"
+        # Один проход поиска товаров и остатков на всю волну
+        timer.start('lookups')
+        rows = [row for _, file_rows in files for row in file_rows]
+        file_names = [file_name for file_name, file_rows in files for _ in file_rows]
+        unique = {row['article'] for row in rows if row['article']}
+        progress[session_id] = f"[{session_id}] Обрабатываем артикулы..."
+        print(f"[{session_id}] Волна: {len(rows)} строк, уникальных артикулов: {len(unique)}", flush=True)
+        stock_as_of = moysklad_now()
+        lookups = lookup_articles((row['article'] for row in rows), stores['slot_names'], stock_store, session_id)
+        if lookups is None:
+            return
 
-            # Форматируем стикеры
-            progress[session_id] = f"[{session_id}] Форматируем номера стикеров..."
-            print(f"[{session_id}] Форматируем {max_row-1} номеров стикеров...", flush=True)
-            
-            for r in range(2, max_row+1):
+        result = build_report(rows, lookups, stores, session_id, timer, file_names=file_names)
+        if result is None:
+            return
+
+        formats = formats or OUTPUT_FORMATS
+        progress[session_id] = f"[{session_id}] Формируем сводный отчёт волны..."
+        print(f"[{session_id}] Формируем сводный отчёт: {len(rows)} строк, форматы: {', '.join(formats)}", flush=True)
+        if not write_outputs(output_path, result['sheets'], formats, session_id, timer):
+            return
+        base_meta = stores_meta(stores, stock_as_of)
+        save_report_meta(output_path, dict(base_meta, articles=result['resolved'],
+                                           row_articles=[row['article'] for row in rows],
+                                           filament=filament_json(result['filament'])))
+        # Строки отчётов файлов совпадают со сводным, в индекс стикеров идёт только он
+        if 'xlsx' in formats:
+            index_report_stickers(output_path, result['data'])
+
+        # Отчёты отдельных файлов: их строки и распределение из общей волны
+        start = 0
+        for number, (file_name, file_rows) in enumerate(files, start=1):
+            end = start + len(file_rows)
+            progress[session_id] = f"[{session_id}] Формируем отчёт файла {number}/{len(files)}: {file_name}"
+            data = result['data'][start:end]
+            items = result['pick_items'][start:end]
+            allocations = result['allocations'][start:end]
+            report_columns = [name for name in result['report_columns'] if name != 'Файл']
+            sheets = [
+                ('Sheet1', {name: [item[name] for item in data] for name in report_columns}),
+                (PICK_SHEET, build_pick_sheet(items, allocations, stores['slot_names'],
+                                              stores['slot_order'], stores['store_names'])),
+            ]
+            skipped = skipped_sheet(file_rows)
+            if skipped:
+                sheets.append((SKIPPED_SHEET, skipped))
+            file_output = wave_output_path(output_path, number)
+            if not write_outputs(file_output, sheets, formats, session_id, timer):
+                return
+            articles = {item['article'] for item in items}
+            save_report_meta(file_output, dict(base_meta, articles={
+                article: info for article, info in result['resolved'].items() if article in articles
+            }))
+            start = end
+
+        if clean_results:
+            timer.start('cleanup')
+            clean_old_results(max_files=50)
+
+        progress[session_id] = f"[{session_id}] Обработка завершена успешно! Волна: {len(files)} файлов, артикулов: {len(unique)}"
+        print(f"[{session_id}] ✅ Волна обработана: файлов {len(files)}, артикулов {len(unique)}", flush=True)
+
+    except Exception as e:
+        error_msg = f"Критическая ошибка обработки волны: {str(e)}"
+        progress[session_id] = f"[{session_id}] {error_msg}"
+        print(f"[{session_id}] КРИТИЧЕСКАЯ ОШИБКА: {error_msg}", flush=True)
+        import traceback
+        traceback.print_exc()
+    finally:
+        timer.stop()
+
+def add_to_wave(input_path, file_name):
+    """
+    Добавляет загруженный файл в открытую волну.
+
+    Первая загрузка открывает волну и запускает таймер на WAVE_WINDOW секунд;
+    загрузки до его срабатывания попадают в ту же волну, после чего волна
+    обрабатывается одним проходом (process_wave). Волны хранятся в общем
+    состоянии задач и изменяются атомарно (modify), поэтому загрузки в любой
+    воркер serve.py попадают в одну волну; обрабатывает её воркер, который
+    её открыл.
+
+    Args:
+        input_path (str): Путь к сохранённому файлу
+        file_name (str): Исходное имя файла
+
+    Returns:
+        str: Идентификатор сессии волны
+    """
+    now = time.time()
+    joined = {}
+
+    def join(waves):
+        waves = dict(waves or {})
+        session_id = next((sid for sid, wave in waves.items() if wave['deadline'] > now), None)
+        if session_id is None:
+            session_id = str(now)
+            waves[session_id] = {'inputs': [], 'deadline': now + WAVE_WINDOW}
+            joined['opened'] = True
+        wave = waves[session_id]
+        waves[session_id] = dict(wave, inputs=wave['inputs'] + [[input_path, file_name]])
+        joined['session_id'], joined['count'] = session_id, len(waves[session_id]['inputs'])
+        return waves
+
+    open_waves.modify('open', join)
+    session_id = joined['session_id']
+    if joined.get('opened'):
+        progress[session_id] = f"[{session_id}] Собираем волну: ждём файлы {WAVE_WINDOW} сек..."
+        timer = threading.Timer(WAVE_WINDOW, _start_open_wave, args=(session_id,))
+        timer.name = session_id
+        timer.daemon = True
+        timer.start()
+    print(f"[{session_id}] Файл {file_name} добавлен в волну (файлов: {joined['count']})", flush=True)
+    return session_id
+
+def _start_open_wave(session_id):
+    """Закрывает волну session_id (новые загрузки откроют следующую) и обрабатывает её."""
+    taken = {}
+
+    def take(waves):
+        waves = dict(waves or {})
+        taken.update(waves.pop(session_id, {}))
+        return waves or None
+
+    open_waves.modify('open', take)
+    if not taken:
+        return
+    inputs = [tuple(item) for item in taken['inputs']]
+    process_wave(inputs, os.path.join(RESULT_FOLDER, f"result_{session_id}.xlsx"), session_id)
+
+def refresh_stock(output_path, session_id):
+    """
+    Обновляет остатки в готовом отчёте и всё, что от них зависит.
+
+    Повторно использует сохранённое при обработке сопоставление артикулов
+    с UUID, остатки по ячейкам и названия ячеек, поэтому поиск товаров не
+    выполняется. Остатки запрашиваются только для товаров, у которых они
+    изменились с момента формирования отчёта (если МойСклад вернул список
+    изменений), иначе - для всех товаров отчёта. Затем по всем строкам
+    заново распределяется количество по ячейкам ('Взять из ячеек', 'Склад'),
+    перестраиваются лист сборки, а в отчётах с планом печати - план, очередь
+    фермы и прогноз расхода пластика. Отчёт и его выгрузки в других форматах
+    переписываются целиком из обновлённых листов.
+
+    Args:
+        output_path (str): Путь к файлу отчёта
+        session_id (str): Идентификатор сессии для отслеживания прогресса
+
+    Returns:
+        None: Отчёт обновляется на месте, прогресс - в глобальных переменных
+    """
+    timer = metrics.PhaseTimer('refresh', phase_timings, session_id)
+    try:
+        cancel_flags[session_id] = False
+        progress[session_id] = f"[{session_id}] Начинаем обновление остатков"
+        print(f"[{session_id}] Обновление остатков в отчёте: {output_path}", flush=True)
+
+        meta = load_report_meta(output_path)
+        if not meta:
+            progress[session_id] = f"[{session_id}] Ошибка: нет сохранённых данных отчёта, загрузите файл заново"
+            return
+
+        articles = meta.get('articles', {})
+        slot_names = meta.get('slot_names', {})
+        store_ids = meta.get('store_ids') or [meta.get('store_id', STORE_ID)]
+        multi_store = len(store_ids) > 1
+        stock_store = None if multi_store else store_ids[0]
+        refreshed_at = moysklad_now()
+        uuids = {info['uuid'] for info in articles.values()}
+
+        # В метаданных старых отчётов нет остатков по ячейкам - их нужно запросить для всех товаров
+        if meta.get('stock_as_of') and all('slots' in info for info in articles.values()):
+            timer.start('changes')
+            progress[session_id] = f"[{session_id}] Получаем список изменившихся остатков..."
+            try:
+                with ThreadPoolExecutor(max_workers=len(store_ids)) as executor:
+                    changed = set().union(*executor.map(
+                        lambda store_id: get_changed_assortments(store_id, meta['stock_as_of']), store_ids))
+                uuids &= changed
+                print(f"[{session_id}] Остатки изменились у {len(uuids)} из {len(articles)} товаров", flush=True)
+            except Exception as e:
+                print(f"[{session_id}] Не удалось получить изменения, обновляем все товары: {e}", flush=True)
+
+        # Запрашиваем остатки по ячейкам только для нужных товаров
+        timer.start('stock')
+        progress[session_id] = f"[{session_id}] Получаем остатки для {len(uuids)} товаров..."
+        stock_texts = {}
+        stock_slots = {}
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = {executor.submit(get_stock_by_slot, uuid, stock_store): uuid for uuid in uuids}
+            processed = 0
+            for fut in as_completed(futures):
                 if cancel_flags.get(session_id):
                     progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
                     return
+                uuid = futures[fut]
                 try:
-                    format_sticker_cell(ws.cell(row=r, column=1))
-                    if r % 50 == 0:
-                        progress[session_id] = f"[{session_id}] Отформатировано стикеров: {r-1}/{max_row-1}"
+                    rows = fut.result()
+                    if multi_store:
+                        rows = [entry for entry in rows if entry.get('slotId') in slot_names]
+                    stock_texts[uuid] = format_slot_stock(rows, slot_names)
+                    stock_slots[uuid] = [(entry['slotId'], entry.get('stock', 0)) for entry in rows
+                                         if entry.get('slotId') and entry.get('stock', 0) > 0]
                 except Exception as e:
-                    print(f"[{session_id}] Ошибка форматирования строки {r}: {e}", flush=True)
+                    print(f"[{session_id}] Ошибка получения остатков {uuid}: {e}", flush=True)
+                processed += 1
+                if processed % 5 == 0 or processed == len(uuids):
+                    progress[session_id] = f"[{session_id}] Обновлено остатков {processed}/{len(uuids)}"
 
-            # Сохраняем с повторными попытками
-            progress[session_id] = f"[{session_id}] Сохраняем отформатированный файл..."
-            print(f"[{session_id}] Сохраняем отформатированный файл...", flush=True)
-            
-            if not save_workbook_with_retries(wb, output_path, session_id):
-                progress[session_id] = f"[{session_id}] Ошибка: не удалось сохранить файл"
-                return
+        # Остатки товаров в метаданных - по ним распределяются все строки отчёта
+        for info in articles.values():
+            if info['uuid'] in stock_slots:
+                info['slots'] = stock_slots[info['uuid']]
 
-        except Exception as e:
-            error_msg = f"Ошибка форматирования: {str(e)}"
-            progress[session_id] = f"[{session_id}] {error_msg}"
-            print(f"[{session_id}] ОШИБКА ФОРМАТИРОВАНИЯ: {error_msg}", flush=True)
+        timer.start('write')
+        progress[session_id] = f"[{session_id}] Обновляем листы отчёта..."
+        sheets = read_report_sheets(output_path)
+        main = sheets[0][1]
+        if 'Ячейки склада' not in main or 'Артикул' not in main:
+            progress[session_id] = f"[{session_id}] Ошибка: в отчёте не найдены колонки Артикул/Ячейки склада"
+            return
 
-        if cancel_flags.get(session_id):
-            progress[session_id] = f"[{session_id}] Процесс отменён пользователем"
+        rows_updated = 0
+        row_info = []
+        for i, article in enumerate(main['Артикул']):
+            info = articles.get(str(article).strip()) if article else None
+            if article:
+                metrics.record_cache('report_meta', info is not None)
+            if info and info['uuid'] in stock_texts:
+                main['Ячейки склада'][i] = stock_texts[info['uuid']]
+                rows_updated += 1
+            row_info.append(info)
+
+        # Заново распределяем количество по ячейкам: строки конкурируют за одни ячейки
+        if 'Взять из ячеек' in main and 'Количество' in main:
+            by_file = 'Файл' in main
+            items = [{'sticker': main['№ Стикера'][i] if '№ Стикера' in main else '',
+                      'article': main['Артикул'][i] or '', 'quantity': main['Количество'][i],
+                      'name': main['Название'][i] if 'Название' in main else None,
+                      'file': main['Файл'][i] if by_file else None,
+                      'slots': [tuple(slot) for slot in info.get('slots', [])] if info else []}
+                     for i, info in enumerate(row_info)]
+            slot_order = meta.get('slot_order') or build_slot_order(slot_names)
+            store_names = meta.get('store_names', {})
+            allocations = allocate_slots(items, slot_order, meta.get('slot_store') if multi_store else None, store_ids)
+            main['Взять из ячеек'] = [format_allocation(takes, short, slot_names) for takes, short, _ in allocations]
+            if 'Склад' in main:
+                main['Склад'] = [store_names.get(store, '') if store else '' for _, _, store in allocations]
+            pick_sheet = build_pick_sheet(items, allocations, slot_names, slot_order, store_names, by_file=by_file)
+            sheets = [(name, pick_sheet if name == PICK_SHEET else columns) for name, columns in sheets]
+
+            # План печати зависит от остатков: перестраивается в отчётах, где он есть
+            if 'filament' in meta:
+                row_articles = meta.get('row_articles')
+                if not row_articles or len(row_articles) != len(items):
+                    row_articles = [item['article'] for item in items]
+                plan_sheets, filament = build_plan_sheets(
+                    row_articles,
+                    [item['quantity'] for item in items],
+                    [sum(qty for _, qty in item['slots']) for item in items],
+                    [item['name'] or '' for item in items],
+                    session_id
+                )
+                sheets = [sheet for sheet in sheets if sheet[0] not in PLAN_SHEETS]
+                position = next((n + 1 for n, sheet in enumerate(sheets) if sheet[0] == PICK_SHEET), 1)
+                sheets[position:position] = plan_sheets
+                meta['filament'] = filament_json(filament)
+
+        if not write_report_file(output_path, sheets, session_id, timer):
             return
 
-        # Очищаем папку результатов
-        progress[session_id] = f"[{session_id}] Очищаем старые файлы..."
-        print(f"[{session_id}] Очищаем старые файлы...", flush=True)
-        clean_old_results(max_files=50)
-        
-        progress[session_id] = f"[{session_id}] Обработка завершена успешно!"
-        print(f"[{session_id}] ✅ Обработка завершена успешно!", flush=True)
+        meta['stock_as_of'] = refreshed_at
+        save_report_meta(output_path, meta)
+
+        # Выгрузки отчёта в других форматах переписываются по тем же листам
+        for fmt in EXPORT_FORMATS:
+            if fmt != 'xlsx' and os.path.exists(export_path(output_path, fmt)):
+                try:
+                    write_export(output_path, sheets, fmt)
+                except ExportError as e:
+                    print(f"[{session_id}] Не удалось обновить выгрузку {fmt}: {e}", flush=True)
+
+        progress[session_id] = f"[{session_id}] Обработка завершена: остатки обновлены (товаров: {len(stock_texts)}, строк: {rows_updated})"
+        print(f"[{session_id}] ✅ Остатки обновлены: товаров {len(stock_texts)}, строк {rows_updated}", flush=True)
 
     except Exception as e:
-        error_msg = f"Критическая ошибка обработки: {str(e)}"
+        error_msg = f"Ошибка обновления остатков: {str(e)}"
         progress[session_id] = f"[{session_id}] {error_msg}"
-        print(f"[{session_id}] КРИТИЧЕСКАЯ ОШИБКА: {error_msg}", flush=True)
+        print(f"[{session_id}] ОШИБКА: {error_msg}", flush=True)
         import traceback
         traceback.print_exc()
+    finally:
+        timer.stop()
 
 # =================== HTTP Routes ===================
 
@@ -973,25 +2503,33 @@ def upload_file():
     
     GET: Отображает форму загрузки файла и список последних результатов
     POST: Обрабатывает загруженный файл и запускает его обработку в отдельном потоке
+          (несколько файлов или загрузки в окне TOCKA_WAVE_WINDOW - одной волной, process_wave)
     
     Returns:
         str: HTML страница с формой загрузки или редирект на страницу обработки
     """
     if request.method == 'POST':
-        if 'file' not in request.files:
-            flash('Файл не выбран')
-            return redirect(request.url)
-        file = request.files['file']
-        if not file or file.filename == '':
+        files = [f for f in request.files.getlist('file') if f and f.filename]
+        if not files:
             flash('Файл не выбран')
             return redirect(request.url)
-        filename = file.filename
         session_id = str(time.time())
-        inp = os.path.join(UPLOAD_FOLDER, session_id+"_"+filename)
+        inputs = []
+        for n, file in enumerate(files):
+            inp = os.path.join(UPLOAD_FOLDER, f"{session_id}_{n}_{file.filename}" if len(files) > 1
+                               else f"{session_id}_{file.filename}")
+            file.save(inp)
+            inputs.append((inp, file.filename))
         out = os.path.join(RESULT_FOLDER, f"result_{session_id}.xlsx")
-        file.save(inp)
-        t = threading.Thread(target=process_file, args=(inp, out, session_id), name=session_id)
-        t.start()
+        if len(inputs) > 1:
+            # Несколько файлов в одной загрузке - одна волна
+            t = threading.Thread(target=process_wave, args=(inputs, out, session_id), name=session_id)
+            t.start()
+        elif WAVE_WINDOW > 0:
+            session_id = add_to_wave(*inputs[0])
+        else:
+            t = threading.Thread(target=process_file, args=(inputs[0][0], out, session_id), name=session_id)
+            t.start()
         return render_template_string(HEADER_HTML + '''
 <script>sessionStorage.setItem('currentSession',''' + f"'{session_id}'" + ''');</script>
 <meta http-equiv="refresh" content="0;url=/processing/''' + session_id + '''/result_''' + session_id + '''.xlsx">''')
@@ -1005,6 +2543,12 @@ def upload_file():
 <div style="border:1px solid #ddd; border-radius:5px; padding:15px; background:#f9f9f9;">
 '''
         for i, file_info in enumerate(recent_files, 1):
+            refresh_html = ""
+            if file_info['refreshable']:
+                report_session = file_info['filename'][len('result_'):-len('.xlsx')]
+                refresh_html = f'''<form method="post" action="/refresh/{report_session}" style="margin:0 10px 0 0;">
+        <button type="submit" style="font-size:12px;">Обновить остатки</button>
+      </form>'''
             files_html += f'''
   <div style="display:flex; justify-content:space-between; align-items:center; padding:8px 0; border-bottom:1px solid #eee;">
     <div>
@@ -1012,7 +2556,13 @@ def upload_file():
       <span style="margin-left:10px;">{file_info['filename']}</span>
       <small style="margin-left:15px; color:#666;">({file_info['formatted_time']}, {file_info['formatted_size']})</small>
     </div>
-    <a href="/download/{file_info['filename']}" style="background:#007bff; color:white; padding:5px 15px; text-decoration:none; border-radius:3px; font-size:12px;">Скачать</a>
+    <div style="display:flex; align-items:center;">
+      {refresh_html}
+      <a href="/download/{file_info['filename']}?format=csv" style="margin-right:8px; font-size:12px;">CSV</a>
+      <a href="/download/{file_info['filename']}?format=json" style="margin-right:8px; font-size:12px;">JSON</a>
+      <a href="/download/{file_info['filename']}?format=parquet" style="margin-right:10px; font-size:12px;">Parquet</a>
+      <a href="/download/{file_info['filename']}" style="background:#007bff; color:white; padding:5px 15px; text-decoration:none; border-radius:3px; font-size:12px;">Скачать</a>
+    </div>
   </div>
 '''
         files_html += "</div>"
@@ -1022,7 +2572,7 @@ def upload_file():
 <title>Главная</title>
 <h2>Загрузите Excel файл с данными</h2>
 <form method="post" enctype="multipart/form-data">
-  <input type="file" name="file" accept=".xlsx,.xls" required>
+  <input type="file" name="file" accept=".xlsx,.xls,.csv" multiple required>
   <button type="submit">Загрузить</button>
 </form>
 ''' + files_html)
@@ -1082,6 +2632,7 @@ def order_status(order_session_id):
             - status (str): Текущий статус процесса
             - result (dict): Результат создания заказа (если завершен)
             - completed (bool): True если процесс завершен
+            - timings (dict): Время завершённых этапов в секундах
     """
     status = order_progress.get(order_session_id, "Нет данных о создании заказа")
     result = order_progress.get(order_session_id + "_result")
@@ -1089,7 +2640,8 @@ def order_status(order_session_id):
     return jsonify({
         "status": status,
         "result": result,
-        "completed": result is not None
+        "completed": result is not None,
+        "timings": phase_timings.get(order_session_id, {})
     })
 
 @app.route('/cancel_order/<order_session_id>', methods=['POST'])
@@ -1111,6 +2663,31 @@ def cancel_order(order_session_id):
     order_progress[order_session_id] = "❌ Отмена создания заказа..."
     return jsonify({'status': 'cancelling'})
 
+@app.route('/refresh/<session_id>', methods=['POST'])
+def refresh(session_id):
+    """
+    Запускает обновление остатков в ранее сформированном отчёте.
+
+    Обновляется только колонка 'Ячейки склада', остальное содержимое отчёта
+    остаётся прежним. Ход обновления отображается на странице обработки.
+
+    Args:
+        session_id (str): Идентификатор сессии, в которой был сформирован отчёт
+
+    Returns:
+        str: Редирект на страницу обработки или на главную при ошибке
+    """
+    filename = f"result_{session_id}.xlsx"
+    output_path = os.path.join(RESULT_FOLDER, filename)
+    if not os.path.exists(output_path) or not os.path.exists(report_meta_path(output_path)):
+        flash('Отчёт не найден или не поддерживает обновление остатков')
+        return redirect('/')
+    t = threading.Thread(target=refresh_stock, args=(output_path, session_id), name=session_id)
+    t.start()
+    return render_template_string(HEADER_HTML + '''
+<script>sessionStorage.setItem('currentSession',''' + f"'{session_id}'" + ''');</script>
+<meta http-equiv="refresh" content="0;url=/processing/''' + session_id + '''/''' + filename + '''">''')
+
 @app.route('/cancel/<session_id>', methods=['POST'])
 def cancel(session_id):
     """
@@ -1144,8 +2721,192 @@ def status(session_id):
     Returns:
         JSON: Статус процесса обработки
             - status (str): Текущий статус процесса или 'Нет данных'
+            - timings (dict): Время завершённых этапов в секундах
+    """
+    return jsonify({'status': progress.get(session_id, 'Нет данных'),
+                    'timings': phase_timings.get(session_id, {})})
+
+@app.route('/filament/<session_id>')
+def filament_forecast(session_id):
+    """
+    Возвращает прогноз расхода пластика для плана печати отчёта.
+
+    Args:
+        session_id (str): Идентификатор сессии, в которой был сформирован отчёт
+
+    Returns:
+        JSON: Прогноз расхода пластика
+            - total_grams (float): Всего грамм
+            - items (list): Расход по материалу и цвету (material, color, hex,
+              plates, grams, spools, unknown_plates)
+    """
+    meta = load_report_meta(os.path.join(RESULT_FOLDER, f"result_{session_id}.xlsx"))
+    if meta is None or 'filament' not in meta:
+        return jsonify({'error': 'Прогноз расхода пластика не найден'}), 404
+    return jsonify(meta['filament'])
+
+@app.route('/prints/search')
+def prints_search():
+    """
+    Поиск файлов печати SimplyPrint.
+
+    Параметры запроса (все необязательные, условия объединяются через И,
+    каждое значение - префикс):
+        q - слова артикула или имени файла (N317, 10k)
+        article, color, material, nozzle, path - префиксы по полям
+        limit - максимум результатов (по умолчанию 50, не больше 500)
+
+    Returns:
+        JSON: Результаты поиска
+            - total (int): Найдено всего
+            - took_ms (float): Время поиска в миллисекундах
+            - items (list): Файлы печати (article, id, name, path, size, nozzle,
+              material, color, hex, units, minutes, grams)
+    """
+    started = time.perf_counter()
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({'error': 'Некорректный limit'}), 400
+    filters = {field: request.args.get(field) for field in SEARCH_FIELDS}
+    total, found = search_prints(request.args.get('q'), limit=limit, **filters)
+    return jsonify({
+        'total': total,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+        'items': [dict(print_file._asdict(), article=article) for article, print_file in found]
+    })
+
+@app.route('/lookup', methods=['GET', 'POST'])
+def lookup():
+    """
+    Быстрый поиск ячеек по артикулу (для сканеров и ручных запросов).
+
+    Отвечает из индексов товаров и остатков в памяти процесса, при промахе
+    запрашивает API (см. lookup_article).
+
+    Параметры:
+        GET: article - артикул (можно повторять), store - UUID склада (можно
+             повторять, по умолчанию MOYSKLAD_STORE_IDS)
+        POST: JSON {"articles": [...], "stores": [...]} или поле формы
+              articles (артикулы через пробел, запятую или с новой строки)
+
+    Returns:
+        JSON: Для одного артикула в GET - результат lookup_article с took_ms;
+              иначе {'took_ms', 'total', 'items': [...]}. 400 - нет артикулов
+              или их больше LOOKUP_MAX_ARTICLES
+    """
+    started = time.perf_counter()
+    store_ids = request.args.getlist('store')
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            articles = body.get('articles') or []
+            store_ids = body.get('stores') or store_ids
+        else:
+            articles = re.split(r'[\s,;]+', request.form.get('articles', ''))
+    else:
+        articles = request.args.getlist('article')
+    if not isinstance(articles, list):
+        articles = [articles]
+    articles = [str(a).strip() for a in articles if str(a).strip()]
+    if not articles:
+        return jsonify({'error': 'Не указан артикул'}), 400
+    if len(articles) > LOOKUP_MAX_ARTICLES:
+        return jsonify({'error': f'Не больше {LOOKUP_MAX_ARTICLES} артикулов за запрос'}), 400
+
+    try:
+        stores = lookup_stores(list(dict.fromkeys(store_ids or STORE_IDS)))
+    except Exception as e:
+        print(f"Ошибка загрузки ячеек для поиска: {e}", flush=True)
+        return jsonify({'error': f'Не удалось получить ячейки склада: {e}'}), 502
+    items = lookup_many(articles, stores)
+    took = time.perf_counter() - started
+    metrics.observe('tocka_lookup_seconds', took, {'mode': 'single' if len(items) == 1 else 'batch'},
+                    buckets=metrics.LOOKUP_BUCKETS, help_text="Длительность запросов /lookup")
+    took_ms = round(took * 1000, 2)
+    if request.method == 'GET' and len(items) == 1:
+        return jsonify(dict(items[0], took_ms=took_ms)), 502 if 'error' in items[0] else 200
+    return jsonify({'took_ms': took_ms, 'total': len(items), 'items': items})
+
+@app.route('/sticker/<code>')
+def sticker_lookup(code):
+    """
+    Поиск строки отчёта по скану стикера.
+
+    Ищет стикер целиком, а если не найден и передано 4 символа - по
+    последним 4 символам стикера (выделены в отчёте жирным). Поиск идёт по
+    индексу последних отчётов в памяти процесса (см. sticker_index.py).
+
+    Args:
+        code (str): Стикер или его последние 4 символа
+
+    Returns:
+        JSON: code, matched_by ('sticker' или 'suffix'), total, took_ms и items -
+              строки отчётов (sticker, article, quantity, slots, take, name,
+              report, report_time); 404 - стикер не найден
+    """
+    started = time.perf_counter()
+    matched_by, items = get_sticker_index().lookup(code)
+    body = {
+        'code': code,
+        'matched_by': matched_by,
+        'total': len(items),
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+        'items': items,
+    }
+    return jsonify(body), 200 if items else 404
+
+@app.route('/api/process', methods=['POST'])
+def api_process():
     """
-    return jsonify({'status': progress.get(session_id, 'Нет данных')})
+    Обработка строк заказа без Excel: JSON или NDJSON на входе, NDJSON на выходе.
+
+    Тело запроса:
+        application/json: [{...}, ...] или {"rows": [...], "stores": [...]}
+        application/x-ndjson: по одному объекту строки на строку текста
+    Поля строки: article, qty (или quantity), sticker или order (номер заказа,
+    из него берётся стикер, как в выгрузке). Склады - параметр store (можно
+    повторять) или поле stores, по умолчанию MOYSKLAD_STORE_IDS.
+
+    Returns:
+        Response: Поток NDJSON (см. process_rows_stream); 400 - некорректное тело
+    """
+    store_ids = request.args.getlist('store')
+    try:
+        if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'application/ndjson'):
+            records = [json.loads(line) for line in request.get_data(as_text=True).splitlines() if line.strip()]
+        else:
+            body = request.get_json(force=True, silent=True)
+            if body is None:
+                raise ValueError('тело запроса не JSON')
+            if isinstance(body, dict):
+                store_ids = body.get('stores') or store_ids
+                body = body.get('rows')
+            if not isinstance(body, list):
+                raise ValueError('Ожидается список строк или объект с полем rows')
+            records = body
+        rows = parse_api_rows(records)
+    except Exception as e:
+        return jsonify({'error': f'Некорректные строки: {e}'}), 400
+    if not rows:
+        return jsonify({'error': 'Нет строк для обработки'}), 400
+
+    try:
+        stores = lookup_stores(list(dict.fromkeys(store_ids or STORE_IDS)))
+    except Exception as e:
+        print(f"Ошибка загрузки ячеек для API: {e}", flush=True)
+        return jsonify({'error': f'Не удалось получить ячейки склада: {e}'}), 502
+
+    session_id = f"api_{time.time()}"
+    print(f"[{session_id}] Строки через API: {len(rows)}", flush=True)
+
+    def generate():
+        for line in process_rows_stream(rows, stores, session_id):
+            # Значения из pandas (числа numpy) приводятся к обычным числам
+            yield json.dumps(line, ensure_ascii=False,
+                             default=lambda value: value.item() if hasattr(value, 'item') else str(value)) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/processing/<session_id>/<filename>')
 def processing(session_id, filename):
@@ -1330,6 +3091,45 @@ checkStatus();
 </script>
 ''')
 
+@app.route('/webhook/moysklad', methods=['POST'])
+def moysklad_webhook():
+    """
+    Приём вебхуков МойСклад об изменении документов, меняющих остатки.
+
+    События ставятся в очередь и обрабатываются в фоне (StockWebhookWorker):
+    остатки товаров документа перечитываются в зеркало остатков.
+    Параметр token должен совпадать с TOCKA_WEBHOOK_TOKEN; без заданного
+    токена вебхуки не принимаются (обработка вебхука - запросы к API с токеном
+    МойСклад, открывать её без проверки нельзя).
+
+    Returns:
+        JSON: accepted (int) - принято событий по документам, меняющим остатки
+    """
+    if not WEBHOOK_TOKEN:
+        return jsonify({'error': 'Приём вебхуков выключен: не задан TOCKA_WEBHOOK_TOKEN'}), 403
+    if not hmac.compare_digest(request.args.get('token', ''), WEBHOOK_TOKEN):
+        return jsonify({'error': 'Неверный токен'}), 403
+    _, webhooks = get_stock_mirror()
+    if webhooks is None:
+        return jsonify({'error': 'Зеркало остатков выключено'}), 503
+    body = request.get_json(silent=True) or {}
+    return jsonify({'accepted': webhooks.submit(body.get('events'))})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Метрики приложения в формате Prometheus.
+
+    Включает время этапов обработки и создания заказов, гистограммы
+    длительности запросов к API МойСклад, количество ответов 429
+    и долю попаданий в кэши. Под serve.py - сумма по всем воркерам
+    (TOCKA_METRICS_DIR).
+
+    Returns:
+        Response: Текст метрик (text/plain; version=0.0.4)
+    """
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/download/<filename>')
 def download(filename):
     """
@@ -1337,6 +3137,10 @@ def download(filename):
     
     Маршрут для скачивания результата обработки Excel файла.
     Проверяет существование файла и отправляет его пользователю.
+    С параметром format (csv, json, parquet, xlsx) отдаётся отчёт в этом
+    формате; если его не записали при обработке, он один раз выгружается
+    из .xlsx отчёта и сохраняется рядом (одновременные запросы одного файла
+    ждут одну выгрузку).
     
     Args:
         filename (str): Имя файла для скачивания
@@ -1345,6 +3149,27 @@ def download(filename):
         Flask response: Файл для скачивания или редирект с ошибкой
     """
     path = os.path.join(RESULT_FOLDER, filename)
+    fmt = request.args.get('format', '').strip().lower()
+    if fmt:
+        if fmt not in EXPORT_FORMATS:
+            flash(f'Неизвестный формат: {fmt}')
+            return redirect('/')
+        target = export_path(path, fmt)
+        if not os.path.exists(target):
+            source = export_path(path, 'xlsx')
+            if fmt == 'xlsx' or not os.path.exists(source):
+                flash('Файл не найден')
+                return redirect('/')
+            with _export_locks_lock:
+                lock = _export_locks.setdefault(target, threading.Lock())
+            with lock:
+                try:
+                    if not os.path.exists(target):
+                        write_export(source, read_report_sheets(source), fmt)
+                except ExportError as e:
+                    flash(str(e))
+                    return redirect('/')
+        return send_file(target, as_attachment=True, mimetype=EXPORT_MIMETYPES[fmt])
     if os.path.exists(path):
         return send_file(path, as_attachment=True)
     flash('Файл не найден')
@@ -1360,4 +3185,5 @@ if __name__ == '__main__':
     Примечание:
         В продакшене следует отключить debug=True и настроить WSGI сервер
     """
+    warm_sticker_index()
     app.run(host='0.0.0.0', port=5001, debug=True)
\ No newline at end of file
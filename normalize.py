@@ -0,0 +1,185 @@
+"""
+Нормализация артикулов выгрузки перед поиском товаров.
+
+Артикул из Excel попадает в поиск в самом разном виде: число 12345
+становится 12345.0 (в колонке есть пустые ячейки, и pandas читает её как
+float), в ячейках встречаются неразрывные и нулевой ширины пробелы,
+"длинные" тире, кириллические буквы вместо похожих латинских (С317 вместо
+C317) и мусор вроде "-", "nan" или повтор заголовка. Каждый такой артикул -
+лишний запрос к API, который ничего не находит, и пустая строка отчёта.
+
+normalize_articles обрабатывает колонку целиком векторными операциями
+pandas (.str), один раз до поиска:
+1. приведение к тексту: целые числа без ".0", пустые ячейки - '';
+2. Unicode NFKC, единые дефисы, без невидимых символов и лишних пробелов;
+3. замена кириллических букв-двойников латинскими, если в артикуле есть
+   и латиница (С317 вместо C317 - ошибка набора);
+4. отбор мусора: пустые значения, заглушки и значения без букв и цифр.
+Отброшенные строки возвращаются с причиной, чтобы показать их в отчёте.
+
+Полностью кириллический артикул ('КОТ', 'СМ-500') может быть настоящим,
+поэтому он не меняется: латинский вариант (lookalike_variant) ищется
+только после того, как исходный артикул не найден.
+"""
+
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+# Кириллические буквы, неотличимые от латинских
+LOOKALIKES = str.maketrans({
+    'А': 'A', 'В': 'B', 'Е': 'E', 'К': 'K', 'М': 'M', 'Н': 'H', 'О': 'O',
+    'Р': 'P', 'С': 'C', 'Т': 'T', 'Х': 'X', 'У': 'Y',
+    'а': 'a', 'е': 'e', 'о': 'o', 'р': 'p', 'с': 'c', 'х': 'x', 'у': 'y', 'к': 'k',
+})
+_LOOKALIKE_CLASS = '[' + ''.join(chr(code) for code in LOOKALIKES) + ']'
+_ONLY_LOOKALIKES = re.compile(_LOOKALIKE_CLASS + '+')
+_NOT_CYRILLIC = re.compile(r'[^А-Яа-яЁё]')
+_LATIN = re.compile(r'[A-Za-z]')
+
+# Значения-заглушки, которые не бывают артикулами (сравнение без учёта регистра)
+JUNK_VALUES = frozenset(('nan', 'none', 'null', 'n/a', '#n/a', '-', '*', '0', '?', 'нет', 'артикул'))
+
+# Причины пропуска строки
+SKIP_EMPTY = 'пустой артикул'
+SKIP_JUNK = 'не артикул'
+
+
+def _as_text(series):
+    """Колонка как текст: целые числа без '.0', пустые ячейки - ''."""
+    if pd.api.types.is_float_dtype(series):
+        integral = series.notna() & (series % 1 == 0)
+        text = series.astype(object).where(series.notna(), '')
+        text[integral] = series[integral].astype('int64').astype(str)
+        return text.astype(str)
+    if pd.api.types.is_integer_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series.astype(str)
+    # Смешанная колонка: числа приводятся по одному, текст остаётся как есть
+    values = series.astype(object)
+    floats = values.map(lambda v: isinstance(v, float))
+    if floats.any():
+        values = values.copy()
+        values[floats] = [str(int(v)) if v.is_integer() else ('' if v != v else str(v)) for v in values[floats]]
+    return values.where(values.notna(), '').astype(str)
+
+
+def normalize_articles(series):
+    """
+    Нормализует колонку артикулов.
+
+    Args:
+        series (pandas.Series): Колонка артикулов в том виде, как её прочитал pandas
+
+    Returns:
+        tuple: (артикулы - pandas.Series строк, '' для отброшенных;
+                причины - pandas.Series с причиной пропуска или None)
+    """
+    text = _as_text(series)
+    text = (text.str.normalize('NFKC')
+                .str.replace(r'[\u00ad\u200b-\u200f\u2060\ufeff]', '', regex=True)
+                .str.replace(r'[\u2010-\u2015\u2212]', '-', regex=True)
+                .str.replace(r'\s+', ' ', regex=True)
+                .str.replace(r' ?- ?', '-', regex=True)
+                .str.strip())
+
+    # Только смешанные артикулы: полностью кириллические - см. lookalike_variant
+    has_latin = text.str.contains(r'[A-Za-z]', regex=True)
+    fold = has_latin & text.str.contains(_LOOKALIKE_CLASS, regex=True)
+    if fold.any():
+        text = text.where(~fold, text[fold].str.translate(LOOKALIKES))
+
+    empty = text == ''
+    junk = ~empty & (text.str.lower().isin(JUNK_VALUES) | ~text.str.contains(r'\w', regex=True))
+    reasons = pd.Series([None] * len(series), index=series.index, dtype=object)
+    reasons[empty] = SKIP_EMPTY
+    reasons[junk] = SKIP_JUNK
+    return text.where(~junk, ''), reasons
+
+
+@lru_cache(maxsize=4096)
+def normalize_one(value):
+    """
+    Нормализует один артикул так же, как normalize_articles (поиск по одному
+    артикулу, например /lookup). Результаты кэшируются: сканер повторяет коды.
+
+    Returns:
+        str: Артикул или '', если значение не артикул
+    """
+    return normalize_articles(pd.Series([value], dtype=object))[0].iloc[0]
+
+
+def lookalike_variant(article):
+    """
+    Латинский вариант полностью кириллического артикула для повторного поиска.
+
+    Args:
+        article (str): Нормализованный артикул, который не найден
+
+    Returns:
+        str or None: Артикул с латинскими буквами вместо двойников или None, если
+                     в артикуле есть латиница, нет кириллицы или есть кириллические
+                     буквы без латинского двойника
+    """
+    cyrillic = _NOT_CYRILLIC.sub('', article)
+    if not cyrillic or _LATIN.search(article) or not _ONLY_LOOKALIKES.fullmatch(cyrillic):
+        return None
+    return article.translate(LOOKALIKES)
+
+
+SKIPPED_SHEET = 'Пропущенные строки'
+
+SKIPPED_COLUMNS = ['Строка', 'Значение', 'Причина']
+
+
+def skipped_sheet(rows, file_names=None):
+    """
+    Формирует лист "Пропущенные строки" по строкам с полем 'skipped'.
+
+    Args:
+        rows (list): Строки read_order_file / parse_api_rows
+        file_names (list): Имя исходного файла для каждой строки (волна)
+
+    Returns:
+        dict or None: Колонки листа {название колонки: список значений} или
+                      None, если пропущенных строк нет
+    """
+    columns = {name: [] for name in SKIPPED_COLUMNS + (['Файл'] if file_names is not None else [])}
+    for i, row in enumerate(rows):
+        if not row.get('skipped'):
+            continue
+        columns['Строка'].append(row.get('line'))
+        columns['Значение'].append(row.get('raw_article', ''))
+        columns['Причина'].append(row['skipped'])
+        if file_names is not None:
+            columns['Файл'].append(file_names[i])
+    return columns if columns['Строка'] else None
+
+
+def mark_skipped(rows, articles, reasons, raw, first_line):
+    """
+    Записывает в строки нормализованные артикулы и причины пропуска.
+
+    Пустой артикул считается пропуском, только если в строке есть другие
+    данные (стикер или количество): полностью пустые строки выгрузки не в счёт.
+
+    Args:
+        rows (list): Строки {'sticker', 'article', 'quantity'} (изменяются на месте)
+        articles (pandas.Series): Артикулы normalize_articles
+        reasons (pandas.Series): Причины пропуска normalize_articles
+        raw (list): Исходные значения артикулов (для листа пропусков)
+        first_line (int): Номер строки файла для первой строки
+
+    Returns:
+        int: Сколько строк пропущено
+    """
+    skipped = 0
+    for i, (row, article, reason) in enumerate(zip(rows, articles.tolist(), reasons.tolist())):
+        row['article'] = article
+        if reason is None or (reason == SKIP_EMPTY and row['sticker'] == '*' and not row['quantity']):
+            continue
+        row['skipped'] = reason
+        row['line'] = first_line + i
+        row['raw_article'] = '' if pd.isna(raw[i]) else str(raw[i])
+        skipped += 1
+    return skipped
@@ -0,0 +1,265 @@
+"""
+Лист сборки заказов по ячейкам склада.
+
+Строки основного отчёта идут в порядке выгрузки, и сборщик ходит по складу
+зигзагом. Лист сборки группирует строки по ячейкам и сортирует ячейки
+в естественном порядке названий (A-2 раньше A-10), чтобы склад обходился
+за один проход.
+
+Количество каждой строки распределяется по конкретным ячейкам с учётом
+всех строк файла (allocate_slots): минимум обходов ячеек, затем выемка
+из меньших ячеек. Результат - точные указания "взять N из ячейки X".
+
+Порядок ячеек (build_slot_order) вычисляется один раз при обновлении кэша
+ячеек склада, после чего сортировка строк - сравнение целых чисел.
+"""
+
+import re
+
+# Название листа сборки в отчёте
+PICK_SHEET = 'Сборка по ячейкам'
+
+PICK_COLUMNS = ['Ячейка', '№ Стикера', 'Артикул', 'Количество', 'Название']
+
+# Строки без остатка в ячейках идут в конец листа
+NO_SLOT = 'нет в ячейках'
+
+_NATURAL_SPLIT_RE = re.compile(r'(\d+)')
+
+
+def natural_sort_key(name):
+    """
+    Ключ естественной сортировки: числа внутри названия сравниваются как числа.
+
+    Args:
+        name (str): Название ячейки
+
+    Returns:
+        list: Ключ сортировки
+
+    Пример:
+        sorted(['A-10', 'A-2', 'B-1'], key=natural_sort_key) -> ['A-2', 'A-10', 'B-1']
+    """
+    # re.split с группой даёт чередование строка/число, поэтому типы на одних позициях совпадают
+    parts = _NATURAL_SPLIT_RE.split(str(name).strip().lower())
+    return [int(part) if i % 2 else part for i, part in enumerate(parts)]
+
+
+def build_slot_order(slot_names):
+    """
+    Строит индекс порядка обхода ячеек.
+
+    Args:
+        slot_names (dict): Словарь {slot_id: название ячейки}
+
+    Returns:
+        dict: {slot_id: позиция в порядке обхода}
+    """
+    ordered = sorted(slot_names, key=lambda slot_id: natural_sort_key(slot_names[slot_id]))
+    return {slot_id: rank for rank, slot_id in enumerate(ordered)}
+
+
+def _units(quantity):
+    """Количество из ячейки выгрузки как целое неотрицательное число."""
+    try:
+        value = float(str(quantity).replace(',', '.'))
+    except (TypeError, ValueError):
+        return 0
+    return max(int(round(value)), 0) if value == value else 0
+
+
+def choose_slots(slots, demand, slot_order):
+    """
+    Выбирает ячейки, из которых собирается артикул.
+
+    Сначала минимизируется число ячеек (обходов), затем среди наборов
+    такого размера выбираются меньшие ячейки, чтобы они опустошались,
+    а остаток товара оставался в крупных ячейках.
+
+    Args:
+        slots (list): Остатки по ячейкам [(slot_id, количество), ...]
+        demand (int): Сколько нужно взять всего
+        slot_order (dict): Индекс порядка обхода ячеек
+
+    Returns:
+        list: Выбранные ячейки [(slot_id, количество), ...] в порядке выемки:
+              от меньшей к большей (последняя используется частично)
+    """
+    rank = lambda slot: (slot[1], slot_order.get(slot[0], len(slot_order)))
+    slots = sorted((slot for slot in slots if slot[1] > 0), key=rank)
+    if sum(qty for _, qty in slots) <= demand:
+        return slots
+
+    # Минимальное число ячеек: берём самые крупные, пока не наберётся спрос
+    needed, covered = 0, 0
+    for _, qty in reversed(slots):
+        needed += 1
+        covered += qty
+        if covered >= demand:
+            break
+
+    # Жадно берём наименьшую ячейку, при которой остаток спроса ещё
+    # покрывается оставшимися самыми крупными ячейками
+    chosen, remaining, pool = [], demand, list(slots)
+    while needed > 0:
+        for i, slot in enumerate(pool):
+            rest = pool[:i] + pool[i + 1:]
+            largest = sum(qty for _, qty in rest[len(rest) - (needed - 1):]) if needed > 1 else 0
+            if slot[1] + largest >= remaining:
+                chosen.append(slot)
+                remaining -= slot[1]
+                pool = rest
+                break
+        needed -= 1
+    return sorted(chosen, key=rank)
+
+
+def _draw(demands, slots, slot_order):
+    """Распределяет спрос строк одного артикула по ячейкам одного склада."""
+    chosen = [list(slot) for slot in choose_slots(slots, sum(demands), slot_order)]
+    position = 0
+    result = []
+    for demand in demands:
+        takes = []
+        while demand > 0 and position < len(chosen):
+            slot_id, available = chosen[position]
+            qty = min(available, demand)
+            takes.append((slot_id, qty))
+            demand -= qty
+            chosen[position][1] -= qty
+            if chosen[position][1] == 0:
+                position += 1
+        result.append((takes, demand))
+    return result
+
+
+def _choose_stores(demands, stock_by_store, store_order):
+    """
+    Назначает строкам артикула склад: первый по порядку склад, где хватает
+    остатка на всю строку, иначе склад с наибольшим остатком.
+    """
+    remaining = dict(stock_by_store)
+    stores = []
+    for demand in demands:
+        store = next((s for s in store_order if s in remaining and remaining[s] >= demand), None)
+        if store is None:
+            store = max(remaining, key=lambda s: remaining[s], default=None)
+            if store is not None and remaining[store] <= 0:
+                store = None
+        if store is not None:
+            remaining[store] -= min(demand, remaining[store])
+        stores.append(store)
+    return stores
+
+
+def allocate_slots(items, slot_order, slot_store=None, store_order=None):
+    """
+    Распределяет количество каждой строки по конкретным ячейкам с учётом всего файла.
+
+    Строки одного артикула делят общий остаток: сначала для артикула выбираются
+    ячейки (choose_slots), затем строки по порядку забирают из них товар.
+    При нескольких складах каждой строке сначала назначается склад, который
+    может её собрать (_choose_stores), и ячейки выбираются внутри него.
+
+    Args:
+        items (list): Строки отчёта - словари с ключами article, quantity и slots
+        slot_order (dict): Индекс порядка обхода ячеек
+        slot_store (dict): Склад каждой ячейки {slot_id: store_id} (None - один склад)
+        store_order (list): Склады в порядке приоритета (первый - основной)
+
+    Returns:
+        list: Для каждой строки (takes, short, store): takes - [(slot_id, количество), ...],
+              short - сколько не хватило, store - склад строки (None для одного склада
+              или если товара нет ни на одном складе)
+    """
+    by_article = {}
+    for idx, item in enumerate(items):
+        if item['article']:
+            by_article.setdefault(item['article'], []).append(idx)
+
+    allocations = [([], _units(item['quantity']), None) for item in items]
+    for article, rows in by_article.items():
+        demands = [_units(items[idx]['quantity']) for idx in rows]
+        slots = [slot for slot in items[rows[0]]['slots'] if slot[1] > 0]
+
+        if slot_store is None:
+            for idx, (takes, short) in zip(rows, _draw(demands, slots, slot_order)):
+                allocations[idx] = (takes, short, None)
+            continue
+
+        slots_by_store = {}
+        for slot in slots:
+            slots_by_store.setdefault(slot_store.get(slot[0]), []).append(slot)
+        stock_by_store = {store: sum(qty for _, qty in store_slots)
+                          for store, store_slots in slots_by_store.items()}
+        stores = _choose_stores(demands, stock_by_store, store_order or list(slots_by_store))
+
+        for store in set(stores):
+            store_rows = [(idx, demand) for idx, demand, s in zip(rows, demands, stores) if s == store]
+            if store is None:
+                for idx, demand in store_rows:
+                    allocations[idx] = ([], demand, None)
+                continue
+            drawn = _draw([demand for _, demand in store_rows], slots_by_store[store], slot_order)
+            for (idx, _), (takes, short) in zip(store_rows, drawn):
+                allocations[idx] = (takes, short, store)
+    return allocations
+
+
+def format_allocation(takes, short, slot_names):
+    """
+    Формирует текст для колонки 'Взять из ячеек'.
+
+    Returns:
+        str: Строка вида "A-01 - 2 шт, B-03 - 1 шт, не хватает 1 шт"
+    """
+    parts = [f"{slot_names.get(slot_id, slot_id)} - {qty} шт" for slot_id, qty in takes]
+    if short:
+        parts.append(f"не хватает {short} шт")
+    return ", ".join(parts)
+
+
+def build_pick_sheet(items, allocations, slot_names, slot_order, store_names=None, by_file=False):
+    """
+    Формирует лист "Сборка по ячейкам".
+
+    Args:
+        items (list): Строки отчёта - словари с ключами sticker, article, quantity, name
+        allocations (list): Результат allocate_slots для тех же строк
+        slot_names (dict): Словарь {slot_id: название ячейки}
+        slot_order (dict): Индекс порядка обхода ячеек (build_slot_order)
+        store_names (dict): Названия складов {store_id: название} в порядке приоритета;
+                            если складов несколько, добавляется колонка 'Склад'
+        by_file (bool): Добавить колонку 'Файл' из ключа file строк (сводный лист волны)
+
+    Returns:
+        dict: Колонки листа {название колонки: список значений} (PICK_COLUMNS)
+    """
+    multi_store = store_names is not None and len(store_names) > 1
+    store_rank = {store: rank for rank, store in enumerate(store_names or {})}
+    no_slot_rank = len(slot_order) + 1
+    rows = []
+    for item, (takes, short, store) in zip(items, allocations):
+        for slot_id, qty in takes:
+            key = (store_rank.get(store, 0), slot_order.get(slot_id, len(slot_order)),
+                   str(item['article']), str(item['sticker']))
+            rows.append((key, store, slot_names.get(slot_id, slot_id), qty, item))
+        if short:
+            key = (len(store_rank), no_slot_rank, str(item['article']), str(item['sticker']))
+            rows.append((key, None, NO_SLOT, short, item))
+
+    rows.sort(key=lambda row: row[0])
+
+    names = (['Склад'] if multi_store else []) + PICK_COLUMNS + (['Файл'] if by_file else [])
+    columns = {name: [] for name in names}
+    for _, store, slot_name, qty, item in rows:
+        if multi_store:
+            columns['Склад'].append(store_names.get(store, '') if store else '')
+        columns['Ячейка'].append(slot_name)
+        columns['№ Стикера'].append(item['sticker'])
+        columns['Артикул'].append(item['article'])
+        columns['Количество'].append(qty)
+        columns['Название'].append(item['name'])
+        if by_file:
+            columns['Файл'].append(item['file'])
+    return columns
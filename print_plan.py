@@ -0,0 +1,221 @@
+"""
+План печати по нехватке товара.
+
+Для каждой строки выгрузки известны заказанное количество и остаток по
+ячейкам склада. Модуль суммирует спрос по артикулам, вычитает остаток и для
+артикулов с нехваткой подбирает файл печати из индекса SimplyPrint
+(simplyprint.py): вариант, который закрывает нехватку за наименьшее время
+печати, при равенстве - с меньшим временем на одно изделие.
+
+Результат - лист отчёта "Что печатать" и прогноз расхода пластика
+по материалу и цвету (лист "Расход пластика" и JSON).
+"""
+
+import math
+
+import pandas as pd
+
+from simplyprint import find_prints, normalize_article
+
+# Название листа плана печати в отчёте
+PRINT_PLAN_SHEET = 'Что печатать'
+
+# Название листа прогноза расхода пластика
+FILAMENT_SHEET = 'Расход пластика'
+
+# Вес пластика в одной катушке, г
+FILAMENT_SPOOL_GRAMS = 1000
+
+# Колонки листа плана печати
+PRINT_PLAN_COLUMNS = [
+    'Артикул', 'Название', 'Заказано', 'На складе', 'Не хватает',
+    'Файл печати', 'Шт на столе', 'Столов', 'Будет напечатано',
+    'Время печати, мин', 'Пластик, г', 'Цвет',
+]
+
+
+def compute_shortages(articles, quantities, stock, names=None):
+    """
+    Считает нехватку по артикулам.
+
+    Спрос суммируется по всем строкам артикула, остаток берётся один раз
+    (он одинаков во всех строках одного артикула).
+
+    Args:
+        articles (list): Артикулы по строкам выгрузки
+        quantities (list): Заказанное количество по строкам
+        stock (list): Остаток по ячейкам для артикула строки
+        names (list): Названия товаров по строкам (необязательно)
+
+    Returns:
+        pandas.DataFrame: Колонки article, name, demand, stock, shortfall -
+                          только артикулы с нехваткой, по убыванию нехватки
+    """
+    df = pd.DataFrame({
+        'article': pd.Series(articles, dtype=object).fillna('').astype(str).str.strip(),
+        'name': pd.Series(names if names is not None else [''] * len(articles), dtype=object).fillna(''),
+        'demand': pd.to_numeric(pd.Series(quantities), errors='coerce').fillna(0),
+        'stock': pd.to_numeric(pd.Series(stock), errors='coerce').fillna(0),
+    })
+    df = df[df['article'] != '']
+    grouped = df.groupby('article', sort=False).agg(
+        name=('name', 'first'), demand=('demand', 'sum'), stock=('stock', 'max')
+    )
+    grouped['shortfall'] = (grouped['demand'] - grouped['stock']).clip(lower=0)
+    grouped = grouped[grouped['shortfall'] > 0].sort_values('shortfall', ascending=False, kind='stable')
+    return grouped.reset_index()
+
+
+def choose_print_file(prints, shortfall):
+    """
+    Выбирает вариант печати для закрытия нехватки.
+
+    Рассматриваются файлы с известным количеством изделий на столе и временем
+    печати. Лучший вариант - наименьшее суммарное время всех столов; при равенстве -
+    меньше минут на изделие, затем меньше лишних изделий.
+
+    Args:
+        prints (list): Файлы печати артикула (PrintFile)
+        shortfall (float): Сколько изделий не хватает
+
+    Returns:
+        tuple: (PrintFile, количество столов) или (None, 0), если подходящих файлов нет
+    """
+    best, best_key, best_plates = None, None, 0
+    for f in prints:
+        if not f.units or not f.minutes:
+            continue
+        plates = math.ceil(shortfall / f.units)
+        key = (plates * f.minutes, f.minutes / f.units, plates * f.units - shortfall)
+        if best_key is None or key < best_key:
+            best, best_key, best_plates = f, key, plates
+    return best, best_plates
+
+
+def build_print_plan(articles, quantities, stock, names=None, prints_lookup=find_prints):
+    """
+    Формирует лист "Что печатать".
+
+    Args:
+        articles (list): Артикулы по строкам выгрузки
+        quantities (list): Заказанное количество по строкам
+        stock (list): Остаток по ячейкам для артикула строки
+        names (list): Названия товаров по строкам
+        prints_lookup (callable): Поиск файлов печати по артикулу
+
+    Returns:
+        dict: Колонки листа {название колонки: список значений} (PRINT_PLAN_COLUMNS)
+    """
+    shortages = compute_shortages(articles, quantities, stock, names)
+    columns = {name: [] for name in PRINT_PLAN_COLUMNS}
+    for row in shortages.itertuples(index=False):
+        best, plates = choose_print_file(prints_lookup(normalize_article(row.article)), row.shortfall)
+        values = {
+            'Артикул': row.article,
+            'Название': row.name,
+            'Заказано': int(row.demand),
+            'На складе': int(row.stock),
+            'Не хватает': int(row.shortfall),
+            'Файл печати': best.name if best else 'нет файла печати',
+            'Шт на столе': best.units if best else None,
+            'Столов': plates if best else None,
+            'Будет напечатано': plates * best.units if best else None,
+            'Время печати, мин': plates * best.minutes if best else None,
+            'Пластик, г': round(plates * best.grams, 1) if best and best.grams else None,
+            'Цвет': best.color if best else None,
+        }
+        for name in PRINT_PLAN_COLUMNS:
+            columns[name].append(values[name])
+    return columns
+
+
+def plan_print_items(plan, prints_lookup=find_prints):
+    """
+    Сопоставляет строки плана печати с файлами печати.
+
+    Args:
+        plan (dict): Колонки листа "Что печатать" (build_print_plan)
+        prints_lookup (callable): Поиск файлов печати по артикулу
+
+    Returns:
+        list: Кортежи (артикул, PrintFile, количество столов) для строк с файлом печати
+    """
+    items = []
+    for article, file_name, plates in zip(plan['Артикул'], plan['Файл печати'], plan['Столов']):
+        if not plates:
+            continue
+        print_file = next((f for f in prints_lookup(normalize_article(article)) if f.name == file_name), None)
+        if print_file is not None:
+            items.append((article, print_file, int(plates)))
+    return items
+
+
+def forecast_filament(items):
+    """
+    Прогноз расхода пластика по материалу и цвету.
+
+    Args:
+        items (list): Кортежи (артикул, PrintFile, количество столов) -
+                      например, результат plan_print_items
+
+    Returns:
+        pandas.DataFrame: Колонки material, color, hex, plates, grams, unknown_plates
+                          (столы без веса в имени файла), spools (катушек по 1 кг),
+                          по убыванию расхода
+    """
+    df = pd.DataFrame(
+        [(f.material, f.color or '', f.hex or '', plates, f.grams) for _, f, plates in items],
+        columns=['material', 'color', 'hex', 'plates', 'grams_per_plate']
+    )
+    if df.empty:
+        return pd.DataFrame(columns=['material', 'color', 'hex', 'plates', 'grams', 'unknown_plates', 'spools'])
+
+    df['grams'] = df['plates'] * df['grams_per_plate'].fillna(0)
+    df['unknown_plates'] = df['plates'].where(df['grams_per_plate'].isna(), 0)
+    forecast = df.groupby(['material', 'color', 'hex'], dropna=False, sort=False).agg(
+        plates=('plates', 'sum'), grams=('grams', 'sum'), unknown_plates=('unknown_plates', 'sum')
+    ).reset_index()
+    forecast['grams'] = forecast['grams'].round(1)
+    forecast['spools'] = (forecast['grams'] / FILAMENT_SPOOL_GRAMS).apply(math.ceil)
+    return forecast.sort_values('grams', ascending=False, kind='stable').reset_index(drop=True)
+
+
+def filament_sheet(forecast):
+    """
+    Формирует лист "Расход пластика" по результату forecast_filament.
+
+    Returns:
+        dict: Колонки листа {название колонки: список значений}
+    """
+    material = [f"тип {int(m)}" if pd.notna(m) else 'не указан' for m in forecast['material']]
+    return {
+        'Материал': material,
+        'Цвет': forecast['color'].tolist(),
+        'HEX': forecast['hex'].tolist(),
+        'Столов': forecast['plates'].astype(int).tolist(),
+        'Пластик, г': forecast['grams'].tolist(),
+        'Катушек по 1 кг': forecast['spools'].astype(int).tolist(),
+        'Столов без веса': forecast['unknown_plates'].astype(int).tolist(),
+    }
+
+
+def filament_json(forecast):
+    """
+    Прогноз расхода пластика в виде, пригодном для JSON.
+
+    Returns:
+        dict: {'total_grams': всего грамм, 'items': [{material, color, hex, plates,
+              grams, spools, unknown_plates}, ...]}
+    """
+    items = []
+    for row in forecast.itertuples(index=False):
+        items.append({
+            'material': int(row.material) if pd.notna(row.material) else None,
+            'color': row.color or None,
+            'hex': row.hex or None,
+            'plates': int(row.plates),
+            'grams': float(row.grams),
+            'spools': int(row.spools),
+            'unknown_plates': int(row.unknown_plates),
+        })
+    return {'total_grams': round(float(forecast['grams'].sum()), 1) if len(forecast) else 0.0, 'items': items}
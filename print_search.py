@@ -0,0 +1,203 @@
+"""
+Поиск файлов печати SimplyPrint.
+
+Обратный индекс поверх индекса simplyprint.py: для каждого поля (артикул,
+цвет, материал, сопло, папка) хранится словарь {токен: множество id файлов}
+и отсортированный список токенов. Поиск по префиксу - бинарный поиск в
+отсортированном списке, пересечение множеств по всем условиям запроса.
+
+Когда выгрузка дерева заменяется, индекс не строится заново: сравниваются
+файлы старой и новой выгрузки, и обновляются только записи удалённых,
+добавленных и изменённых файлов.
+
+Пример:
+    search_prints(q='N317', color='white', nozzle='0.4')
+"""
+
+import re
+import threading
+from bisect import bisect_left
+
+from simplyprint import DEFAULT_TREE_PATH, get_print_index
+
+# Поля индекса, по которым возможен поиск
+SEARCH_FIELDS = ('article', 'color', 'material', 'nozzle', 'path')
+
+_TOKEN_SPLIT_RE = re.compile(r"[\s_\-.,/()]+")
+
+
+def _tokens(text):
+    return [t for t in _TOKEN_SPLIT_RE.split(str(text).upper()) if t]
+
+
+def _document_tokens(article, print_file):
+    """Токены файла печати по полям индекса."""
+    tokens = {
+        # Артикул целиком и по частям: N317-12 -> N317-12, N317, 12
+        'article': {article.upper(), *_tokens(article), *_tokens(print_file.name)},
+        'color': set(_tokens(print_file.color)) if print_file.color else set(),
+        'material': {str(print_file.material)} if print_file.material is not None else set(),
+        'nozzle': {f"{print_file.nozzle:g}"} if print_file.nozzle is not None else set(),
+        # Папка хранится целиком: префикс "1_100" находит всё внутри неё
+        'path': {print_file.path.upper()} if print_file.path else set(),
+    }
+    return tokens
+
+
+class PrintSearchIndex:
+    """
+    Обратный индекс файлов печати с поиском по префиксам.
+
+    Args:
+        articles (dict): Индекс simplyprint {артикул: [PrintFile, ...]}
+    """
+
+    def __init__(self, articles=None):
+        self.docs = {}       # id файла -> (артикул, PrintFile)
+        self.postings = {field: {} for field in SEARCH_FIELDS}
+        self._sorted = {field: None for field in SEARCH_FIELDS}
+        self._lock = threading.Lock()
+        if articles:
+            self.update(articles)
+
+    def _add(self, doc_id, article, print_file):
+        self.docs[doc_id] = (article, print_file)
+        for field, tokens in _document_tokens(article, print_file).items():
+            postings = self.postings[field]
+            for token in tokens:
+                if token not in postings:
+                    postings[token] = set()
+                    self._sorted[field] = None
+                postings[token].add(doc_id)
+
+    def _remove(self, doc_id):
+        article, print_file = self.docs.pop(doc_id)
+        for field, tokens in _document_tokens(article, print_file).items():
+            postings = self.postings[field]
+            for token in tokens:
+                ids = postings.get(token)
+                if ids is None:
+                    continue
+                ids.discard(doc_id)
+                if not ids:
+                    del postings[token]
+                    self._sorted[field] = None
+
+    def update(self, articles):
+        """
+        Приводит индекс к новому состоянию дерева, меняя только отличающиеся файлы.
+
+        Args:
+            articles (dict): Индекс simplyprint {артикул: [PrintFile, ...]}
+
+        Returns:
+            dict: Количество файлов {'added', 'removed', 'changed'}
+        """
+        new_docs = {f.id: (article, f) for article, files in articles.items() for f in files}
+        with self._lock:
+            removed = [doc_id for doc_id in self.docs if doc_id not in new_docs]
+            added = [doc_id for doc_id in new_docs if doc_id not in self.docs]
+            changed = [doc_id for doc_id, doc in new_docs.items()
+                       if doc_id in self.docs and self.docs[doc_id] != doc]
+            for doc_id in removed + changed:
+                self._remove(doc_id)
+            for doc_id in added + changed:
+                self._add(doc_id, *new_docs[doc_id])
+        return {'added': len(added), 'removed': len(removed), 'changed': len(changed)}
+
+    def _prefix_ids(self, field, prefix):
+        """Множество id файлов, у которых в поле есть токен с заданным префиксом."""
+        keys = self._sorted[field]
+        if keys is None:
+            keys = self._sorted[field] = sorted(self.postings[field])
+        postings = self.postings[field]
+        result = set()
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix):
+            result |= postings[keys[i]]
+            i += 1
+        return result
+
+    def search(self, q=None, limit=50, **filters):
+        """
+        Ищет файлы печати.
+
+        Args:
+            q (str): Текст запроса: каждое слово - префикс артикула или части имени файла
+            limit (int): Максимум результатов
+            **filters: Префиксы по полям color, material, nozzle, path, article
+
+        Returns:
+            tuple: (найдено всего, [(артикул, PrintFile), ...] не более limit)
+        """
+        conditions = [('article', token) for token in _tokens(q or '')]
+        for field, value in filters.items():
+            if field not in SEARCH_FIELDS:
+                raise ValueError(f"Неизвестное поле поиска: {field}")
+            if value is None or str(value).strip() == '':
+                continue
+            prefix = str(value).strip().upper()
+            if field == 'nozzle':
+                try:
+                    prefix = f"{float(prefix):g}"
+                except ValueError:
+                    pass
+            conditions.append((field, prefix))
+
+        with self._lock:
+            if not conditions:
+                ids = set(self.docs)
+            else:
+                # Сначала самые избирательные условия: пересечение быстрее сужается
+                sets = sorted((self._prefix_ids(field, prefix) for field, prefix in conditions), key=len)
+                ids = set(sets[0])
+                for other in sets[1:]:
+                    ids &= other
+                    if not ids:
+                        break
+            found = [self.docs[doc_id] for doc_id in ids]
+
+        found.sort(key=lambda doc: (doc[0], doc[1].name))
+        return len(found), found[:limit]
+
+
+_search_index = None
+_search_source = None
+_search_lock = threading.Lock()
+
+
+def get_search_index(tree_path=DEFAULT_TREE_PATH):
+    """
+    Возвращает поисковый индекс, актуальный для текущей выгрузки дерева.
+
+    При замене файла дерева индекс обновляется инкрементально (PrintSearchIndex.update).
+
+    Returns:
+        PrintSearchIndex: Поисковый индекс
+    """
+    global _search_index, _search_source
+    articles = get_print_index(tree_path)
+    with _search_lock:
+        if _search_index is None:
+            _search_index = PrintSearchIndex(articles)
+        elif _search_source is not articles:
+            changes = _search_index.update(articles)
+            print(f"Индекс поиска SimplyPrint обновлён: {changes}", flush=True)
+        _search_source = articles
+        return _search_index
+
+
+def search_prints(q=None, limit=50, tree_path=DEFAULT_TREE_PATH, **filters):
+    """
+    Ищет файлы печати в текущей выгрузке дерева SimplyPrint.
+
+    Args:
+        q (str): Текст запроса (префиксы артикула / частей имени файла)
+        limit (int): Максимум результатов
+        tree_path (str): Путь к simplyprint_tree.json
+        **filters: Префиксы по полям color, material, nozzle, path, article
+
+    Returns:
+        tuple: (найдено всего, [(артикул, PrintFile), ...])
+    """
+    return get_search_index(tree_path).search(q, limit=limit, **filters)
@@ -0,0 +1,211 @@
+"""
+Распределение заданий печати по принтерам фермы.
+
+Каждое задание - один стол файла печати SimplyPrint с известным временем.
+Принтеры описываются соплом и заправленным пластиком; задание можно отдать
+только принтеру с подходящим соплом, материалом и цветом (пустое значение
+у принтера или файла означает "подходит любой").
+
+Распределение - LPT (longest processing time first): задания по убыванию
+длительности, каждое - на наименее загруженный подходящий принтер. Для
+однородной фермы время завершения не хуже 4/3 от оптимума. Принтеры с
+одинаковым набором подходящих заданий выбираются через кучу, поэтому
+тысячи заданий распределяются за миллисекунды.
+
+Описание фермы - JSON файл (TOCKA_PRINTERS, по умолчанию printers.json):
+    [
+        {"name": "P1", "nozzle": 0.4, "color": "black"},
+        {"name": "P2", "nozzle": 0.4, "material": 38077, "color": "white", "count": 3}
+    ]
+"count" размножает описание: P2-1, P2-2, P2-3.
+
+"material" - это id типа материала SimplyPrint (как в тегах файлов печати,
+например 38077), а не название: "PLA" не совпадёт ни с одним файлом.
+Материал принтера, которому не подходит ни одно задание, попадает в
+предупреждения schedule_jobs.
+"""
+
+import heapq
+import json
+import os
+from collections import namedtuple
+
+from print_plan import plan_print_items
+from simplyprint import find_prints
+
+PRINTERS_FILE = os.environ.get("TOCKA_PRINTERS", "printers.json")
+
+# Название листа очереди печати в отчёте
+SCHEDULE_SHEET = 'Очередь печати'
+
+SCHEDULE_COLUMNS = ['Принтер', '№', 'Артикул', 'Файл печати', 'Начало, мин', 'Окончание, мин']
+
+Job = namedtuple("Job", ["article", "file", "minutes", "nozzle", "material", "color"])
+
+
+def _norm_color(color):
+    return str(color).strip().lower() if color else None
+
+
+def _norm_nozzle(nozzle):
+    """Диаметр сопла числом: "0.4" и "0,4" - 0.4."""
+    if nozzle is None or nozzle == "":
+        return None
+    try:
+        return float(str(nozzle).replace(",", "."))
+    except ValueError:
+        return nozzle
+
+
+def _norm_material(material):
+    """Id типа материала SimplyPrint числом ("38077" - 38077); название остаётся строкой."""
+    if material is None or material == "":
+        return None
+    text = str(material).strip()
+    return int(text) if text.isdigit() else text
+
+
+def load_printers(path=PRINTERS_FILE):
+    """
+    Читает описание фермы принтеров.
+
+    Args:
+        path (str): Путь к JSON файлу со списком принтеров
+
+    Returns:
+        list: Принтеры {'name', 'nozzle', 'material', 'color'}; пустой список,
+              если файла нет
+    """
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+
+    printers = []
+    for i, item in enumerate(items, start=1):
+        count = int(item.get("count", 1))
+        base = item.get("name") or f"Принтер {i}"
+        for n in range(1, count + 1):
+            printers.append({
+                "name": f"{base}-{n}" if count > 1 else base,
+                "nozzle": _norm_nozzle(item.get("nozzle")),
+                "material": _norm_material(item.get("material")),
+                "color": _norm_color(item.get("color")),
+            })
+    return printers
+
+
+def jobs_from_plan(plan, prints_lookup=find_prints):
+    """
+    Разворачивает план печати в задания: по одному на каждый стол.
+
+    Args:
+        plan (dict): Колонки листа "Что печатать" (print_plan.build_print_plan)
+        prints_lookup (callable): Поиск файлов печати по артикулу
+
+    Returns:
+        list: Задания Job
+    """
+    jobs = []
+    for article, print_file, plates in plan_print_items(plan, prints_lookup):
+        if not print_file.minutes:
+            continue
+        job = Job(article, print_file.name, print_file.minutes, print_file.nozzle,
+                  print_file.material, _norm_color(print_file.color))
+        jobs.extend([job] * plates)
+    return jobs
+
+
+def is_compatible(job, printer):
+    """Проверяет, может ли принтер напечатать задание (сопло, материал, цвет)."""
+    for field in ("nozzle", "material", "color"):
+        need, have = getattr(job, field), printer.get(field)
+        if need is not None and have is not None and need != have:
+            return False
+    return True
+
+
+def schedule_jobs(jobs, printers):
+    """
+    Распределяет задания по принтерам (LPT с учётом совместимости).
+
+    Args:
+        jobs (list): Задания Job
+        printers (list): Принтеры {'name', 'nozzle', 'material', 'color'}
+
+    Returns:
+        dict: {
+            'queues': {имя принтера: [(Job, начало, окончание), ...]},
+            'loads': {имя принтера: минут},
+            'makespan': время завершения всей печати, мин,
+            'unscheduled': задания без подходящего принтера,
+            'warnings': материалы принтеров, не совпавшие ни с одним заданием
+        }
+    """
+    loads = [0] * len(printers)
+    queues = [[] for _ in printers]
+    unscheduled = []
+
+    # Задания с одинаковыми требованиями подходят одному и тому же набору принтеров:
+    # набор и куча (загрузка, принтер) вычисляются один раз на такой ключ
+    heaps = {}
+
+    for job in sorted(jobs, key=lambda j: j.minutes, reverse=True):
+        key = (job.nozzle, job.material, job.color)
+        heap = heaps.get(key)
+        if heap is None:
+            heap = [(0, idx) for idx, p in enumerate(printers) if is_compatible(job, p)]
+            heapq.heapify(heap)
+            heaps[key] = heap
+        if not heap:
+            unscheduled.append(job)
+            continue
+
+        # Принтер мог получить задания через кучи других ключей: устаревшие
+        # записи обновляются до актуальной загрузки
+        while True:
+            load, idx = heap[0]
+            if load == loads[idx]:
+                break
+            heapq.heapreplace(heap, (loads[idx], idx))
+
+        start = loads[idx]
+        loads[idx] = start + job.minutes
+        queues[idx].append((job, start, loads[idx]))
+        heapq.heapreplace(heap, (loads[idx], idx))
+
+    # Материал принтера, не совпавший ни с одним заданием, - обычно название
+    # вместо id типа SimplyPrint; такой принтер не получает заданий с материалом
+    job_materials = {job.material for job in jobs if job.material is not None}
+    warnings = []
+    if job_materials:
+        for p in printers:
+            if p.get('material') is not None and p['material'] not in job_materials:
+                warnings.append(f"{p['name']}: материал {p['material']!r} не совпадает ни с одним заданием "
+                                f"(нужен id типа материала SimplyPrint: {', '.join(map(str, sorted(job_materials)))})")
+
+    return {
+        'queues': {p['name']: queues[i] for i, p in enumerate(printers)},
+        'loads': {p['name']: loads[i] for i, p in enumerate(printers)},
+        'makespan': max(loads) if loads else 0,
+        'unscheduled': unscheduled,
+        'warnings': warnings,
+    }
+
+
+def schedule_sheet(result):
+    """
+    Формирует лист "Очередь печати" по результату schedule_jobs.
+
+    Returns:
+        dict: Колонки листа {название колонки: список значений}
+    """
+    columns = {name: [] for name in SCHEDULE_COLUMNS}
+    for printer, queue in result['queues'].items():
+        for n, (job, start, end) in enumerate(queue, start=1):
+            for name, value in zip(SCHEDULE_COLUMNS, (printer, n, job.article, job.file, start, end)):
+                columns[name].append(value)
+    for job in result['unscheduled']:
+        for name, value in zip(SCHEDULE_COLUMNS, ('нет подходящего принтера', None, job.article, job.file, None, None)):
+            columns[name].append(value)
+    return columns
@@ -3,6 +3,7 @@ import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from openpyxl import load_workbook
 from openpyxl.styles import Border, Side
+from excel_reader import read_table
 from moysklad_api import get_product_uuid, get_store_slots, get_stock_by_slot, STORE_ID
 from utils import (
     find_column_index,
@@ -15,7 +16,7 @@ progress: dict[str, str] = {}
 
 def process_file(input_path: str, output_path: str, session_id: str):
     progress[session_id] = "🔄 Старт обработки"
-    df = pd.read_excel(input_path, dtype=str)
+    df = read_table(input_path, dtype=str)
     total = len(df)
     progress[session_id] = f"📥 Загружено строк: {total}"
 
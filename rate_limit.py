@@ -0,0 +1,69 @@
+"""
+Ограничение частоты запросов к API МойСклад.
+
+МойСклад допускает не больше 45 запросов за 3 секунды и не больше
+5 одновременных запросов с одного пользователя; при превышении отвечает 429.
+Когда несколько файлов обрабатываются параллельно (batch.py), их потоки
+делят один RateLimiter и не превышают лимит вместе.
+
+Пример:
+    limiter = RateLimiter(45, 3.0, parallel=5)
+    with limiter:
+        requests.get(...)
+"""
+
+import threading
+import time
+from collections import deque
+
+
+class RateLimiter:
+    """
+    Скользящее окно запросов и ограничение одновременных запросов.
+
+    Args:
+        rate (int): Запросов в окне (0 - без ограничения частоты)
+        window (float): Длина окна в секундах
+        parallel (int): Одновременных запросов (0 - без ограничения)
+    """
+
+    def __init__(self, rate, window=3.0, parallel=0):
+        self.rate = rate
+        self.window = window
+        self.parallel = parallel
+        self._sent = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(parallel) if parallel > 0 else None
+        self.waited = 0.0  # Суммарное ожидание потоков, с
+
+    def acquire(self):
+        """Ждёт, пока запрос можно отправить, и учитывает его в окне."""
+        started = time.perf_counter()
+        if self._slots is not None:
+            self._slots.acquire()
+        if self.rate > 0:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    while self._sent and now - self._sent[0] >= self.window:
+                        self._sent.popleft()
+                    if len(self._sent) < self.rate:
+                        self._sent.append(now)
+                        break
+                    delay = self.window - (now - self._sent[0])
+                time.sleep(delay)
+        with self._lock:
+            self.waited += time.perf_counter() - started
+
+    def release(self):
+        """Освобождает место одновременного запроса."""
+        if self._slots is not None:
+            self._slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
@@ -0,0 +1,135 @@
+"""
+Формирование оформленного Excel отчёта.
+
+Модуль не зависит от Flask и глобального состояния приложения, поэтому
+write_report() можно выполнять в отдельном процессе (см. run_report_job
+в mp_v6.py): циклы openpyxl держат GIL и иначе тормозят обработку
+веб-запросов в том же процессе.
+
+Данные передаются в компактном виде - по каждому листу словарь
+{название колонки: список значений}, который дёшево сериализуется pickle.
+
+Книга пишется за один проход в режиме write-only: значения, рамки,
+выравнивание, ширина колонок и форматирование стикеров задаются сразу,
+без промежуточного to_excel и повторной загрузки файла.
+"""
+
+import os
+import time
+from copy import copy
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.utils import get_column_letter
+
+from utils import format_sticker_cell
+
+# Ширина колонок основного листа
+COLUMN_WIDTHS = {
+    '№ Стикера': 13,
+    'Количество': 7,
+    'Артикул': 12,
+    'Ячейки склада': 26,
+    'Взять из ячеек': 26,
+    'Название': 104,
+}
+
+# Колонки, выравниваемые по левому краю (остальные - по центру)
+LEFT_ALIGNED = {'Название', 'Файл печати', 'Файл'}
+
+# Колонка, к которой применяется format_sticker_cell
+STICKER_COLUMN = '№ Стикера'
+
+
+def _column_width(name, values):
+    """Ширина колонки: из COLUMN_WIDTHS или по самому длинному значению (не больше 60)."""
+    if name in COLUMN_WIDTHS:
+        return COLUMN_WIDTHS[name]
+    longest = max([len(str(name))] + [len(str(v)) for v in values[:1000] if v is not None])
+    return min(max(longest + 2, 8), 60)
+
+
+def write_report(output_path, sheets, retries=5, delay=3):
+    """
+    Записывает оформленный отчёт в .xlsx.
+
+    Args:
+        output_path (str): Путь к файлу отчёта
+        sheets (list): Листы отчёта - кортежи (название листа, {колонка: список значений}).
+                       Первый лист - основной
+        retries (int): Количество попыток заменить файл, если он занят
+        delay (int): Задержка между попытками в секундах
+
+    Returns:
+        dict: Время этапов {'format': сек, 'save': сек} и флаг 'saved'
+    """
+    started = time.perf_counter()
+    thin = Side(border_style='thin', color='000000')
+    border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    center = Alignment(horizontal='center', vertical='center')
+    left = Alignment(horizontal='left', vertical='center')
+    header_font = Font(bold=True)
+
+    wb = Workbook(write_only=True)
+    for title, columns in sheets:
+        ws = wb.create_sheet(title=title)
+        names = list(columns)
+        for idx, name in enumerate(names, start=1):
+            ws.column_dimensions[get_column_letter(idx)].width = _column_width(name, columns[name])
+
+        # Стили вычисляются один раз на колонку и копируются в ячейки:
+        # присваивание border/alignment каждой ячейке в openpyxl очень медленное
+        header_styles, body_styles = [], []
+        for name in names:
+            alignment = left if name in LEFT_ALIGNED else center
+            cell = WriteOnlyCell(ws)
+            cell.border = border
+            cell.alignment = alignment
+            body_styles.append(copy(cell._style))
+            cell.font = header_font
+            header_styles.append(copy(cell._style))
+        sticker_idx = names.index(STICKER_COLUMN) if STICKER_COLUMN in names else None
+
+        header = []
+        for name, style in zip(names, header_styles):
+            cell = WriteOnlyCell(ws, value=name)
+            cell._style = copy(style)
+            header.append(cell)
+        ws.append(header)
+
+        # Стиль выделенного стикера вычисляется на первой такой ячейке и дальше копируется
+        sticker_style = None
+        for values in zip(*(columns[name] for name in names)):
+            row = []
+            for idx, value in enumerate(values):
+                cell = WriteOnlyCell(ws, value=value)
+                cell._style = copy(body_styles[idx])
+                if idx == sticker_idx and format_sticker_cell(cell, sticker_style) and sticker_style is None:
+                    sticker_style = copy(cell._style)
+                row.append(cell)
+            ws.append(row)
+
+    formatted = time.perf_counter()
+
+    # Пишем во временный файл и подменяем: файл отчёта может быть открыт в Excel
+    tmp_path = output_path + '.tmp'
+    wb.save(tmp_path)
+    saved = False
+    for attempt in range(1, retries + 1):
+        try:
+            os.replace(tmp_path, output_path)
+            saved = True
+            break
+        except PermissionError:
+            print(f"Файл {output_path} занят другим процессом, попытка {attempt}/{retries}", flush=True)
+            if attempt < retries:
+                time.sleep(delay)
+    if not saved and os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    return {
+        'format': formatted - started,
+        'save': time.perf_counter() - formatted,
+        'saved': saved,
+    }
@@ -0,0 +1,105 @@
+"""
+Запуск приложения в рабочем режиме.
+
+python mp_v6.py запускает отладочный сервер Werkzeug: один процесс,
+перезагрузчик, состояние задач в памяти. Этот модуль запускает то же
+приложение через WSGI сервер с несколькими процессами-воркерами:
+- gunicorn (Linux/macOS): N процессов, в каждом пул потоков (gthread)
+- waitress (если gunicorn недоступен, например на Windows): один процесс с потоками
+
+Состояние задач (прогресс, флаги отмены, результаты создания заказов, время
+этапов) хранится в общей базе SQLite (TOCKA_STATE_DB), поэтому /status
+и /cancel отвечает любой воркер. Тяжёлое форматирование отчёта в одном
+процессе не блокирует обработку запросов в остальных.
+
+Метрики /metrics складываются по всем воркерам: каждый процесс сохраняет
+свой реестр в каталог TOCKA_METRICS_DIR (см. metrics.py), который очищается
+при запуске.
+
+Запуск:
+    python serve.py --workers 4 --threads 8 --port 5001
+"""
+
+import argparse
+import multiprocessing
+import os
+
+
+def run_gunicorn(args):
+    """Запускает приложение под gunicorn с воркерами gthread."""
+    from gunicorn.app.base import BaseApplication
+
+    def worker_exit(server, worker):
+        # Пул процессов отчётов воркера останавливается до его выхода
+        from mp_v6 import shutdown_report_pool
+        import metrics
+        shutdown_report_pool()
+        metrics.flush()
+
+    class TockaApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{args.host}:{args.port}")
+            self.cfg.set("workers", args.workers)
+            self.cfg.set("worker_class", "gthread")
+            self.cfg.set("threads", args.threads)
+            # Обработка файла идёт в фоновом потоке воркера, запросы при этом короткие
+            self.cfg.set("timeout", args.timeout)
+            self.cfg.set("accesslog", "-" if args.access_log else None)
+            self.cfg.set("worker_exit", worker_exit)
+
+        def load(self):
+            from mp_v6 import app, warm_sticker_index
+            warm_sticker_index()
+            return app
+
+    TockaApplication().run()
+
+
+def run_waitress(args):
+    """Запускает приложение под waitress (один процесс, несколько потоков)."""
+    from waitress import serve
+    from mp_v6 import app, warm_sticker_index, shutdown_report_pool
+
+    warm_sticker_index()
+    if args.workers > 1:
+        print("gunicorn недоступен: waitress работает в одном процессе, --workers игнорируется", flush=True)
+    try:
+        serve(app, host=args.host, port=args.port, threads=args.threads)
+    finally:
+        shutdown_report_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tocka Marketplace: запуск в рабочем режиме")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--workers", type=int, default=min(4, multiprocessing.cpu_count()),
+                        help="Количество процессов-воркеров")
+    parser.add_argument("--threads", type=int, default=8, help="Потоков на воркер")
+    parser.add_argument("--timeout", type=int, default=120, help="Таймаут запроса, сек")
+    parser.add_argument("--state-db", default=os.environ.get("TOCKA_STATE_DB", "jobs.sqlite3"),
+                        help="Файл SQLite с общим состоянием задач")
+    parser.add_argument("--metrics-dir", default=os.environ.get("TOCKA_METRICS_DIR", "metrics"),
+                        help="Каталог, через который воркеры складывают метрики /metrics")
+    parser.add_argument("--access-log", action="store_true", help="Писать журнал запросов в stdout")
+    args = parser.parse_args()
+
+    # Задаётся до импорта mp_v6: от неё зависит, где хранится состояние задач
+    os.environ["TOCKA_STATE_DB"] = os.path.abspath(args.state_db)
+    os.environ["TOCKA_METRICS_DIR"] = os.path.abspath(args.metrics_dir)
+    # Реестры процессов прошлого запуска не должны попасть в сумму
+    os.makedirs(args.metrics_dir, exist_ok=True)
+    for name in os.listdir(args.metrics_dir):
+        if name.endswith(".json"):
+            os.remove(os.path.join(args.metrics_dir, name))
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        run_waitress(args)
+    else:
+        run_gunicorn(args)
+
+
+if __name__ == "__main__":
+    main()
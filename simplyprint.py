@@ -0,0 +1,276 @@
+"""
+Индекс файлов печати SimplyPrint по артикулам.
+
+simplyprint_tree.json - выгрузка дерева папок SimplyPrint: папки вида
+1_100/01_N317-12 (порядковый номер + артикул), в каждой - файлы печати
+с именами вида 01_N317-12_10k_2h44min_75g_white.gcode, где
+10k - изделий на одном столе, 2h44min - время печати, 75g - расход пластика.
+
+Дерево разбирается один раз в компактный индекс {артикул: [PrintFile, ...]}.
+Индекс сохраняется рядом с деревом в бинарном снимке (pickle) вместе
+с mtime и размером исходного файла: при следующем запуске снимок читается
+вместо разбора JSON, а при изменении дерева индекс пересобирается.
+
+Пример:
+    from simplyprint import find_prints
+    for f in find_prints('N317-12'):
+        print(f.name, f.units, f.minutes, f.grams)
+"""
+
+import json
+import os
+import pickle
+import re
+import threading
+from collections import namedtuple
+
+# Версия формата снимка: при изменении разбора снимки старой версии пересобираются
+SNAPSHOT_VERSION = 2
+
+DEFAULT_TREE_PATH = os.environ.get(
+    "SIMPLYPRINT_TREE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "simplyprint_tree.json")
+)
+
+PrintFile = namedtuple("PrintFile", [
+    "id",        # Идентификатор файла в SimplyPrint
+    "name",      # Имя файла
+    "path",      # Папка в дереве SimplyPrint
+    "size",      # Размер файла в байтах
+    "nozzle",    # Диаметр сопла, мм (None если не указан)
+    "material",  # Тип материала SimplyPrint (None если не указан)
+    "color",     # Цвет пластика
+    "hex",       # Цвет пластика в HEX из тегов SimplyPrint (None если не указан)
+    "units",     # Изделий на одном столе (None если не указано в имени)
+    "minutes",   # Время печати стола в минутах
+    "grams",     # Расход пластика на стол в граммах
+])
+
+# Папка товара: порядковый номер, разделитель и артикул (01_N317-12, 449-52413, 54.7_N406-05-54.7)
+_FOLDER_RE = re.compile(r"^\d+(?:[.,]\d+)?[_-](.+)$")
+
+# Расширения в конце имени файла, в том числе дубли вида ".gcode (1)"
+_EXT_RE = re.compile(r"(\.(?:gcode|3mf|stl))+(\s*\(\d+\))?$", re.IGNORECASE)
+
+# Части имени разделяются "_", но встречаются и "-", ".", пробелы
+_SEP = r"(?:^|(?<=[_.\-\s+()]))"
+_END = r"(?=[_.\-\s+()]|$)"
+_UNITS_RE = re.compile(_SEP + r"(\d+(?:[.,]\d+)?)\s*(?:k|pcs?|cs|шт)" + _END, re.IGNORECASE)
+# 2h44min, 11h57m, 15h_8m, 3h, 39m (с опечатками: кириллические р/м, n/ь вместо m)
+_TIME_RE = re.compile(
+    _SEP + r"(?:(\d+)\s*[hчр](?:_?(\d+)\s*(?:min|mm|[mмnь])?)?|(\d+)\s*(?:min|mm|[mм]))" + _END,
+    re.IGNORECASE
+)
+_GRAMS_RE = re.compile(_SEP + r"(\d+(?:[.,]\d+)?)\s*(?:gr?|г)" + _END, re.IGNORECASE)
+_COLOR_RE = re.compile(r"^[_.\-\s]+([a-zа-я_]+)$", re.IGNORECASE)
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _number(text):
+    return float(text.replace(",", "."))
+
+
+def article_from_folder(name):
+    """
+    Извлекает артикул из имени папки товара.
+
+    Args:
+        name (str): Имя папки (например "01_N317-12")
+
+    Returns:
+        str or None: Артикул (например "N317-12") или None, если имя не по шаблону
+    """
+    match = _FOLDER_RE.match(name.strip())
+    return match.group(1).strip() if match else None
+
+
+def normalize_article(article):
+    """Приводит артикул к виду ключа индекса (без пробелов по краям, в верхнем регистре)."""
+    return str(article).strip().upper()
+
+
+def parse_print_name(name):
+    """
+    Разбирает параметры печати из имени файла.
+
+    Args:
+        name (str): Имя файла (например "01_N317-12_10k_2h44min_75g_white.gcode")
+
+    Returns:
+        dict: units, minutes, grams и color; ненайденные значения - None
+
+    Пример:
+        "01_N317-12_10k_2h44min_75g_white.gcode" ->
+        {'units': 10, 'minutes': 164, 'grams': 75.0, 'color': 'white'}
+    """
+    stem = _EXT_RE.sub("", name.strip())
+
+    units = _UNITS_RE.search(stem)
+    units = _number(units.group(1)) if units else None
+    if units is not None and units.is_integer():
+        units = int(units)
+
+    minutes = None
+    time_match = _TIME_RE.search(stem)
+    if time_match:
+        hours, mins, only_mins = time_match.groups()
+        if hours is not None:
+            minutes = int(hours) * 60 + int(mins or 0)
+        else:
+            minutes = int(only_mins)
+
+    grams_match = _GRAMS_RE.search(stem)
+    grams = _number(grams_match.group(1)) if grams_match else None
+
+    # Цвет пишется после расхода пластика: ..._75g_white
+    color = None
+    if grams_match:
+        color_match = _COLOR_RE.search(stem[grams_match.end():])
+        color = color_match.group(1).lower() if color_match else None
+
+    return {"units": units, "minutes": minutes, "grams": grams, "color": color}
+
+
+def _make_print_file(entry):
+    parsed = parse_print_name(entry.get("name", ""))
+    tags = entry.get("tags") or {}
+    materials = tags.get("material") or []
+    material = materials[0] if materials else {}
+    color = material.get("color")
+    return PrintFile(
+        id=entry.get("id"),
+        name=entry.get("name", ""),
+        path=entry.get("path", ""),
+        size=entry.get("size") or 0,
+        nozzle=tags.get("nozzle"),
+        material=material.get("type"),
+        color=color.lower() if color else parsed["color"],
+        hex=material.get("hex"),
+        units=parsed["units"],
+        minutes=parsed["minutes"],
+        grams=parsed["grams"],
+    )
+
+
+def build_index(tree):
+    """
+    Строит индекс файлов печати по дереву SimplyPrint.
+
+    Args:
+        tree (list): Разобранный simplyprint_tree.json
+
+    Returns:
+        dict: {артикул в верхнем регистре: [PrintFile, ...]}
+    """
+    index = {}
+    stack = list(tree)
+    while stack:
+        node = stack.pop()
+        children = node.get("children") or []
+        files = list(node.get("files") or []) + [c for c in children if "ext" in c]
+        stack.extend(c for c in children if "ext" not in c)
+
+        article = article_from_folder(node.get("name", ""))
+        if article is None or not files:
+            continue
+        entries = index.setdefault(normalize_article(article), [])
+        entries.extend(_make_print_file(f) for f in files)
+
+    # Порядок файлов стабилен независимо от порядка обхода дерева
+    return {article: sorted(entries, key=lambda f: f.name) for article, entries in index.items()}
+
+
+def snapshot_path_for(tree_path):
+    """Путь к бинарному снимку индекса для файла дерева."""
+    return os.path.splitext(tree_path)[0] + ".index.pickle"
+
+
+def load_index(tree_path=DEFAULT_TREE_PATH, snapshot_path=None):
+    """
+    Загружает индекс из снимка или строит его из дерева SimplyPrint.
+
+    Снимок используется, только если совпадают версия формата, mtime и размер
+    дерева. Иначе дерево разбирается заново и снимок перезаписывается.
+
+    Args:
+        tree_path (str): Путь к simplyprint_tree.json
+        snapshot_path (str): Путь к снимку (по умолчанию рядом с деревом)
+
+    Returns:
+        dict: {'source': (mtime_ns, size), 'articles': {артикул: [PrintFile, ...]}}
+    """
+    snapshot_path = snapshot_path or snapshot_path_for(tree_path)
+    stat = os.stat(tree_path)
+    source = (stat.st_mtime_ns, stat.st_size)
+
+    try:
+        with open(snapshot_path, "rb") as f:
+            snapshot = pickle.load(f)
+        if snapshot.get("version") == SNAPSHOT_VERSION and snapshot.get("source") == source:
+            return snapshot
+    except Exception:
+        # Нет снимка, он повреждён или записан другой версией модуля - строим заново
+        pass
+
+    with open(tree_path, "r", encoding="utf-8") as f:
+        tree = json.load(f)
+    snapshot = {"version": SNAPSHOT_VERSION, "source": source, "articles": build_index(tree)}
+
+    # Пишем через временный файл, чтобы параллельный процесс не прочитал недописанный снимок
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        print(f"Не удалось сохранить снимок индекса SimplyPrint {snapshot_path}: {e}", flush=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return snapshot
+
+
+def get_print_index(tree_path=DEFAULT_TREE_PATH):
+    """
+    Возвращает индекс файлов печати, загруженный в память процесса.
+
+    Индекс перечитывается, если файл дерева изменился с момента загрузки.
+
+    Returns:
+        dict: {артикул в верхнем регистре: [PrintFile, ...]}
+    """
+    global _index
+    stat = os.stat(tree_path)
+    source = (stat.st_mtime_ns, stat.st_size)
+    with _index_lock:
+        if _index is None or _index["path"] != tree_path or _index["source"] != source:
+            snapshot = load_index(tree_path)
+            _index = {"path": tree_path, "source": snapshot["source"], "articles": snapshot["articles"]}
+        return _index["articles"]
+
+
+def find_prints(article, tree_path=DEFAULT_TREE_PATH):
+    """
+    Возвращает файлы печати для артикула.
+
+    Args:
+        article (str): Артикул товара (регистр не важен)
+        tree_path (str): Путь к simplyprint_tree.json
+
+    Returns:
+        list: Список PrintFile (пустой, если для артикула нет файлов)
+    """
+    return get_print_index(tree_path).get(normalize_article(article), [])
+
+
+if __name__ == "__main__":
+    import sys
+
+    articles = get_print_index()
+    if len(sys.argv) < 2:
+        print(f"Артикулов в индексе: {len(articles)}, файлов: {sum(len(v) for v in articles.values())}")
+    for arg in sys.argv[1:]:
+        print(f"{arg}:")
+        for f in find_prints(arg):
+            print(f"  {f.name}  ({f.units} шт, {f.minutes} мин, {f.grams} г, {f.color}, сопло {f.nozzle})")
@@ -0,0 +1,239 @@
+"""
+Индекс стикеров по последним отчётам: поиск строки отчёта по скану стикера.
+
+Упаковщик сканирует стикер и должен найти его строку в отчёте. Индекс
+хранит строки последних max_reports отчётов (артикул, количество, ячейки,
+что взять из ячеек, название) и ищет их:
+- по стикеру целиком (пробелы и регистр не важны: в Excel стикер записан
+  как "ABC123 4567", см. utils.format_sticker_cell);
+- по последним 4 символам стикера, которые в отчёте выделены жирным.
+
+Отчёты добавляются сразу после обработки (add_report), а при поиске папка
+отчётов не чаще раза в rescan секунд сверяется с индексом (refresh): так
+индекс восстанавливается после перезапуска и видит отчёты, созданные
+другими процессами, а удалённые отчёты из него уходят.
+
+Пример:
+    index = StickerIndex('results', max_reports=20)
+    index.lookup('4567')
+"""
+
+import os
+import threading
+import time
+
+from openpyxl import load_workbook
+
+# Колонки основного листа отчёта и поля результата поиска
+FIELDS = {
+    '№ Стикера': 'sticker',
+    'Артикул': 'article',
+    'Количество': 'quantity',
+    'Ячейки склада': 'slots',
+    'Взять из ячеек': 'take',
+    'Название': 'name',
+    'Склад': 'store',
+    'Файл': 'file',
+}
+
+# Длина выделенной части стикера
+SUFFIX_LENGTH = 4
+
+
+def sticker_key(value):
+    """Стикер для сравнения: без пробелов, в верхнем регистре ('' - не стикер)."""
+    key = "".join(str(value or "").split()).upper()
+    return "" if key in ("", "*", "NAN", "NONE") else key
+
+
+def _clean_value(name, value):
+    """Значение ячейки для индекса: числа numpy - числа Python, NaN - None,
+    целые дробные - целые, стикер - без пробела, добавленного в Excel."""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer() and name != '№ Стикера':
+            return int(value)
+    if name == '№ Стикера' and value is not None:
+        return "".join(str(value).split())
+    return value
+
+
+def clean_row(row):
+    """Строка отчёта для индекса: только колонки FIELDS, значения через _clean_value."""
+    return {name: _clean_value(name, row.get(name)) for name in FIELDS if name in row}
+
+
+def read_report_rows(path):
+    """
+    Читает строки основного листа отчёта.
+
+    Args:
+        path (str): Путь к отчёту .xlsx
+
+    Returns:
+        list: Строки {колонка отчёта: значение} для колонок FIELDS
+    """
+    wb = load_workbook(path, read_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = [str(value or '').strip() for value in next(rows, ())]
+        columns = [(i, name) for i, name in enumerate(header) if name in FIELDS]
+        if not any(name == '№ Стикера' for _, name in columns):
+            return []
+        return [clean_row({name: row[i] if i < len(row) else None for i, name in columns}) for row in rows]
+    finally:
+        wb.close()
+
+
+class StickerIndex:
+    """
+    Индекс строк последних отчётов по стикеру и его последним 4 символам.
+
+    Args:
+        folder (str): Папка отчётов (сверяется с индексом в refresh)
+        max_reports (int): Сколько последних отчётов хранить
+        rescan (float): Минимальный интервал между сверками с папкой, секунды
+    """
+
+    def __init__(self, folder, max_reports=20, rescan=2.0):
+        self.folder = folder
+        self.max_reports = max_reports
+        self.rescan = rescan
+        self.reports = {}     # путь -> {'mtime', 'rows'}
+        self.by_sticker = {}  # стикер -> [(путь, номер строки), ...]
+        self.by_suffix = {}   # последние 4 символа -> [(путь, номер строки), ...]
+        self._scanned = 0.0
+        self._lock = threading.Lock()
+
+    def _rebuild(self):
+        """Пересобирает словари поиска по self.reports (под блокировкой)."""
+        by_sticker, by_suffix = {}, {}
+        for path, report in self.reports.items():
+            for n, row in enumerate(report['rows']):
+                key = sticker_key(row.get('№ Стикера'))
+                if not key:
+                    continue
+                by_sticker.setdefault(key, []).append((path, n))
+                if len(key) >= SUFFIX_LENGTH:
+                    by_suffix.setdefault(key[-SUFFIX_LENGTH:], []).append((path, n))
+        self.by_sticker, self.by_suffix = by_sticker, by_suffix
+
+    def _trim(self):
+        """Оставляет max_reports самых новых отчётов (под блокировкой)."""
+        newest = sorted(self.reports, key=lambda path: self.reports[path]['mtime'], reverse=True)
+        for path in newest[self.max_reports:]:
+            del self.reports[path]
+
+    def add_report(self, path, rows, mtime=None):
+        """
+        Добавляет или заменяет строки отчёта.
+
+        Args:
+            path (str): Путь к отчёту
+            rows (list): Строки {колонка отчёта: значение}
+            mtime (float): Время изменения файла (по умолчанию берётся с диска)
+        """
+        if mtime is None:
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                mtime = time.time()
+        rows = [clean_row(row) for row in rows]
+        with self._lock:
+            self.reports[os.path.abspath(path)] = {'mtime': mtime, 'rows': rows}
+            self._trim()
+            self._rebuild()
+
+    def refresh(self, force=False):
+        """
+        Сверяет индекс с папкой отчётов: читает новые и изменённые отчёты,
+        убирает удалённые.
+
+        Args:
+            force (bool): Сверить, даже если с прошлой сверки прошло меньше rescan секунд
+
+        Returns:
+            int: Сколько отчётов прочитано с диска
+        """
+        now = time.monotonic()
+        if not force and now - self._scanned < self.rescan:
+            return 0
+        self._scanned = now
+        try:
+            names = [name for name in os.listdir(self.folder)
+                     if name.endswith('.xlsx') and not name.startswith('~$')]
+        except OSError:
+            names = []
+        files = {}
+        for name in names:
+            path = os.path.abspath(os.path.join(self.folder, name))
+            try:
+                files[path] = os.path.getmtime(path)
+            except OSError:
+                continue
+        latest = sorted(files, key=files.get, reverse=True)[:self.max_reports]
+
+        with self._lock:
+            known = {path: report['mtime'] for path, report in self.reports.items()}
+        changed = [path for path in latest if known.get(path) != files[path]]
+        loaded = {}
+        for path in changed:
+            try:
+                loaded[path] = read_report_rows(path)
+            except Exception as e:
+                print(f"Не удалось прочитать отчёт {path} для индекса стикеров: {e}", flush=True)
+
+        with self._lock:
+            gone = [path for path in self.reports
+                    if path not in files and os.path.dirname(path) == os.path.abspath(self.folder)]
+            for path in gone:
+                del self.reports[path]
+            for path, rows in loaded.items():
+                self.reports[path] = {'mtime': files[path], 'rows': rows}
+            if gone or loaded:
+                self._trim()
+                self._rebuild()
+        return len(loaded)
+
+    def lookup(self, code):
+        """
+        Ищет строки отчётов по скану стикера.
+
+        Сначала ищется стикер целиком, затем - по последним 4 символам.
+        Одинаковые строки (сводный отчёт волны и отчёт файла) возвращаются
+        один раз; строки новых отчётов идут первыми.
+
+        Args:
+            code (str): Отсканированный стикер или его последние 4 символа
+
+        Returns:
+            tuple: (способ поиска 'sticker' / 'suffix' или None, список строк
+                   {sticker, article, quantity, slots, take, name, [store, file],
+                   report, report_time})
+        """
+        key = sticker_key(code)
+        if not key:
+            return None, []
+        self.refresh()
+        with self._lock:
+            matched_by, hits = 'sticker', self.by_sticker.get(key)
+            if not hits and len(key) == SUFFIX_LENGTH:
+                matched_by, hits = 'suffix', self.by_suffix.get(key)
+            if not hits:
+                return None, []
+            hits = sorted(hits, key=lambda hit: -self.reports[hit[0]]['mtime'])
+            items, seen = [], set()
+            for path, n in hits:
+                row = self.reports[path]['rows'][n]
+                item = {FIELDS[name]: value for name, value in row.items()}
+                signature = tuple(str(item.get(field)) for field in ('sticker', 'article', 'quantity', 'take'))
+                if signature in seen:
+                    continue
+                seen.add(signature)
+                item['report'] = os.path.basename(path)
+                item['report_time'] = self.reports[path]['mtime']
+                items.append(item)
+        return matched_by, items
@@ -0,0 +1,290 @@
+"""
+Локальное зеркало остатков по ячейкам, обновляемое вебхуками МойСклад.
+
+Остатки по ячейкам - самые изменчивые данные, и запрос
+/report/stock/byslot/current на каждый товар каждой загрузки - самая
+медленная часть обработки. Зеркало хранит остатки в SQLite (TOCKA_STOCK_DB)
+и обновляется двумя путями:
+- вебхуки на документы, меняющие остатки (отгрузка, перемещение, приёмка,
+  инвентаризация): по документу определяются его товары, и их остатки
+  перечитываются одним запросом (StockWebhookWorker);
+- периодическая полная сверка (StockReconcile): весь отчёт по ячейкам
+  целиком заменяет зеркало и исправляет пропущенные вебхуки.
+
+Вебхук МойСклад не содержит самих остатков, а по изменённому документу
+нельзя надёжно вычислить разницу (при изменении или удалении документа
+прежнее содержимое неизвестно), поэтому остатки товаров документа
+перечитываются из отчёта. Для удалённого документа товары берутся из
+запомненного ранее состава; если его нет - запускается внеочередная сверка.
+
+Зеркало используется, только пока с последней полной сверки прошло не
+больше max_age секунд (StockMirror.is_fresh); иначе остатки запрашиваются
+через API как обычно.
+
+Модуль не делает HTTP запросов сам: функции получения данных передаёт
+вызывающий код (mp_v6).
+"""
+
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+# Типы документов, изменения которых меняют остатки по ячейкам
+STOCK_DOCUMENT_TYPES = ('demand', 'move', 'supply', 'inventory')
+
+
+def id_from_href(href):
+    """UUID объекта из ссылки meta.href (.../entity/product/<id>?expand=...)."""
+    return str(href or '').split('?', 1)[0].rstrip('/').rsplit('/', 1)[-1]
+
+
+class StockMirror:
+    """
+    Остатки по ячейкам в SQLite.
+
+    Args:
+        db_path (str): Путь к файлу базы SQLite
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stock ("
+                " product_id TEXT NOT NULL,"
+                " slot_id TEXT NOT NULL,"
+                " store_id TEXT,"
+                " qty REAL NOT NULL,"
+                " PRIMARY KEY (product_id, slot_id))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS product_updated (product_id TEXT PRIMARY KEY, at REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS documents (id TEXT PRIMARY KEY, products TEXT NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS mirror_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def _connection(self):
+        # У каждого потока своё соединение: sqlite3 не разрешает делить их между потоками
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _items(rows):
+        return [(row['assortmentId'], row['slotId'], row.get('storeId'), row.get('stock', 0))
+                for row in rows if row.get('assortmentId') and row.get('slotId') and row.get('stock', 0) > 0]
+
+    def replace_all(self, rows, started):
+        """
+        Полностью заменяет зеркало отчётом по ячейкам (полная сверка).
+
+        Товары, обновлённые вебхуком после started (момента запроса отчёта),
+        сохраняют свои более свежие остатки.
+
+        Args:
+            rows (list): Отчёт /report/stock/byslot/current (assortmentId, slotId, storeId, stock)
+            started (float): Момент запроса отчёта (time.time())
+
+        Returns:
+            int: Записано строк
+        """
+        items = self._items(rows)
+        with self._connection() as conn:
+            newer = {r[0] for r in conn.execute("SELECT product_id FROM product_updated WHERE at > ?", (started,))}
+            conn.execute("DELETE FROM stock WHERE product_id NOT IN (SELECT product_id FROM product_updated WHERE at > ?)",
+                         (started,))
+            conn.executemany("INSERT OR REPLACE INTO stock (product_id, slot_id, store_id, qty) VALUES (?, ?, ?, ?)",
+                             [item for item in items if item[0] not in newer])
+            conn.execute("DELETE FROM product_updated WHERE at <= ?", (started,))
+            conn.execute("INSERT OR REPLACE INTO mirror_state (key, value) VALUES ('reconciled_at', ?)", (str(started),))
+        return len(items)
+
+    def replace_products(self, product_ids, rows):
+        """
+        Заменяет остатки перечисленных товаров (обновление по вебхуку).
+
+        Args:
+            product_ids (iterable): UUID товаров, остатки которых перечитаны
+            rows (list): Отчёт по ячейкам для этих товаров
+        """
+        product_ids = list(product_ids)
+        now = time.time()
+        with self._connection() as conn:
+            conn.executemany("DELETE FROM stock WHERE product_id = ?", [(pid,) for pid in product_ids])
+            conn.executemany("INSERT OR REPLACE INTO stock (product_id, slot_id, store_id, qty) VALUES (?, ?, ?, ?)",
+                             self._items(rows))
+            conn.executemany("INSERT OR REPLACE INTO product_updated (product_id, at) VALUES (?, ?)",
+                             [(pid, now) for pid in product_ids])
+
+    def rows(self, product_id, store_id=None):
+        """
+        Остатки товара по ячейкам в формате отчёта МойСклад.
+
+        Args:
+            product_id (str): UUID товара
+            store_id (str): UUID склада или None для всех складов
+
+        Returns:
+            list: [{'assortmentId', 'slotId', 'storeId', 'stock'}, ...]
+        """
+        sql = "SELECT slot_id, store_id, qty FROM stock WHERE product_id = ?"
+        params = (product_id,)
+        if store_id:
+            sql += " AND store_id = ?"
+            params = (product_id, store_id)
+        # SQLite хранит остаток как REAL: целые значения возвращаются целыми, как их отдаёт API
+        return [{'assortmentId': product_id, 'slotId': slot_id, 'storeId': store,
+                 'stock': int(qty) if float(qty).is_integer() else qty}
+                for slot_id, store, qty in self._connection().execute(sql, params)]
+
+    def remember_document(self, doc_id, product_ids):
+        """Запоминает состав документа, чтобы обработать его удаление."""
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO documents (id, products) VALUES (?, ?)",
+                         (doc_id, json.dumps(sorted(product_ids))))
+
+    def document_products(self, doc_id):
+        """Запомненный состав документа или None."""
+        row = self._connection().execute("SELECT products FROM documents WHERE id = ?", (doc_id,)).fetchone()
+        return set(json.loads(row[0])) if row else None
+
+    def reconciled_at(self):
+        row = self._connection().execute("SELECT value FROM mirror_state WHERE key = 'reconciled_at'").fetchone()
+        return float(row[0]) if row else None
+
+    def is_fresh(self, max_age):
+        """Была ли полная сверка не раньше max_age секунд назад."""
+        reconciled = self.reconciled_at()
+        return reconciled is not None and time.time() - reconciled <= max_age
+
+
+class StockReconcile(threading.Thread):
+    """
+    Периодическая полная сверка зеркала с отчётом по ячейкам.
+
+    Если сверку недавно выполнил другой процесс с той же базой, она пропускается.
+    request_now() запускает внеочередную сверку.
+
+    Args:
+        mirror (StockMirror): Зеркало остатков
+        fetch_all (callable): fetch_all() -> весь отчёт по ячейкам (список строк)
+        interval (float): Период сверки, секунды
+    """
+
+    def __init__(self, mirror, fetch_all, interval):
+        super().__init__(name="stock-reconcile", daemon=True)
+        self.mirror = mirror
+        self.fetch_all = fetch_all
+        self.interval = interval
+        self._wake = threading.Event()
+
+    def run_once(self, force=False):
+        """Выполняет сверку, если она нужна; возвращает число строк или None."""
+        reconciled = self.mirror.reconciled_at()
+        if not force and reconciled is not None and time.time() - reconciled < self.interval:
+            return None
+        started = time.time()
+        count = self.mirror.replace_all(self.fetch_all(), started)
+        print(f"Зеркало остатков сверено: {count} строк за {time.time() - started:.2f} с", flush=True)
+        return count
+
+    def request_now(self):
+        self._wake.set()
+
+    def run(self):
+        force = False
+        while True:
+            try:
+                self.run_once(force)
+            except Exception as e:
+                print(f"Ошибка сверки зеркала остатков: {e}", flush=True)
+            force = self._wake.wait(self.interval)
+            self._wake.clear()
+
+
+class StockWebhookWorker(threading.Thread):
+    """
+    Обрабатывает события вебхуков в фоне: ответ МойСклад на вебхук должен быть быстрым.
+
+    Ссылка на документ из вебхука становится адресом запроса с токеном API,
+    поэтому принимаются только ссылки на документы этого же API
+    (base_url/entity/<тип>/...): иначе по поддельному вебхуку токен ушёл бы
+    на чужой адрес.
+
+    Args:
+        mirror (StockMirror): Зеркало остатков
+        fetch_positions (callable): fetch_positions(href документа) -> позиции документа
+        fetch_stock (callable): fetch_stock(список UUID товаров) -> отчёт по ячейкам для них
+        reconcile (StockReconcile): Сверка для внеочередного запуска (может быть None)
+        base_url (str): Адрес API МойСклад, которому должны принадлежать ссылки документов
+    """
+
+    def __init__(self, mirror, fetch_positions, fetch_stock, reconcile=None, base_url=""):
+        super().__init__(name="stock-webhooks", daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.mirror = mirror
+        self.fetch_positions = fetch_positions
+        self.fetch_stock = fetch_stock
+        self.reconcile = reconcile
+        self.events = queue.Queue()
+
+    def submit(self, events):
+        """
+        Ставит в очередь события вебхука.
+
+        Args:
+            events (list): Поле events тела вебхука МойСклад
+
+        Returns:
+            int: Принято событий по документам, меняющим остатки (события
+                 с чужими ссылками не принимаются)
+        """
+        accepted = 0
+        for event in events or []:
+            meta = (event.get('meta') or {}) if isinstance(event, dict) else {}
+            href = str(meta.get('href') or '')
+            if meta.get('type') in STOCK_DOCUMENT_TYPES and self.is_document_href(href, meta['type']):
+                self.events.put((href, event.get('action', 'UPDATE')))
+                accepted += 1
+        return accepted
+
+    def is_document_href(self, href, doc_type):
+        """Ссылка ведёт на документ doc_type этого API (base_url/entity/<тип>/<id>)."""
+        prefix = f"{self.base_url}/entity/{doc_type}/"
+        doc_id = href[len(prefix):].split('?', 1)[0] if href.startswith(prefix) else ''
+        return bool(doc_id) and '/' not in doc_id
+
+    def handle(self, href, action):
+        """Перечитывает остатки товаров одного документа."""
+        doc_id = id_from_href(href)
+        products = self.mirror.document_products(doc_id) or set()
+        if action != 'DELETE':
+            current = {id_from_href((p.get('assortment') or {}).get('meta', {}).get('href'))
+                       for p in self.fetch_positions(href)}
+            current.discard('')
+            # Товары, убранные из документа при изменении, тоже перечитываются
+            products |= current
+            self.mirror.remember_document(doc_id, current)
+        elif not products:
+            if self.reconcile is not None:
+                self.reconcile.request_now()
+            return 0
+        if products:
+            self.mirror.replace_products(products, self.fetch_stock(sorted(products)))
+        return len(products)
+
+    def run(self):
+        while True:
+            href, action = self.events.get()
+            try:
+                count = self.handle(href, action)
+                print(f"Вебхук {action} {href}: обновлены остатки {count} товаров", flush=True)
+            except Exception as e:
+                print(f"Ошибка обработки вебхука {href}: {e}", flush=True)
+                if self.reconcile is not None:
+                    self.reconcile.request_now()
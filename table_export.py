@@ -0,0 +1,185 @@
+"""
+Выгрузка отчёта в табличных форматах без оформления: CSV, JSON, Parquet.
+
+Оформленный .xlsx (report_writer.py) нужен людям; интеграциям и архиву
+нужны данные, а форматирование и запись книги openpyxl - самая медленная
+часть отчёта, как и её разбор на стороне получателя. Здесь отчёт пишется
+напрямую из тех же листов {колонка: список значений}, без openpyxl:
+- csv - основной лист, UTF-8 с BOM (открывается в Excel без кракозябр);
+- json - все листы: {"название листа": [{колонка: значение}, ...], ...};
+- parquet - основной лист; нужен pyarrow (или fastparquet), без него
+  write_export выбрасывает ExportError.
+
+Файлы лежат рядом с отчётом: result_<id>.csv, result_<id>.json, ...
+"""
+
+import csv
+import importlib.util
+import json
+import os
+import tempfile
+import time
+
+from openpyxl import load_workbook
+
+from report_writer import STICKER_COLUMN
+
+# Поддерживаемые форматы отчёта; xlsx пишет report_writer
+FORMATS = ('xlsx', 'csv', 'json', 'parquet')
+
+MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(Exception):
+    """Отчёт не удалось записать в запрошенном формате."""
+
+
+def parse_formats(value, default=('xlsx',)):
+    """
+    Разбирает список форматов ("csv,parquet" или список строк).
+
+    Returns:
+        list: Форматы без повторов в порядке FORMATS
+
+    Raises:
+        ExportError: Если формат неизвестен
+    """
+    if not value:
+        return list(default)
+    items = value.split(',') if isinstance(value, str) else value
+    formats = {str(item).strip().lower().lstrip('.') for item in items if str(item).strip()}
+    unknown = formats - set(FORMATS)
+    if unknown:
+        raise ExportError(f"Неизвестный формат: {', '.join(sorted(unknown))} (доступны {', '.join(FORMATS)})")
+    return [fmt for fmt in FORMATS if fmt in formats] or list(default)
+
+
+def export_path(report_path, fmt):
+    """Путь к отчёту в формате fmt рядом с report_path (меняется расширение)."""
+    return os.path.splitext(report_path)[0] + '.' + fmt
+
+
+def parquet_available():
+    return any(importlib.util.find_spec(name) is not None for name in ('pyarrow', 'fastparquet'))
+
+
+def _plain(value):
+    """Значение листа как обычный тип Python: числа numpy - числа, NaN - None."""
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def _write_csv(path, columns):
+    names = list(columns)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for values in zip(*(columns[name] for name in names)):
+            writer.writerow(['' if v is None else v for v in map(_plain, values)])
+
+
+def _write_json(path, sheets):
+    data = {}
+    for title, columns in sheets:
+        names = list(columns)
+        data[title] = [dict(zip(names, map(_plain, values)))
+                       for values in zip(*(columns[name] for name in names))]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+
+
+def _write_parquet(path, columns):
+    if not parquet_available():
+        raise ExportError("Для Parquet нужен pyarrow: pip install pyarrow")
+    import pandas as pd
+
+    frame = {}
+    for name, values in columns.items():
+        values = [_plain(v) for v in values]
+        # В колонке parquet один тип: смешанные значения (числа и текст) пишутся текстом
+        kinds = {type(v) for v in values if v is not None}
+        if len(kinds) > 1 and not kinds <= {int, float}:
+            values = [None if v is None else str(v) for v in values]
+        frame[name] = values
+    pd.DataFrame(frame).to_parquet(path, index=False)
+
+
+def write_export(report_path, sheets, fmt):
+    """
+    Записывает отчёт в формате fmt рядом с report_path.
+
+    Файл пишется во временный с уникальным именем и подменяется, чтобы
+    получатель не прочитал недописанный отчёт, а одновременные выгрузки
+    одного отчёта не писали в один временный файл.
+
+    Args:
+        report_path (str): Путь к отчёту .xlsx (определяет имя файла)
+        sheets (list): Листы - кортежи (название, {колонка: список значений}); первый - основной
+        fmt (str): 'csv', 'json' или 'parquet'
+
+    Returns:
+        tuple: (путь к файлу, секунды)
+
+    Raises:
+        ExportError: Если формат не поддерживается или файл не удалось записать
+    """
+    started = time.perf_counter()
+    path = export_path(report_path, fmt)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+                                    prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        if fmt == 'csv':
+            _write_csv(tmp_path, sheets[0][1])
+        elif fmt == 'json':
+            _write_json(tmp_path, sheets)
+        elif fmt == 'parquet':
+            _write_parquet(tmp_path, sheets[0][1])
+        else:
+            raise ExportError(f"Формат {fmt} не выгружается из листов отчёта")
+        # mkstemp создаёт файл с правами 0600, выгрузка читается как обычный отчёт
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except ExportError:
+        raise
+    except Exception as e:
+        raise ExportError(f"Не удалось записать {path}: {e}") from e
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return path, time.perf_counter() - started
+
+
+def read_report_sheets(report_path):
+    """
+    Читает листы готового отчёта .xlsx (для выгрузки старых отчётов в другом формате).
+
+    Returns:
+        list: Листы - кортежи (название, {колонка: список значений})
+    """
+    wb = load_workbook(report_path, read_only=True)
+    try:
+        sheets = []
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(values_only=True)
+            names = [str(name) if name is not None else '' for name in next(rows, ())]
+            columns = {name: [] for name in names}
+            for row in rows:
+                for i, name in enumerate(names):
+                    columns[name].append(row[i] if i < len(row) else None)
+            if STICKER_COLUMN in columns:
+                # В .xlsx перед последними 4 символами стикера добавлен пробел (format_sticker_cell)
+                columns[STICKER_COLUMN] = ["".join(v.split()) if isinstance(v, str) else v
+                                           for v in columns[STICKER_COLUMN]]
+            sheets.append((ws.title, columns))
+        return sheets
+    finally:
+        wb.close()
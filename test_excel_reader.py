@@ -0,0 +1,94 @@
+"""
+Тесты чтения выгрузок (excel_reader.py): все способы чтения дают ту же
+таблицу, что pd.read_excel.
+
+Запуск: python -m pytest -q test_excel_reader.py
+"""
+
+from datetime import date, datetime
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+from excel_reader import available_readers, choose_reader, read_table
+
+EXCEL_READERS = available_readers()
+
+# Колонки выгрузки: (заголовок, значения); None - пустая ячейка
+COLUMNS = [
+    ('№ Стикера', ['1234567890', '*', None, '55', '12']),
+    ('Артикул', ['N317-12', 12345, 'С317', None, 987.0]),
+    ('Количество', [1, 2, None, 4, 5]),
+    ('Цена', [10.5, 3, 7.25, None, 0]),
+    ('Дата заказа', [date(2024, 1, 5), datetime(2024, 1, 6, 12, 30), None, date(2024, 2, 1), None]),
+    ('Ошибка', ['#N/A', 'ok', '#DIV/0!', None, 'x']),
+]
+
+
+@pytest.fixture
+def orders_xlsx(tmp_path):
+    """Выгрузка со смешанными типами, пустыми ячейками и пустыми строками в конце."""
+    wb = Workbook()
+    ws = wb.active
+    ws.append([name for name, _ in COLUMNS])
+    for row in zip(*(values for _, values in COLUMNS)):
+        ws.append(list(row))
+    for column in ws.iter_cols(min_row=2, min_col=5, max_col=5):
+        for cell in column:
+            if isinstance(cell.value, datetime) and cell.value.hour == 0:
+                cell.number_format = 'DD.MM.YYYY'
+    ws.append([])
+    ws.append([])
+    path = tmp_path / 'orders.xlsx'
+    wb.save(path)
+    return str(path)
+
+
+@pytest.mark.parametrize('reader', EXCEL_READERS)
+@pytest.mark.parametrize('dtype', [None, str])
+def test_read_table_matches_pandas(orders_xlsx, reader, dtype):
+    expected = pd.read_excel(orders_xlsx, dtype=dtype)
+    actual = read_table(orders_xlsx, dtype=dtype, reader=reader)
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+@pytest.mark.parametrize('reader', EXCEL_READERS)
+def test_read_table_header_only(tmp_path, reader):
+    wb = Workbook()
+    wb.active.append(['Артикул', 'Количество'])
+    path = tmp_path / 'empty.xlsx'
+    wb.save(path)
+    pd.testing.assert_frame_equal(read_table(str(path), reader=reader), pd.read_excel(path))
+
+
+@pytest.mark.parametrize('content, encoding', [
+    ('Артикул;Количество\nN1;2\nN2;3\n', 'utf-8-sig'),
+    ('Артикул;Количество\nN1;2\nN2;3\n', 'cp1251'),
+    ('Артикул,Количество\nN1,2\nN2,3\n', 'utf-8'),
+    ('Артикул\tКоличество\nN1\t2\nN2\t3\n', 'utf-8'),
+])
+def test_read_table_csv(tmp_path, content, encoding):
+    path = tmp_path / 'orders.csv'
+    path.write_bytes(content.encode(encoding))
+    df = read_table(str(path))
+    assert list(df.columns) == ['Артикул', 'Количество']
+    assert df['Артикул'].tolist() == ['N1', 'N2']
+    assert df['Количество'].tolist() == [2, 3]
+
+
+@pytest.mark.parametrize('path, reader, expected', [
+    ('a.csv', 'openpyxl', 'csv'),
+    ('a.TXT', None, 'csv'),
+    ('a.xlsx', 'openpyxl', 'openpyxl'),
+    ('a.xlsx', 'pandas', 'pandas'),
+    ('a.xlsx', 'auto', EXCEL_READERS[0]),
+])
+def test_choose_reader(path, reader, expected):
+    assert choose_reader(path, reader) == expected
+
+
+@pytest.mark.parametrize('reader', ['csv', 'xlrd'])
+def test_choose_reader_unknown(reader):
+    with pytest.raises(ValueError):
+        choose_reader('a.xlsx', reader)
@@ -0,0 +1,103 @@
+"""
+Тесты нормализации артикулов (normalize.py).
+
+Запуск: python -m pytest -q test_normalize.py
+"""
+
+import pandas as pd
+import pytest
+
+from normalize import (SKIP_EMPTY, SKIP_JUNK, lookalike_variant, mark_skipped, normalize_articles,
+                       normalize_one)
+
+
+@pytest.mark.parametrize('value, expected, reason', [
+    # Числа из Excel: без '.0'
+    (12345.0, '12345', None),
+    (12345, '12345', None),
+    (1.5, '1.5', None),
+    # Невидимые символы, неразрывные пробелы, длинные тире
+    ('\u00a0 N317-12 ', 'N317-12', None),
+    ('N317\u200b-12', 'N317-12', None),
+    ('N317\u201412', 'N317-12', None),
+    ('N317 \u2013 12', 'N317-12', None),
+    ('N317\u00ad-12', 'N317-12', None),
+    # Полноширинные символы (NFKC)
+    ('\uff2e317', 'N317', None),
+    # Кириллица среди латиницы - двойники заменяются
+    ('С317-N', 'C317-N', None),
+    ('NАВ-1', 'NAB-1', None),
+    # Полностью кириллические артикулы не меняются
+    ('КОТ', 'КОТ', None),
+    ('СМ-500', 'СМ-500', None),
+    ('С317', 'С317', None),
+    ('ЖУК-1', 'ЖУК-1', None),
+    # Мусор и пустые значения
+    (None, '', SKIP_EMPTY),
+    (float('nan'), '', SKIP_EMPTY),
+    ('   ', '', SKIP_EMPTY),
+    ('nan', '', SKIP_JUNK),
+    ('-', '', SKIP_JUNK),
+    ('\u2014', '', SKIP_JUNK),
+    ('N/A', '', SKIP_JUNK),
+    ('Артикул', '', SKIP_JUNK),
+    ('0', '', SKIP_JUNK),
+])
+def test_normalize_articles(value, expected, reason):
+    articles, reasons = normalize_articles(pd.Series([value], dtype=object))
+    assert articles.iloc[0] == expected
+    assert reasons.iloc[0] == reason
+
+
+@pytest.mark.parametrize('values, expected', [
+    # float-колонка с пустыми ячейками
+    ([1.0, None, 3.0], ['1', '', '3']),
+    # int-колонка
+    ([7, 8], ['7', '8']),
+    # Смешанная колонка: числа и текст
+    ([100.0, 'N1', None], ['100', 'N1', '']),
+])
+def test_normalize_articles_column_types(values, expected):
+    series = pd.Series(values)
+    articles, _ = normalize_articles(series)
+    assert articles.tolist() == expected
+    assert articles.index.equals(series.index)
+
+
+@pytest.mark.parametrize('article, expected', [
+    ('КОТ', 'KOT'),
+    ('СМ-500', 'CM-500'),
+    ('ср-1', 'cp-1'),
+    # Есть латиница, нет кириллицы или есть буквы без двойника - варианта нет
+    ('C317', None),
+    ('С317N', None),
+    ('12345', None),
+    ('ЖУК', None),
+])
+def test_lookalike_variant(article, expected):
+    assert lookalike_variant(article) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    (' С317-N ', 'C317-N'),
+    ('КОТ', 'КОТ'),
+    ('-', ''),
+])
+def test_normalize_one(value, expected):
+    assert normalize_one(value) == expected
+
+
+def test_mark_skipped():
+    rows = [
+        {'sticker': '1', 'quantity': 1},
+        {'sticker': '2', 'quantity': 2},
+        {'sticker': '*', 'quantity': 0},
+        {'sticker': '3', 'quantity': 1},
+    ]
+    raw = ['N1', None, None, '-']
+    articles, reasons = normalize_articles(pd.Series(raw, dtype=object))
+    assert mark_skipped(rows, articles, reasons, raw, first_line=2) == 2
+    assert [row['article'] for row in rows] == ['N1', '', '', '']
+    assert [row.get('skipped') for row in rows] == [None, SKIP_EMPTY, None, SKIP_JUNK]
+    assert [row.get('line') for row in rows] == [None, 3, None, 5]
+    assert rows[3]['raw_article'] == '-'
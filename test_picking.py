@@ -0,0 +1,88 @@
+"""
+Тесты распределения сборки по ячейкам (picking.py).
+
+Запуск: python -m pytest -q test_picking.py
+"""
+
+import pytest
+
+from picking import allocate_slots, build_slot_order, choose_slots
+
+SLOT_NAMES = {'a': 'A-01', 'b': 'A-02', 'c': 'B-01', 'd': 'B-02'}
+SLOT_ORDER = build_slot_order(SLOT_NAMES)
+
+
+@pytest.mark.parametrize('slots, demand, expected', [
+    # Одна ячейка покрывает спрос целиком
+    ([('a', 5), ('b', 3), ('c', 2)], 5, [('a', 5)]),
+    ([('a', 5), ('b', 3), ('c', 2)], 3, [('b', 3)]),
+    # Меньшая ячейка опустошается, крупная используется частично
+    ([('a', 5), ('b', 3), ('c', 2)], 4, [('a', 5)]),
+    ([('a', 5), ('b', 3), ('c', 2)], 6, [('c', 2), ('a', 5)]),
+    ([('a', 5), ('b', 3), ('c', 2)], 8, [('b', 3), ('a', 5)]),
+    # Нехватка: берутся все ячейки
+    ([('a', 5), ('b', 3), ('c', 2)], 20, [('c', 2), ('b', 3), ('a', 5)]),
+    ([('a', 5), ('b', 3), ('c', 2)], 10, [('c', 2), ('b', 3), ('a', 5)]),
+    # Пустые ячейки не выбираются
+    ([('a', 0), ('b', 4)], 2, [('b', 4)]),
+    ([], 3, []),
+    # Одинаковые ячейки - в порядке обхода
+    ([('d', 2), ('a', 2)], 2, [('a', 2)]),
+])
+def test_choose_slots(slots, demand, expected):
+    assert choose_slots(slots, demand, SLOT_ORDER) == expected
+
+
+def _item(article, quantity, slots):
+    return {'article': article, 'quantity': quantity, 'slots': slots}
+
+
+@pytest.mark.parametrize('items, expected', [
+    # Точный набор
+    ([_item('X', 5, [('a', 5), ('b', 3)])],
+     [([('a', 5)], 0, None)]),
+    # Нехватка
+    ([_item('X', 10, [('a', 5), ('b', 3)])],
+     [([('b', 3), ('a', 5)], 2, None)]),
+    # Строки одного артикула делят остаток: вторая получает то, что осталось
+    ([_item('X', 3, [('a', 5)]), _item('X', 4, [('a', 5)])],
+     [([('a', 3)], 0, None), ([('a', 2)], 2, None)]),
+    ([_item('X', 2, [('a', 5), ('c', 2)]), _item('X', 4, [('a', 5), ('c', 2)])],
+     [([('c', 2)], 0, None), ([('a', 4)], 0, None)]),
+    # Разные артикулы не конкурируют
+    ([_item('X', 5, [('a', 5)]), _item('Y', 5, [('b', 5)])],
+     [([('a', 5)], 0, None), ([('b', 5)], 0, None)]),
+    # Количество из выгрузки: строка, пустое, дробное
+    ([_item('X', '2', [('a', 5)]), _item('X', None, [('a', 5)]), _item('X', 1.4, [('a', 5)])],
+     [([('a', 2)], 0, None), ([], 0, None), ([('a', 1)], 0, None)]),
+    # Ненайденный товар - вся строка в нехватке
+    ([_item('', 3, [])],
+     [([], 3, None)]),
+])
+def test_allocate_slots_single_store(items, expected):
+    assert allocate_slots(items, SLOT_ORDER) == expected
+
+
+SLOT_STORE = {'a': 'main', 'b': 'main', 'c': 'extra', 'd': 'extra'}
+STORE_ORDER = ['main', 'extra']
+
+
+@pytest.mark.parametrize('items, expected', [
+    # Основной склад может собрать строку
+    ([_item('X', 3, [('a', 3), ('c', 9)])],
+     [([('a', 3)], 0, 'main')]),
+    # Основному не хватает - первый склад, где хватает на всю строку
+    ([_item('X', 4, [('a', 3), ('c', 9)])],
+     [([('c', 4)], 0, 'extra')]),
+    # Нигде не хватает - склад с наибольшим остатком, остальное в нехватке
+    ([_item('X', 12, [('a', 3), ('c', 9)])],
+     [([('c', 9)], 3, 'extra')]),
+    # Вторая строка уходит на другой склад, когда основной опустел
+    ([_item('X', 3, [('a', 3), ('c', 9)]), _item('X', 2, [('a', 3), ('c', 9)])],
+     [([('a', 3)], 0, 'main'), ([('c', 2)], 0, 'extra')]),
+    # Товара нет ни на одном складе
+    ([_item('X', 2, [])],
+     [([], 2, None)]),
+])
+def test_allocate_slots_multi_store(items, expected):
+    assert allocate_slots(items, SLOT_ORDER, SLOT_STORE, STORE_ORDER) == expected
@@ -0,0 +1,108 @@
+"""
+Тесты распределения заданий печати по ферме (printer_farm.py).
+
+Запуск: python -m pytest -q test_printer_farm.py
+"""
+
+import random
+
+import pytest
+
+from printer_farm import Job, is_compatible, schedule_jobs
+
+
+def _job(minutes, nozzle=None, material=None, color=None, article='A'):
+    return Job(article, f'{article}.gcode', minutes, nozzle, material, color)
+
+
+def _printer(name, nozzle=None, material=None, color=None):
+    return {'name': name, 'nozzle': nozzle, 'material': material, 'color': color}
+
+
+@pytest.mark.parametrize('job, printer, expected', [
+    (_job(10), _printer('P'), True),
+    (_job(10, nozzle=0.4), _printer('P', nozzle=0.4), True),
+    (_job(10, nozzle=0.4), _printer('P', nozzle=0.6), False),
+    (_job(10, nozzle=0.4), _printer('P'), True),
+    (_job(10), _printer('P', nozzle=0.6, material=38077, color='black'), True),
+    (_job(10, material=38077), _printer('P', material=38078), False),
+    (_job(10, color='white'), _printer('P', color='black'), False),
+    (_job(10, material=38077, color='black'), _printer('P', material=38077, color='black'), True),
+])
+def test_is_compatible(job, printer, expected):
+    assert is_compatible(job, printer) is expected
+
+
+@pytest.mark.parametrize('jobs, printers, loads, unscheduled', [
+    # LPT на однородной ферме: 7, 5, 4, 3, 1 на двух принтерах
+    ([_job(m) for m in (3, 7, 1, 5, 4)],
+     [_printer('P1'), _printer('P2')],
+     {'P1': 10, 'P2': 10}, 0),
+    # Заданий меньше, чем принтеров
+    ([_job(30)],
+     [_printer('P1'), _printer('P2'), _printer('P3')],
+     {'P1': 30, 'P2': 0, 'P3': 0}, 0),
+    # Несовместимое задание не назначается
+    ([_job(20, nozzle=0.8), _job(10)],
+     [_printer('P1', nozzle=0.4), _printer('P2', nozzle=0.4)],
+     {'P1': 10, 'P2': 0}, 1),
+    # Загрузка P2 от задания другого ключа учитывается в куче ключа без требований
+    ([_job(10, nozzle=0.6), _job(6), _job(6)],
+     [_printer('P1', nozzle=0.4), _printer('P2', nozzle=0.6)],
+     {'P1': 12, 'P2': 10}, 0),
+    # Задания одного цвета идут только на свой принтер
+    ([_job(5, color='white'), _job(5, color='white'), _job(4, color='black')],
+     [_printer('P1', color='white'), _printer('P2', color='black')],
+     {'P1': 10, 'P2': 4}, 0),
+    # Нет принтеров
+    ([_job(5)], [], {}, 1),
+])
+def test_schedule_jobs_loads(jobs, printers, loads, unscheduled):
+    result = schedule_jobs(jobs, printers)
+    assert result['loads'] == loads
+    assert result['makespan'] == max(loads.values(), default=0)
+    assert len(result['unscheduled']) == unscheduled
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_schedule_jobs_no_overlap(seed):
+    """Очередь каждого принтера непрерывна, задание назначено ровно один раз."""
+    rnd = random.Random(seed)
+    printers = [_printer(f'P{i}', nozzle=rnd.choice((0.4, 0.6, None))) for i in range(6)]
+    jobs = [_job(rnd.randint(1, 300), nozzle=rnd.choice((0.4, 0.6, None)), article=f'A{i}')
+            for i in range(200)]
+
+    result = schedule_jobs(jobs, printers)
+
+    scheduled = []
+    for printer in printers:
+        queue = result['queues'][printer['name']]
+        end = 0
+        for job, start, finish in queue:
+            assert start == end
+            assert finish == start + job.minutes
+            assert is_compatible(job, printer)
+            end = finish
+        assert result['loads'][printer['name']] == end
+        scheduled.extend(job.article for job, _, _ in queue)
+    unscheduled = [job.article for job in result['unscheduled']]
+    assert sorted(scheduled + unscheduled) == sorted(job.article for job in jobs)
+
+
+def test_schedule_jobs_lpt_bound():
+    """Однородная ферма: время завершения не больше средней загрузки плюс самое длинное задание."""
+    rnd = random.Random(42)
+    jobs = [_job(rnd.randint(5, 240)) for _ in range(500)]
+    printers = [_printer(f'P{i}') for i in range(8)]
+    result = schedule_jobs(jobs, printers)
+    total = sum(job.minutes for job in jobs)
+    assert result['makespan'] <= total / len(printers) + max(job.minutes for job in jobs)
+    assert sum(result['loads'].values()) == total
+
+
+def test_schedule_jobs_material_warning():
+    jobs = [_job(10, material=38077)]
+    printers = [_printer('P1', material='PLA'), _printer('P2', material=38077)]
+    result = schedule_jobs(jobs, printers)
+    assert result['loads'] == {'P1': 0, 'P2': 10}
+    assert len(result['warnings']) == 1 and result['warnings'][0].startswith('P1:')
@@ -1,5 +1,6 @@
 import pandas as pd
 import time
+from copy import copy
 from openpyxl import load_workbook
 from openpyxl.styles import Border, Side, Font
 
@@ -32,11 +33,18 @@ def save_workbook_with_retries(wb, filename, retries=5, delay=3):
             time.sleep(delay)
     return False
 
-def format_sticker_cell(cell):
-    """Отформатировать ячейку '№ Стикера': последние 4 символа — жирные + размер шрифта +1."""
+def format_sticker_cell(cell, style=None):
+    """Отформатировать ячейку '№ Стикера': пробел перед последними 4 символами, жирный шрифт + размер +1 ('*' — только шрифт).
+    style — готовый стиль (_style) уже выделенной ячейки: копируется вместо пересчёта шрифта (быстрее на тысячах строк).
+    Возвращает True, если ячейка выделена."""
     value = str(cell.value or "")
-    if len(value) < 4:
-        return
-    main, last4 = value[:-4].rstrip(), value[-4:]
-    cell.value = f"{main} {last4}"
-    cell.font = cell.font.copy(bold=True, size=cell.font.size + 1)
+    if value != "*":
+        if len(value) < 4:
+            return False
+        main, last4 = value[:-4].rstrip(), value[-4:]
+        cell.value = f"{main} {last4}"
+    if style is not None:
+        cell._style = copy(style)
+    else:
+        cell.font = cell.font.copy(bold=True, size=cell.font.size + 1)
+    return True